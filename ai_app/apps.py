@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def purge_stale_document_cache(sender, **kwargs):
+    """After a deploy's migrate, drop cached results made with an old prompt or schema."""
+    from .services import invalidate_document_cache
+    invalidate_document_cache()
 
 
 class AiAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ai_app'
+
+    def ready(self):
+        post_migrate.connect(purge_stale_document_cache, sender=self)
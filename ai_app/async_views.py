@@ -0,0 +1,138 @@
+# ai_app/async_views.py
+#
+# Async (ASGI-native) versions of the AI endpoints in views.py. While the
+# model is generating, these views await the async Gemini client instead of
+# holding a worker thread, so one event loop can keep many calls in flight.
+# Request validation and response shapes match the DRF views exactly, except
+# for study_tools (see its docstring).
+
+import json
+from functools import wraps
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authentication import CSRFCheck
+
+from .serializers import (
+    ChatRequestSerializer, ChatResponseSerializer,
+    MoodRequestSerializer, MoodResponseSerializer,
+    StudyToolResponseSerializer
+)
+from .services import GeminiAIService
+from .utils import aextract_text_from_pdf
+from .views import build_chat_prompt
+
+
+def _request_data(request):
+    """Parses a JSON or form-encoded body, like DRF's `request.data`."""
+    if request.content_type == 'application/json':
+        return json.loads(request.body or b'{}')
+    return request.POST
+
+
+def async_api_view(view):
+    """
+    Gives an async view the same request handling as a DRF `APIView`:
+    POST only, CSRF enforced for session-authenticated users only, and
+    malformed JSON reported as a 400.
+    """
+
+    @csrf_exempt
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+        user = await request.auser()
+        if user.is_authenticated:
+            check = CSRFCheck(lambda r: None)
+            check.process_request(request)
+            reason = check.process_view(request, None, (), {})
+            if reason:
+                return JsonResponse({'detail': f'CSRF Failed: {reason}'}, status=403)
+
+        try:
+            return await view(request, *args, **kwargs)
+        except json.JSONDecodeError as e:
+            return JsonResponse({'detail': f'JSON parse error - {e}'}, status=400)
+
+    return wrapper
+
+
+@async_api_view
+async def ai_chat(request):
+    """Async AI Assistant chat endpoint (same contract as `AIChatView`)."""
+    serializer = ChatRequestSerializer(data=_request_data(request))
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    try:
+        ai_service = GeminiAIService()
+        system_prompt = build_chat_prompt(serializer.validated_data['message'])
+        ai_response = await ai_service.aget_ai_chat_response(system_prompt)
+
+        return JsonResponse(ChatResponseSerializer({'response': ai_response}).data)
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=500)
+    except Exception as e:
+        return JsonResponse({"error": "An error occurred while fetching AI response."}, status=500)
+
+
+@async_api_view
+async def mood_log(request):
+    """Async mood suggestion endpoint (same contract as `MoodLogView`)."""
+    serializer = MoodRequestSerializer(data=_request_data(request))
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    try:
+        ai_service = GeminiAIService()
+        mood_code = serializer.validated_data['mood']
+        notes = serializer.validated_data.get('notes', '')
+
+        suggestion = await ai_service.aget_mood_suggestion(mood_code, notes)
+
+        return JsonResponse(MoodResponseSerializer({'mood': mood_code, 'ai_suggestion': suggestion}).data)
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=500)
+    except Exception as e:
+        return JsonResponse({"error": "An error occurred while processing mood log."}, status=500)
+
+
+@async_api_view
+async def study_tools(request):
+    """
+    Async PDF summary/flashcards endpoint. Unlike `StudyToolsView`, which
+    queues a StudyJob and answers 202, this one extracts the text and calls
+    Gemini inline and answers 200 with the result (the
+    StudyToolResponseSerializer shape): waiting on the model costs no
+    worker thread here, so there is no job to poll.
+    """
+    if 'pdf_file' not in request.FILES:
+        return JsonResponse({"error": "No PDF file uploaded."}, status=400)
+
+    pdf_file = request.FILES['pdf_file']
+    title = pdf_file.name
+
+    text_content = await aextract_text_from_pdf(pdf_file)
+
+    if not text_content:
+        return JsonResponse(
+            {"error": "Could not extract text from the PDF file. Check if it's a valid text-based PDF."},
+            status=400)
+
+    try:
+        ai_service = GeminiAIService()
+        processed_data = await ai_service.aprocess_document(text_content, title)
+
+        if 'error' in processed_data:
+            return JsonResponse({"error": processed_data['error']}, status=500)
+
+        return JsonResponse(StudyToolResponseSerializer(processed_data).data)
+
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=500)
+    except Exception as e:
+        return JsonResponse({"error": "An error occurred during AI document processing."}, status=500)
@@ -0,0 +1,122 @@
+# ai_app/benchmarking.py
+#
+# Shared pieces of the PDF benchmark commands: a synthetic PDF/corpus
+# generator and peak-memory helpers, plus the PDF fixture the tests build.
+# Nothing here runs in production.
+
+import os
+import random
+import resource
+from typing import NamedTuple
+
+import fitz
+
+MB = 1024 * 1024
+
+_WORDS = (
+    "the cell membrane controls what enters and leaves while mitochondria produce energy as ATP "
+    "enzymes speed up reactions by lowering activation energy and photosynthesis stores light "
+    "as chemical energy in glucose which respiration later releases for growth and repair"
+).split()
+
+
+def synthetic_pdf(pages: int, words_per_page: int, padding_bytes: int = 0, images_per_page: int = 0,
+                  image_px: int = 256, seed: int = 0) -> bytes:
+    """
+    A PDF with `pages` pages of filler prose, `words_per_page` words each.
+
+    `images_per_page` noise images (incompressible, like scanned photos) of
+    `image_px` square pixels are placed under the text of every page.
+    `padding_bytes` of random data are attached to reach a given file size
+    without changing the text the parser has to produce.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        for slot in range(images_per_page):
+            pixmap = fitz.Pixmap(fitz.csRGB, image_px, image_px, rng.randbytes(image_px * image_px * 3), 0)
+            top = 420 + slot * 40
+            page.insert_image(fitz.Rect(36 + slot * 40, top, 236 + slot * 40, top + 200),
+                              stream=pixmap.tobytes('jpg', jpg_quality=80))
+        body = f"Page {number + 1}\n" + " ".join(rng.choices(_WORDS, k=words_per_page))
+        page.insert_textbox(fitz.Rect(36, 36, 560, 800), body, fontsize=6)
+    if padding_bytes:
+        doc.embfile_add("padding.bin", os.urandom(padding_bytes))
+    data = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return data
+
+
+def make_pdf(pages) -> bytes:
+    """A PDF with one page per string in `pages`, holding exactly that text (the tests' fixture)."""
+    doc = fitz.open()
+    for text in pages:
+        doc.new_page().insert_textbox(fitz.Rect(36, 36, 560, 800), text, fontsize=8)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+class CorpusDocument(NamedTuple):
+    name: str
+    pages: int
+    words_per_page: int
+    images_per_page: int = 0
+
+
+# Shapes seen in uploads: short handouts, long text-only readers, slide decks
+# (sparse text, many images) and scanned-looking chapters (dense text and images)
+DEFAULT_CORPUS = (
+    CorpusDocument('handout', pages=4, words_per_page=350),
+    CorpusDocument('reader', pages=120, words_per_page=600),
+    CorpusDocument('slides', pages=40, words_per_page=60, images_per_page=2),
+    CorpusDocument('chapter', pages=60, words_per_page=450, images_per_page=1),
+)
+
+
+def generate_corpus(directory: str, documents=DEFAULT_CORPUS, scale: float = 1.0) -> list:
+    """
+    Writes the corpus as PDF files into `directory` (reusing files already
+    there, since generation is deterministic) and returns their paths.
+    `scale` multiplies every page count.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for number, spec in enumerate(documents):
+        pages = max(1, round(spec.pages * scale))
+        path = os.path.join(directory, f"{spec.name}-{pages}p-{spec.words_per_page}w-{spec.images_per_page}i.pdf")
+        if not os.path.exists(path):
+            data = synthetic_pdf(pages, spec.words_per_page, images_per_page=spec.images_per_page, seed=number)
+            with open(path, 'wb') as handle:
+                handle.write(data)
+        paths.append(path)
+    return paths
+
+
+# --- Memory ---
+
+def rss() -> int:
+    """Current resident set size in bytes."""
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def reset_peak_rss():
+    """Resets the kernel's high-water mark (Linux), so the peak covers only what follows."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss() -> int:
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
@@ -0,0 +1,145 @@
+# ai_app/cache.py
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DatabaseError
+
+
+def fingerprint(model: str, schema: dict, instruction: str = "") -> str:
+    """
+    Hashes everything about a request except the document itself.
+
+    Changing the model, the response schema or the prompt changes the
+    fingerprint, so results produced under the old settings stop matching.
+    """
+    payload = json.dumps({'model': model, 'schema': schema, 'instruction': instruction}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def content_key(text: str, request_fingerprint: str) -> str:
+    """Content-addressed key: the document text plus the request fingerprint."""
+    digest = hashlib.sha256(request_fingerprint.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class DocumentResultCache:
+    """
+    Two-tier cache for processed documents (summary + flashcards).
+
+    Tier 1 is an in-process LRU bounded by the encoded size of its values.
+    Tier 2 is the `DocumentResultCacheEntry` table, which survives restarts
+    and is shared by every worker. A tier-2 hit is promoted into tier 1.
+    """
+
+    def __init__(self, max_bytes: int = None):
+        if max_bytes is None:
+            max_bytes = getattr(settings, 'AI_DOCUMENT_CACHE_MAX_BYTES', 16 * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._size = 0
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, key: str, value: dict):
+        """Stores a value in the LRU tier, evicting the oldest entries to fit."""
+        size = len(json.dumps(value).encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._size += size
+
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+    def get(self, key: str):
+        """Returns the cached result for `key`, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        from .models import DocumentResultCacheEntry
+
+        try:
+            row = DocumentResultCacheEntry.objects.filter(key=key).values_list('result', flat=True).first()
+        except DatabaseError as e:
+            print(f"Document cache lookup failed: {e}")
+            row = None
+
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.db_hits += 1
+        self._remember(key, row)
+        return row
+
+    def set(self, key: str, value: dict, request_fingerprint: str = ""):
+        """Stores a result in both tiers."""
+        from .models import DocumentResultCacheEntry
+
+        self._remember(key, value)
+        try:
+            DocumentResultCacheEntry.objects.update_or_create(
+                key=key,
+                defaults={'fingerprint': request_fingerprint, 'result': value},
+            )
+        except DatabaseError as e:
+            print(f"Document cache write failed: {e}")
+
+    def invalidate(self, keep_fingerprint: str = None) -> int:
+        """
+        Invalidation hook for prompt/schema changes.
+
+        Clears the in-process tier and deletes persisted results. When
+        `keep_fingerprint` is given, rows produced under that (current)
+        fingerprint are kept and only stale ones are removed.
+        Returns the number of deleted rows.
+        """
+        from .models import DocumentResultCacheEntry
+
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+        rows = DocumentResultCacheEntry.objects.all()
+        if keep_fingerprint:
+            rows = rows.exclude(fingerprint=keep_fingerprint)
+        deleted, _ = rows.delete()
+        return deleted
+
+    def stats(self) -> dict:
+        """Returns hit/miss/eviction counters and the current LRU footprint."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
+
+
+# One cache per worker process; the DB tier is shared between them.
+document_cache = DocumentResultCache()
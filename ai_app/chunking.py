@@ -0,0 +1,104 @@
+# ai_app/chunking.py
+
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+# Extractors separate pages with a form feed (the same convention as pdftotext)
+PAGE_BREAK = "\f"
+
+# Blank lines, or a line that looks like a numbered/upper-case heading, start a new section
+_SECTION_BREAK = re.compile(r"\n\s*\n|\n(?=(?:\d+(?:\.\d+)*\.?|[A-Z][A-Z0-9 ,:-]{3,})\s*\n)")
+
+
+def chunk_chars() -> int:
+    return getattr(settings, 'AI_DOCUMENT_CHUNK_CHARS', 20000)
+
+
+def chunk_workers() -> int:
+    return getattr(settings, 'AI_DOCUMENT_CHUNK_WORKERS', 4)
+
+
+def _hard_split(text: str, max_chars: int):
+    """Splits an oversized block at whitespace so no piece exceeds max_chars."""
+    while len(text) > max_chars:
+        cut = text.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        yield text[:cut]
+        text = text[cut:].lstrip()
+    if text:
+        yield text
+
+
+def _units(text: str, max_chars: int):
+    """Yields page-sized (or smaller) pieces, preferring page then section boundaries."""
+    for page in text.split(PAGE_BREAK):
+        if len(page) <= max_chars:
+            yield page
+            continue
+        for section in _SECTION_BREAK.split(page):
+            yield from _hard_split(section, max_chars)
+
+
+def split_document(text: str, max_chars: int = None) -> list:
+    """
+    Splits extracted document text into chunks of at most `max_chars`.
+
+    Whole pages are packed together while they fit; a page that is too big
+    on its own is split on section boundaries, and only as a last resort
+    in the middle of a section.
+    """
+    max_chars = max_chars or chunk_chars()
+    chunks, current = [], ""
+
+    for unit in _units(text, max_chars):
+        if not unit.strip():
+            continue
+        if current and len(current) + len(unit) + 1 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{unit}" if current else unit
+
+    if current.strip():
+        chunks.append(current)
+    return chunks or [text]
+
+
+def map_chunks(func, chunks: list, max_workers: int = None) -> list:
+    """Runs `func` over every chunk on a bounded thread pool; results keep chunk order."""
+    if len(chunks) == 1:
+        return [func(chunks[0])]
+    with ThreadPoolExecutor(max_workers=max_workers or chunk_workers()) as pool:
+        return list(pool.map(func, chunks))
+
+
+async def amap_chunks(func, chunks: list, max_workers: int = None) -> list:
+    """Async counterpart of `map_chunks`: at most `max_workers` coroutines in flight."""
+    semaphore = asyncio.Semaphore(max_workers or chunk_workers())
+
+    async def run(chunk):
+        async with semaphore:
+            return await func(chunk)
+
+    return list(await asyncio.gather(*(run(chunk) for chunk in chunks)))
+
+
+def _card_key(text: str) -> str:
+    return re.sub(r"[\W_]+", " ", text).strip().casefold()
+
+
+def dedupe_cards(cards: list, field: str, limit: int = None) -> list:
+    """Drops cards whose `field` (e.g. the question) repeats an earlier one, ignoring case and punctuation."""
+    seen, unique = set(), []
+    for card in cards:
+        key = _card_key(str(card.get(field, "")))
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        unique.append(card)
+        if limit and len(unique) >= limit:
+            break
+    return unique
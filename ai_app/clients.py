@@ -0,0 +1,93 @@
+# ai_app/clients.py
+
+import os
+import threading
+
+import httpx
+from django.conf import settings
+from google import genai
+from google.genai import types
+
+
+class GeminiClientRegistry:
+    """
+    Process-wide registry of Gemini clients, keyed by API key.
+
+    A `genai.Client` owns an httpx connection pool, so building a new one per
+    request throws away the warm keep-alive connections and pays for a fresh
+    TLS handshake before the first token. Every view and service method draws
+    its client from here instead. Hit/miss counters make the saving visible.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _build_client(self, api_key: str) -> genai.Client:
+        """Creates a client whose sync and async transports keep connections alive."""
+        limits = httpx.Limits(
+            max_connections=getattr(settings, 'GEMINI_MAX_CONNECTIONS', 20),
+            max_keepalive_connections=getattr(settings, 'GEMINI_MAX_KEEPALIVE_CONNECTIONS', 10),
+            keepalive_expiry=getattr(settings, 'GEMINI_KEEPALIVE_EXPIRY', 60.0),
+        )
+        http_options = types.HttpOptions(
+            client_args={'limits': limits},
+            async_client_args={'limits': limits},
+        )
+        return genai.Client(api_key=api_key, http_options=http_options)
+
+    def get(self, api_key: str = None) -> genai.Client:
+        """Returns the shared client for `api_key` (defaults to GEMINI_API_KEY)."""
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables.")
+
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is not None:
+                self.hits += 1
+                return client
+
+            self.misses += 1
+            client = self._build_client(api_key)
+            self._clients[api_key] = client
+            return client
+
+    def stats(self) -> dict:
+        """Returns pool counters for monitoring."""
+        with self._lock:
+            return {
+                'clients': len(self._clients),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def reset(self):
+        """Drops all cached clients and counters."""
+        with self._lock:
+            self._clients.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _after_fork(self):
+        # The parent's lock may have been held by another thread at fork time,
+        # so the child gets a fresh one rather than acquiring it.
+        self._lock = threading.Lock()
+        self._clients = {}
+        self.hits = 0
+        self.misses = 0
+
+
+# One registry per worker process.
+client_registry = GeminiClientRegistry()
+
+# A forked worker must not share the parent's sockets, so it starts empty.
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=client_registry._after_fork)
+
+
+def get_client(api_key: str = None) -> genai.Client:
+    """Shortcut for `client_registry.get()`."""
+    return client_registry.get(api_key)
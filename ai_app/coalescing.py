@@ -0,0 +1,176 @@
+# ai_app/coalescing.py
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import weakref
+
+from django.conf import settings
+from django.core.cache import caches
+
+_MISSING = object()
+
+
+def flight_key(*parts) -> str:
+    """Hashes the parts that make two AI requests identical (template, model, content...)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent AI requests into one upstream call.
+
+    Within a process, callers that arrive while a request with the same key
+    is in flight wait on it and receive the same result (or exception).
+    Across processes, the leader holds a lock in Django's cache and
+    publishes its result there for a short while; followers in other
+    processes poll for it. Cross-process coalescing needs a shared cache
+    backend (database, Redis, memcached); with the default local-memory
+    cache it still coalesces within each process.
+    """
+
+    def __init__(self, cache_alias: str = None, lock_ttl: int = None, wait_timeout: float = None,
+                 result_ttl: int = 60, poll_interval: float = 0.1):
+        self.cache_alias = cache_alias or getattr(settings, 'AI_COALESCE_CACHE_ALIAS', 'default')
+        self.lock_ttl = lock_ttl or getattr(settings, 'AI_COALESCE_LOCK_TTL', 300)
+        self.wait_timeout = wait_timeout or getattr(settings, 'AI_COALESCE_WAIT_SECONDS', 180)
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = weakref.WeakKeyDictionary()  # event loop -> {key: Task}
+        self.leaders = 0
+        self.followers = 0
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'leaders': self.leaders, 'followers': self.followers, 'in_flight': len(self._calls)}
+
+    # --- Threads ---
+
+    def do(self, key: str, fn):
+        """Returns fn(), unless an identical call is already running, in which case its result."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.followers += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fn)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _do_shared(self, key: str, fn):
+        lock_key, result_key = f"singleflight:lock:{key}", f"singleflight:result:{key}"
+        deadline = time.monotonic() + self.wait_timeout
+        counted = False
+
+        while True:
+            if self.cache.add(lock_key, os.getpid(), self.lock_ttl):
+                self._count('leaders')
+                try:
+                    result = fn()
+                    self.cache.set(result_key, result, self.result_ttl)
+                    return result
+                finally:
+                    self.cache.delete(lock_key)
+
+            # Another process is computing this request: wait for its result
+            if not counted:
+                self._count('followers')
+                counted = True
+            while self.cache.get(lock_key) is not None and time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+
+            result = self.cache.get(result_key, _MISSING)
+            if result is not _MISSING:
+                return result
+            if time.monotonic() >= deadline:
+                return fn()
+            # The lock was released without a result (the leader failed); try to lead
+
+    # --- Coroutines ---
+
+    async def ado(self, key: str, coro_fn):
+        """Async counterpart of `do`; `coro_fn()` must return an awaitable."""
+        loop = asyncio.get_running_loop()
+        flights = self._async_calls.setdefault(loop, {})
+
+        task = flights.get(key)
+        if task is None:
+            task = loop.create_task(self._ado_shared(key, coro_fn))
+            flights[key] = task
+            task.add_done_callback(lambda _: flights.pop(key, None))
+        else:
+            self._count('followers')
+
+        # Shielded so one cancelled caller doesn't cancel the shared call for the others
+        return await asyncio.shield(task)
+
+    async def _ado_shared(self, key: str, coro_fn):
+        lock_key, result_key = f"singleflight:lock:{key}", f"singleflight:result:{key}"
+        deadline = time.monotonic() + self.wait_timeout
+        counted = False
+
+        while True:
+            if await self.cache.aadd(lock_key, os.getpid(), self.lock_ttl):
+                self._count('leaders')
+                try:
+                    result = await coro_fn()
+                    await self.cache.aset(result_key, result, self.result_ttl)
+                    return result
+                finally:
+                    await self.cache.adelete(lock_key)
+
+            if not counted:
+                self._count('followers')
+                counted = True
+            while await self.cache.aget(lock_key) is not None and time.monotonic() < deadline:
+                await asyncio.sleep(self.poll_interval)
+
+            result = await self.cache.aget(result_key, _MISSING)
+            if result is not _MISSING:
+                return result
+            if time.monotonic() >= deadline:
+                return await coro_fn()
+
+
+# One coordinator per worker process; processes coordinate through the cache.
+single_flight = SingleFlight()
@@ -0,0 +1,383 @@
+# ai_app/extraction.py
+#
+# The one PDF text-extraction engine for the project. Pages are parsed
+# lazily, one at a time, so callers with a character or token budget stop
+# the parser as soon as they have enough text. Large PDFs are parsed in
+# page ranges on a warm process pool and reassembled in page order.
+
+import hashlib
+import io
+import mmap
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from .chunking import PAGE_BREAK
+from .routing import estimate_tokens
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:  # pragma: no cover - PyMuPDF is in requirements, pypdf is the fallback
+    fitz = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pragma: no cover
+    PdfReader = None
+
+# Fastest first: PyMuPDF's C parser is several times faster than pure-Python pypdf
+BACKEND_PREFERENCE = ('pymupdf', 'pypdf')
+
+
+def available_backends() -> list:
+    installed = {'pymupdf': fitz is not None, 'pypdf': PdfReader is not None}
+    return [name for name in BACKEND_PREFERENCE if installed[name]]
+
+
+def choose_backend(preferred: str = None) -> str:
+    """Returns the requested backend, or the fastest installed one for 'auto'/None."""
+    preferred = preferred or getattr(settings, 'PDF_EXTRACTION_BACKEND', 'auto')
+    backends = available_backends()
+    if not backends:
+        raise RuntimeError("No PDF backend installed (install PyMuPDF or pypdf).")
+    if preferred == 'auto':
+        return backends[0]
+    if preferred not in backends:
+        raise ValueError(f"PDF backend '{preferred}' is not available; installed: {', '.join(backends)}.")
+    return preferred
+
+
+def max_document_chars() -> int:
+    """Default budget for documents sent to the AI (more text only adds map-reduce calls)."""
+    return getattr(settings, 'AI_MAX_DOCUMENT_CHARS', 400000)
+
+
+class _ViewStream(io.RawIOBase):
+    """A seekable, read-only file over a memoryview, so pypdf can read it without a copy."""
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self._view[self._pos:self._pos + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self._pos += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+def _disk_path(source):
+    """The filesystem path behind `source`, if it has one."""
+    if isinstance(source, str):
+        return source
+    if hasattr(source, 'temporary_file_path'):  # TemporaryUploadedFile
+        return source.temporary_file_path()
+    handle = getattr(source, 'file', source)
+    name = getattr(handle, 'name', None)
+    try:
+        handle.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None  # in-memory file; its name is only the upload's file name
+    return name if isinstance(name, str) and os.path.isfile(name) else None
+
+
+class PdfSource:
+    """
+    Zero-copy access to a PDF given as a path, bytes or a (Django) file.
+
+    Files that are already on disk (TemporaryUploadedFile, stored FieldFiles,
+    paths) are parsed and hashed straight from their path, and mapped with
+    mmap only if raw bytes are asked for. In-memory uploads are exposed as
+    a memoryview of their buffer, which the parser and `sha256()` share, so
+    the content is never copied into another Python bytes object.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.path = _disk_path(source)
+        self._view = None
+        self._mmap = None
+        self._handle = None
+        self._digest = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def view(self) -> memoryview:
+        if self._view is None:
+            if self.path:
+                self._handle = open(self.path, 'rb')
+                if os.fstat(self._handle.fileno()).st_size:
+                    self._mmap = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._view = memoryview(self._mmap)
+                else:
+                    self._view = memoryview(b"")
+            elif isinstance(self.source, (bytes, bytearray, memoryview)):
+                self._view = memoryview(self.source)
+            else:
+                handle = getattr(self.source, 'file', self.source)
+                if isinstance(handle, io.BytesIO):
+                    # Behind InMemoryUploadedFile. getvalue() hands out BytesIO's own buffer
+                    # without copying; getbuffer() would copy a buffer shared with its initial bytes
+                    self._view = memoryview(handle.getvalue())
+                else:
+                    # Last resort for streams we can't map: one copy
+                    if hasattr(self.source, 'seek'):
+                        self.source.seek(0)
+                    self._view = memoryview(self.source.read())
+        return self._view
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path) if self.path else len(self.view())
+
+    def sha256(self) -> str:
+        if self._digest is None:
+            if self.path and self._view is None:
+                # Streamed through a small reusable buffer; nothing is mapped or copied
+                with open(self.path, 'rb') as handle:
+                    self._digest = hashlib.file_digest(handle, 'sha256').hexdigest()
+            else:
+                self._digest = hashlib.sha256(self.view()).hexdigest()
+        return self._digest
+
+    def open_pymupdf(self):
+        if self.path:
+            return fitz.open(self.path)
+        return fitz.open(stream=self.view(), filetype="pdf")
+
+    def open_pypdf(self):
+        return PdfReader(self.path if self.path else _ViewStream(self.view()))
+
+    def close(self):
+        if self._view is not None:
+            try:
+                self._view.release()
+            except BufferError:
+                pass  # still referenced by a parser; freed with it
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+def _pymupdf_pages(pdf: PdfSource):
+    doc = pdf.open_pymupdf()
+    try:
+        for page in doc:
+            yield page.get_text()
+    finally:
+        doc.close()
+
+
+def _pypdf_pages(pdf: PdfSource):
+    for page in pdf.open_pypdf().pages:
+        yield page.extract_text() or ""
+
+
+_PAGE_READERS = {'pymupdf': _pymupdf_pages, 'pypdf': _pypdf_pages}
+
+
+def page_count(source, backend: str = None) -> int:
+    backend = choose_backend(backend)
+    if not isinstance(source, PdfSource):
+        with PdfSource(source) as pdf:
+            return page_count(pdf, backend)
+    if backend == 'pymupdf':
+        doc = source.open_pymupdf()
+        try:
+            return doc.page_count
+        finally:
+            doc.close()
+    return len(source.open_pypdf().pages)
+
+
+def _extract_range(path: str, start: int, stop: int, backend: str) -> list:
+    """Worker-side: the text of pages [start, stop) of the PDF at `path`."""
+    if backend == 'pymupdf':
+        doc = fitz.open(path)
+        try:
+            return [doc[number].get_text() for number in range(start, stop)]
+        finally:
+            doc.close()
+    pages = PdfReader(path).pages
+    return [pages[number].extract_text() or "" for number in range(start, stop)]
+
+
+# --- Warm process pool ---
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def extraction_workers() -> int:
+    return getattr(settings, 'PDF_EXTRACTION_PROCESSES', None) or os.cpu_count() or 1
+
+
+def process_pool() -> ProcessPoolExecutor:
+    """
+    The shared extraction pool, started on first use and then kept warm.
+
+    Workers are spawned rather than forked: the web process is threaded
+    and PyMuPDF is not fork-safe. A forked child of the web process (e.g.
+    a new worker) gets its own pool.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=extraction_workers(),
+                                        mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def warm_up():
+    """Starts every pool worker now, so the first large PDF doesn't pay for it."""
+    pool = process_pool()
+    for future in [pool.submit(available_backends) for _ in range(extraction_workers())]:
+        future.result()
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def _parallel_pages(pdf: PdfSource, backend: str, workers: int):
+    """Yields page texts in order while up to `workers` page ranges are parsed concurrently."""
+    temp_path = None
+    path = pdf.path
+    if not path:
+        # Workers open the file by path instead of receiving a pickled copy per range
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as handle:
+            handle.write(pdf.view())
+            temp_path = path = handle.name
+
+    pending = deque()
+    try:
+        count = page_count(path, backend)
+        size = max(1, -(-count // (workers * 2)))  # two ranges per worker evens out uneven pages
+        ranges = iter([(start, min(start + size, count)) for start in range(0, count, size)])
+        pool = process_pool()
+
+        for start, stop in ranges:
+            pending.append(pool.submit(_extract_range, path, start, stop, backend))
+            if len(pending) >= workers:
+                break
+        while pending:
+            pages = pending.popleft().result()
+            next_range = next(ranges, None)
+            if next_range:
+                pending.append(pool.submit(_extract_range, path, *next_range, backend))
+            yield from pages
+    finally:
+        # Stopping early (budget met) drops the ranges nobody will read; ranges
+        # already running still need the file, so wait for them before deleting it
+        for future in pending:
+            if not future.cancel():
+                future.exception()
+        if temp_path:
+            os.unlink(temp_path)
+
+
+def should_parallelize(source, backend: str = None) -> bool:
+    """Large, many-page PDFs go to the pool; small ones are cheaper to parse inline."""
+    if not getattr(settings, 'PDF_PARALLEL_EXTRACTION', True) or extraction_workers() < 2:
+        return False
+    if not isinstance(source, PdfSource):
+        with PdfSource(source) as pdf:
+            return should_parallelize(pdf, backend)
+    if source.size < getattr(settings, 'PDF_PARALLEL_MIN_BYTES', 1024 * 1024):
+        return False
+    return page_count(source, backend) >= getattr(settings, 'PDF_PARALLEL_MIN_PAGES', 32)
+
+
+def iter_pages(source, backend: str = None, parallel: bool = None):
+    """
+    Yields the text of each page in order, parsing a page only when asked.
+
+    `source` is a file path, the PDF bytes, a binary file object (such as
+    a Django UploadedFile) or a PdfSource. With `parallel` (decided by size when None),
+    page ranges are parsed ahead on the process pool instead.
+    """
+    return _iter_pages(source, choose_backend(backend), parallel)
+
+
+def _iter_pages(source, backend: str, parallel: bool):
+    pdf = source if isinstance(source, PdfSource) else PdfSource(source)
+    try:
+        if parallel is None:
+            parallel = should_parallelize(pdf, backend)
+        if parallel:
+            yield from _parallel_pages(pdf, backend, extraction_workers())
+        else:
+            yield from _PAGE_READERS[backend](pdf)
+    finally:
+        if pdf is not source:
+            pdf.close()
+
+
+def extract_text(source, max_chars: int = None, max_tokens: int = None, backend: str = None,
+                 parallel: bool = None) -> str:
+    """
+    Extracts the text of a PDF, pages separated by PAGE_BREAK.
+
+    Pages are collected in a list and joined once at the end, rather than
+    concatenated one by one. Parsing stops as soon as `max_chars` or
+    `max_tokens` (estimated locally) is reached; the last page is cut to fit.
+    """
+    parts, chars, tokens = [], 0, 0
+    pages = iter_pages(source, backend, parallel)
+    try:
+        for text in pages:
+            text += PAGE_BREAK
+            if max_chars is not None and chars + len(text) >= max_chars:
+                parts.append(text[:max_chars - chars])
+                break
+            if max_tokens is not None:
+                page_tokens = estimate_tokens(text)
+                if tokens + page_tokens >= max_tokens:
+                    parts.append(text[:(max_tokens - tokens) * len(text) // max(page_tokens, 1)])
+                    break
+                tokens += page_tokens
+            parts.append(text)
+            chars += len(text)
+    finally:
+        # Closes the document even when we stop early
+        pages.close()
+    return "".join(parts)
+
+
+def extract_text_and_digest(source, **options) -> tuple:
+    """`extract_text` plus the SHA-256 of the file, hashed over the same zero-copy view."""
+    with PdfSource(source) as pdf:
+        return extract_text(pdf, **options), pdf.sha256()
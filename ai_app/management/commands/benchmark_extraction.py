@@ -0,0 +1,65 @@
+# ai_app/management/commands/benchmark_extraction.py
+
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from ai_app import extraction
+from ai_app.benchmarking import synthetic_pdf
+
+
+class Command(BaseCommand):
+    help = "Benchmarks inline vs. process-pool PDF extraction for 1..N workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=300)
+        parser.add_argument('--words', type=int, default=600, help="Words per page.")
+        parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per setting; the best is kept.")
+        parser.add_argument('--backend', default='auto')
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def _best(self, repeat, fn):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def handle(self, *args, **options):
+        pdf = synthetic_pdf(options['pages'], options['words'])
+        backend = extraction.choose_backend(options['backend'])
+        expected = extraction.extract_text(pdf, backend=backend, parallel=False)
+
+        inline = self._best(options['repeat'], lambda: extraction.extract_text(pdf, backend=backend, parallel=False))
+        results = [{'workers': 0, 'mode': 'inline', 'seconds': round(inline, 4), 'speedup': 1.0}]
+
+        for workers in range(1, options['max_workers'] + 1):
+            with override_settings(PDF_EXTRACTION_PROCESSES=workers):
+                extraction.shutdown_pool()
+                extraction.warm_up()
+                if extraction.extract_text(pdf, backend=backend, parallel=True) != expected:
+                    raise AssertionError(f"Parallel extraction with {workers} workers changed the text.")
+                elapsed = self._best(
+                    options['repeat'], lambda: extraction.extract_text(pdf, backend=backend, parallel=True))
+                extraction.shutdown_pool()
+            results.append({'workers': workers, 'mode': 'pool', 'seconds': round(elapsed, 4),
+                            'speedup': round(inline / elapsed, 2)})
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'pages': options['pages'], 'bytes': len(pdf), 'backend': backend,
+                'cpu_count': os.cpu_count(), 'results': results,
+            }, indent=2))
+            return
+
+        self.stdout.write(f"{options['pages']} pages, {len(pdf) / 1e6:.1f} MB, backend={backend}, "
+                          f"cpus={os.cpu_count()}")
+        for row in results:
+            label = 'inline' if row['mode'] == 'inline' else f"{row['workers']} worker(s)"
+            self.stdout.write(f"  {label:<12} {row['seconds']:>8.3f}s  x{row['speedup']}")
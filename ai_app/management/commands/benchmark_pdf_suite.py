@@ -0,0 +1,205 @@
+# ai_app/management/commands/benchmark_pdf_suite.py
+
+import json
+import multiprocessing
+import os
+import platform
+import queue as queues
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ai_app.benchmarking import MB, generate_corpus, peak_rss, reset_peak_rss, rss
+
+
+def _measure(path: str, backend: str, mode: str, workers: int, first_chars: int, repeat: int, queue):
+    """Child process: times one (document, backend, mode) case and reports its peak RSS growth."""
+    import django
+    django.setup()
+
+    from django.test import override_settings
+    from ai_app import extraction
+
+    with override_settings(PDF_EXTRACTION_PROCESSES=workers):
+        parallel = mode == 'parallel'
+        if parallel:
+            extraction.warm_up()
+        pages = extraction.page_count(path, backend)
+        # One untimed pass loads the backend's fonts and tables and warms the page cache
+        text = extraction.extract_text(path, backend=backend, parallel=parallel)
+
+        reset_peak_rss()
+        baseline = rss()
+        full = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            extraction.extract_text(path, backend=backend, parallel=parallel)
+            full.append(time.perf_counter() - started)
+        growth = peak_rss() - baseline
+
+        first = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            extraction.extract_text(path, max_chars=first_chars, backend=backend, parallel=parallel)
+            first.append(time.perf_counter() - started)
+        extraction.shutdown_pool()
+
+    best = min(full)
+    queue.put({
+        'pages': pages,
+        'chars': len(text),
+        'seconds': round(best, 4),
+        'pages_per_second': round(pages / best, 1),
+        'first_chars_seconds': round(min(first), 4),
+        # Parallel mode: the parent only; the pool workers' memory is not included
+        'peak_rss_growth_mb': round(growth / MB, 2),
+    })
+
+
+def _run_case(context, args, timeout: float) -> dict:
+    """Runs _measure in a fresh process; a crash or a timeout comes back as {'error': ...}."""
+    queue = context.Queue()
+    child = context.Process(target=_measure, args=(*args, queue))
+    child.start()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            row = queue.get(timeout=1)
+            break
+        except queues.Empty:
+            if not child.is_alive():
+                # Exited without a result (an exception, a bad backend name, the OOM killer)
+                child.join()
+                try:
+                    row = queue.get(timeout=1)  # unless the result was still in the pipe
+                    break
+                except queues.Empty:
+                    return {'error': f"exited with code {child.exitcode}"}
+            if time.monotonic() > deadline:
+                child.terminate()
+                child.join()
+                return {'error': f"timed out after {timeout:g}s"}
+    child.join()
+    return row
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _environment() -> dict:
+    from ai_app import extraction
+
+    versions = {}
+    if extraction.fitz is not None:
+        versions['pymupdf'] = extraction.fitz.VersionBind
+    if extraction.PdfReader is not None:
+        import pypdf
+        versions['pypdf'] = pypdf.__version__
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'versions': versions,
+    }
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks every PDF extraction backend and mode on a synthetic corpus: pages/sec, "
+            "time to the first N characters and peak memory, written as JSON for comparing runs.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'smartaid-pdf-corpus'),
+                            help="Where the generated PDFs are kept between runs.")
+        parser.add_argument('--scale', type=float, default=1.0, help="Multiplies every document's page count.")
+        parser.add_argument('--backends', default=None, help="Comma-separated; default: every installed backend.")
+        parser.add_argument('--modes', default=None, help="inline,parallel; default: parallel only with 2+ CPUs.")
+        parser.add_argument('--workers', type=int, default=None, help="Pool size for the parallel mode.")
+        parser.add_argument('--first-chars', type=int, default=4000,
+                            help="N for the time-to-first-N-characters measurement.")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per case; the best is kept.")
+        parser.add_argument('--case-timeout', type=float, default=900,
+                            help="Seconds before a case is abandoned and recorded as failed.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="A previous results file to compare against.")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        from ai_app import extraction
+
+        backends = options['backends'].split(',') if options['backends'] else extraction.available_backends()
+        workers = options['workers'] or extraction.extraction_workers()
+        if options['modes']:
+            modes = options['modes'].split(',')
+        else:
+            modes = ['inline', 'parallel'] if (os.cpu_count() or 1) > 1 else ['inline']
+
+        paths = generate_corpus(options['corpus_dir'], scale=options['scale'])
+        context = multiprocessing.get_context('spawn')
+        results = []
+        for path in paths:
+            for backend in backends:
+                for mode in modes:
+                    # A fresh process per case, so neither peaks nor caches carry over
+                    row = _run_case(context, (path, backend, mode, workers, options['first_chars'],
+                                              options['repeat']), options['case_timeout'])
+                    results.append({'document': os.path.basename(path), 'bytes': os.path.getsize(path),
+                                    'backend': backend, 'mode': mode,
+                                    'workers': workers if mode == 'parallel' else 1, **row})
+
+        report = {
+            'environment': _environment(),
+            'settings': {'first_chars': options['first_chars'], 'repeat': options['repeat'],
+                         'scale': options['scale']},
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._print(report)
+        if options['compare']:
+            self._compare(options['compare'], results)
+
+    def _print(self, report):
+        env = report['environment']
+        self.stdout.write(f"revision={env['revision']} python={env['python']} cpus={env['cpu_count']} "
+                          + " ".join(f"{name}={version}" for name, version in env['versions'].items()))
+        self.stdout.write(f"{'document':<34} {'backend':<8} {'mode':<9} {'pages/s':>9} {'total s':>9} "
+                          f"{'first N s':>10} {'peak MB':>8}")
+        for row in report['results']:
+            if 'error' in row:
+                self.stdout.write(f"{row['document']:<34} {row['backend']:<8} {row['mode']:<9} "
+                                  f"FAILED: {row['error']}")
+                continue
+            self.stdout.write(f"{row['document']:<34} {row['backend']:<8} {row['mode']:<9} "
+                              f"{row['pages_per_second']:>9.1f} {row['seconds']:>9.3f} "
+                              f"{row['first_chars_seconds']:>10.4f} {row['peak_rss_growth_mb']:>8.1f}")
+
+    def _compare(self, path, results):
+        with open(path) as handle:
+            previous = json.load(handle)
+        before = {(row['document'], row['backend'], row['mode']): row for row in previous['results']}
+        revision = previous['environment'].get('revision')
+        self.stdout.write(f"Compared with {path} (revision {revision}); above 1.0 is faster now:")
+        for row in results:
+            old = before.get((row['document'], row['backend'], row['mode']))
+            if old is None or 'error' in old or 'error' in row:
+                continue
+            self.stdout.write(f"  {row['document']:<34} {row['backend']:<8} {row['mode']:<9} "
+                              f"throughput x{row['pages_per_second'] / old['pages_per_second']:.2f}  "
+                              f"first N x{old['first_chars_seconds'] / row['first_chars_seconds']:.2f}  "
+                              f"peak {row['peak_rss_growth_mb'] - old['peak_rss_growth_mb']:+.1f} MB")
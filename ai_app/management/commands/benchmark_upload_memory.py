@@ -0,0 +1,95 @@
+# ai_app/management/commands/benchmark_upload_memory.py
+
+import json
+import multiprocessing
+import os
+import tempfile
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+
+from ai_app.benchmarking import MB, peak_rss, reset_peak_rss, rss, synthetic_pdf
+
+
+def _measure(path: str, kind: str, mode: str, queue):
+    """Child process: builds one upload and extracts it, reporting the RSS growth."""
+    import django
+    django.setup()
+
+    import fitz
+    from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+    from ai_app import extraction
+
+    if kind == 'memory':
+        # Filled in chunks, like Django's MemoryFileUploadHandler does
+        buffer = BytesIO()
+        with open(path, 'rb') as handle:
+            for block in iter(lambda: handle.read(64 * 1024), b''):
+                buffer.write(block)
+        upload = InMemoryUploadedFile(buffer, 'pdf_file', 'bench.pdf', 'application/pdf', buffer.tell(), None)
+    else:
+        upload = TemporaryUploadedFile('bench.pdf', 'application/pdf', os.path.getsize(path), None)
+        with open(path, 'rb') as handle:
+            for block in iter(lambda: handle.read(MB), b''):
+                upload.write(block)
+        upload.flush()
+
+    # Load the parser's fonts and tables up front so they don't count as per-upload cost
+    warm = fitz.open()
+    warm.new_page().insert_text((72, 72), "warm up")
+    extraction.extract_text(warm.tobytes(), parallel=False)
+    warm.close()
+
+    reset_peak_rss()
+    baseline = rss()
+    if mode == 'copy':
+        # What the extractors did before: read() the upload, wrap the bytes in a new BytesIO, hash separately
+        import hashlib
+        upload.seek(0)
+        data = upload.read()
+        hashlib.sha256(data).hexdigest()
+        doc = fitz.open(stream=BytesIO(data), filetype="pdf")
+        "".join(page.get_text() for page in doc)
+        doc.close()
+    else:
+        extraction.extract_text_and_digest(upload, parallel=False)
+
+    queue.put(peak_rss() - baseline)
+
+
+class Command(BaseCommand):
+    help = "Compares peak RSS growth of copying vs. zero-copy handling of a PDF upload."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=10, help="Approximate PDF size.")
+        parser.add_argument('--pages', type=int, default=40)
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        pdf = synthetic_pdf(options['pages'], 300, padding_bytes=options['size_mb'] * MB)
+        context = multiprocessing.get_context('spawn')
+        results = []
+
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as handle:
+            handle.write(pdf)
+            handle.flush()
+            del pdf
+
+            # Each measurement runs in a fresh process so peaks don't carry over
+            for kind in ('memory', 'temporary'):
+                for mode in ('copy', 'zero-copy'):
+                    queue = context.Queue()
+                    child = context.Process(target=_measure, args=(handle.name, kind, mode, queue))
+                    child.start()
+                    growth = queue.get()
+                    child.join()
+                    results.append({'upload': kind, 'mode': mode, 'peak_rss_growth_mb': round(growth / MB, 2)})
+            size = os.path.getsize(handle.name)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'file_mb': round(size / MB, 2), 'results': results}, indent=2))
+            return
+
+        self.stdout.write(f"PDF size: {size / MB:.1f} MB")
+        for row in results:
+            self.stdout.write(f"  {row['upload']:<10} {row['mode']:<10} +{row['peak_rss_growth_mb']:.1f} MB peak RSS")
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_app', '0002_moodlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentResultCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='SHA-256 of the text plus request fingerprint.', max_length=64, unique=True)),
+                ('fingerprint', models.CharField(blank=True, db_index=True, help_text='SHA-256 of the model, schema and prompt used.', max_length=64)),
+                ('result', models.JSONField(help_text='The summary and flashcards returned by the model.')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Document Result Cache Entry',
+                'verbose_name_plural': 'Document Result Cache Entries',
+            },
+        ),
+    ]
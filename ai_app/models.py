@@ -38,4 +38,20 @@ class MoodLog(models.Model):
         ordering = ['-logged_at']
 
     def __str__(self):
-        return f"{self.mood} at {self.logged_at.strftime('%Y-%m-%d %H:%M')}"
\ No newline at end of file
+        return f"{self.mood} at {self.logged_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+class DocumentResultCacheEntry(models.Model):
+    """Persisted `process_document` result, keyed by a hash of the document text and request settings."""
+    key = models.CharField(max_length=64, unique=True, help_text="SHA-256 of the text plus request fingerprint.")
+    fingerprint = models.CharField(max_length=64, blank=True, db_index=True,
+                                   help_text="SHA-256 of the model, schema and prompt used.")
+    result = models.JSONField(help_text="The summary and flashcards returned by the model.")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Document Result Cache Entry"
+        verbose_name_plural = "Document Result Cache Entries"
+
+    def __str__(self):
+        return f"Cached result {self.key[:12]} at {self.created_at.strftime('%Y-%m-%d %H:%M')}"
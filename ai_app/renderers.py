@@ -0,0 +1,29 @@
+# ai_app/renderers.py
+
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+def sse_event(data: dict, event: str = None) -> str:
+    """Formats one Server-Sent Event frame."""
+    frame = f"event: {event}\n" if event else ""
+    return f"{frame}data: {json.dumps(data)}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets DRF accept `Accept: text/event-stream` on streaming endpoints.
+
+    Successful streams bypass rendering entirely (they are returned as a
+    `StreamingHttpResponse`); this only renders the non-streamed replies,
+    such as validation errors, as a single `error` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return sse_event(data, event='error').encode(self.charset)
@@ -0,0 +1,362 @@
+# ai_app/resilience.py
+
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import httpx
+from django.conf import settings
+from google.genai.errors import APIError
+
+# HTTP statuses worth retrying: timeouts, rate limits and server-side failures
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+DEFAULT_DEADLINES = {'chat': 30, 'mood': 20, 'mood_pool': 60, 'document': 120, 'reduce': 60, 'flashcards': 60}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the breaker is open."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call does not finish within its deadline."""
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """True for errors that say the upstream is unhealthy (as opposed to a bad request)."""
+    if isinstance(exc, APIError):
+        return exc.code in RETRYABLE_STATUS
+    return isinstance(exc, (TimeoutError, ConnectionError, httpx.TransportError))
+
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker.
+
+    Closed: calls go through and their outcomes fill a sliding window. Once
+    the window holds at least `min_calls` outcomes and the failure rate
+    reaches `error_rate`, the breaker trips open and rejects calls for
+    `reset_timeout` seconds. Then it lets a single probe through (half-open):
+    success closes it again, failure re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name: str = 'gemini', error_rate: float = None, min_calls: int = None,
+                 window: int = None, reset_timeout: float = None, clock=time.monotonic):
+        self.name = name
+        self.error_rate = error_rate or getattr(settings, 'AI_BREAKER_ERROR_RATE', 0.5)
+        self.min_calls = min_calls or getattr(settings, 'AI_BREAKER_MIN_CALLS', 10)
+        self.reset_timeout = reset_timeout or getattr(settings, 'AI_BREAKER_RESET_SECONDS', 30)
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window or getattr(settings, 'AI_BREAKER_WINDOW', 50))
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now; counts a rejection if not."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def _trip(self):
+        self._state = self.OPEN
+        self._opened_at = self.clock()
+        self._probing = False
+        self.trips += 1
+
+    def record(self, success: bool):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                if success:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._trip()
+                return
+
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (self._state == self.CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.error_rate):
+                self._trip()
+                self._outcomes.clear()
+
+    def reset(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._outcomes.clear()
+            self._probing = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            outcomes = list(self._outcomes)
+            return {
+                'name': self.name,
+                'state': self._current_state(),
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'window_calls': len(outcomes),
+                'window_error_rate': round(outcomes.count(False) / len(outcomes), 3) if outcomes else 0.0,
+            }
+
+
+class ResilientCaller:
+    """
+    Runs upstream calls behind a circuit breaker, with a deadline per task.
+
+    Idempotent calls are also retried on upstream failures, with full-jitter
+    exponential backoff, as long as the deadline allows. When hedging is on,
+    a second identical request is sent once the first has been running for
+    the task's observed p95 latency, and whichever finishes first wins.
+    """
+
+    def __init__(self, breaker: CircuitBreaker = None, deadlines: dict = None, retries: int = None,
+                 backoff: float = None, backoff_max: float = None, hedge: bool = None,
+                 hedge_min_samples: int = 20, max_workers: int = None):
+        self.breaker = breaker or CircuitBreaker()
+        self.deadlines = {**DEFAULT_DEADLINES, **(deadlines or getattr(settings, 'AI_DEADLINES', {}))}
+        self.default_deadline = getattr(settings, 'AI_DEFAULT_DEADLINE', 30)
+        self.retries = retries if retries is not None else getattr(settings, 'AI_RETRY_ATTEMPTS', 2)
+        self.backoff = backoff or getattr(settings, 'AI_RETRY_BACKOFF', 0.5)
+        self.backoff_max = backoff_max or getattr(settings, 'AI_RETRY_BACKOFF_MAX', 4)
+        self.hedge = hedge if hedge is not None else getattr(settings, 'AI_HEDGE_REQUESTS', False)
+        self.hedge_min_samples = hedge_min_samples
+        self.max_workers = max_workers or getattr(settings, 'AI_RESILIENCE_WORKERS', 32)
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._latencies = defaultdict(lambda: deque(maxlen=200))
+        self._counters = defaultdict(int)  # retries, hedges, hedge_wins, deadline_exceeded
+
+    # --- Bookkeeping ---
+
+    def deadline_for(self, task: str) -> float:
+        return self.deadlines.get(task, self.default_deadline)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _observe(self, task: str, elapsed: float):
+        with self._lock:
+            self._latencies[task].append(elapsed)
+
+    def hedge_delay(self, task: str):
+        """The task's p95 latency, or None until enough calls have been seen."""
+        with self._lock:
+            samples = sorted(self._latencies[task])
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return samples[math.ceil(0.95 * len(samples)) - 1]
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Worker threads don't survive a fork, so each process builds its own pool
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='gemini-call')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _admit(self, task: str):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Gemini circuit is open; '{task}' call rejected.")
+
+    def _settle(self, exc: BaseException = None):
+        self.breaker.record(exc is None or not (isinstance(exc, DeadlineExceeded) or is_upstream_failure(exc)))
+
+    def _should_retry(self, exc: BaseException, idempotent: bool, attempt: int, deadline: float):
+        """Returns the backoff before the next attempt, or None if the error should propagate."""
+        if not idempotent or attempt >= self.retries or isinstance(exc, DeadlineExceeded):
+            return None
+        if not is_upstream_failure(exc):
+            return None
+        delay = self._backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            return None
+        self._count('retries')
+        return delay
+
+    # --- Threads ---
+
+    def call(self, task: str, fn, idempotent: bool = False):
+        """Runs `fn()` within the task's deadline; see the class docstring."""
+        deadline = time.monotonic() + self.deadline_for(task)
+        attempt = 0
+        while True:
+            self._admit(task)
+            started = time.monotonic()
+            try:
+                result = self._attempt(task, fn, deadline, hedge=idempotent and self.hedge)
+            except Exception as e:
+                self._settle(e)
+                delay = self._should_retry(e, idempotent, attempt, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._settle()
+            self._observe(task, time.monotonic() - started)
+            return result
+
+    def _attempt(self, task: str, fn, deadline: float, hedge: bool):
+        pool = self._pool()
+        first = pool.submit(fn)
+        pending = {first}
+        hedge_after = self.hedge_delay(task) if hedge else None
+        error = None
+
+        if hedge_after is not None and time.monotonic() + hedge_after < deadline:
+            done, _ = wait(pending, timeout=hedge_after)
+            if not done:
+                self._count('hedges')
+                pending.add(pool.submit(fn))
+
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                self._count('deadline_exceeded')
+                raise DeadlineExceeded(f"'{task}' call exceeded its {self.deadline_for(task)}s deadline.")
+            for future in done:
+                if future.exception() is None:
+                    if future is not first:
+                        self._count('hedge_wins')
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def stream(self, task: str, fn):
+        """
+        Wraps a streaming call in the breaker. Streams are never retried or
+        hedged: part of the answer may already have reached the client.
+        """
+        self._admit(task)
+        error = None
+        try:
+            yield from fn()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._settle(error)
+
+    # --- Coroutines ---
+
+    async def astream(self, task: str, coro_fn):
+        """Async counterpart of `stream`; `coro_fn()` must return an awaitable of an async iterator."""
+        self._admit(task)
+        error = None
+        try:
+            async for item in await coro_fn():
+                yield item
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._settle(error)
+
+    async def acall(self, task: str, coro_fn, idempotent: bool = False):
+        """Async counterpart of `call`; `coro_fn()` must return an awaitable."""
+        deadline = time.monotonic() + self.deadline_for(task)
+        attempt = 0
+        while True:
+            self._admit(task)
+            started = time.monotonic()
+            try:
+                result = await self._aattempt(task, coro_fn, deadline, hedge=idempotent and self.hedge)
+            except Exception as e:
+                self._settle(e)
+                delay = self._should_retry(e, idempotent, attempt, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._settle()
+            self._observe(task, time.monotonic() - started)
+            return result
+
+    async def _aattempt(self, task: str, coro_fn, deadline: float, hedge: bool):
+        first = asyncio.ensure_future(coro_fn())
+        pending = {first}
+        hedge_after = self.hedge_delay(task) if hedge else None
+        error = None
+
+        try:
+            if hedge_after is not None and time.monotonic() + hedge_after < deadline:
+                done, _ = await asyncio.wait(pending, timeout=hedge_after)
+                if not done:
+                    self._count('hedges')
+                    pending.add(asyncio.ensure_future(coro_fn()))
+
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self._count('deadline_exceeded')
+                    raise DeadlineExceeded(f"'{task}' call exceeded its {self.deadline_for(task)}s deadline.")
+                for task_ in done:
+                    if task_.exception() is None:
+                        if task_ is not first:
+                            self._count('hedge_wins')
+                        return task_.result()
+                    error = error or task_.exception()
+            raise error
+        finally:
+            # Unlike threads, losing or late coroutines can actually be cancelled
+            for task_ in pending:
+                task_.cancel()
+
+    def stats(self) -> dict:
+        """Breaker state and trip counts plus retry/hedge/deadline counters."""
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            'breaker': self.breaker.stats(),
+            'retries': counters.get('retries', 0),
+            'hedges': counters.get('hedges', 0),
+            'hedge_wins': counters.get('hedge_wins', 0),
+            'deadline_exceeded': counters.get('deadline_exceeded', 0),
+        }
+
+    def reset(self):
+        self.breaker.reset()
+        with self._lock:
+            self._latencies.clear()
+            self._counters.clear()
+
+
+# One breaker per worker process guards every Gemini call.
+gemini_resilience = ResilientCaller()
@@ -0,0 +1,148 @@
+# ai_app/routing.py
+
+import math
+import re
+import threading
+from collections import defaultdict, deque
+from typing import NamedTuple
+
+from django.conf import settings
+
+# Rough averages for Gemini's tokenizer on English prose
+CHARS_PER_TOKEN = 4
+
+# Room left in each request for the instructions wrapped around the document text
+PROMPT_OVERHEAD_TOKENS = 500
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text) -> int:
+    """
+    Estimates the prompt tokens of `text` locally, without a count_tokens call.
+
+    Every punctuation mark counts as one token and every word as one token
+    per CHARS_PER_TOKEN characters, which tracks subword tokenizers closely
+    enough to pick a model and size chunks.
+    """
+    if not text:
+        return 0
+    if not isinstance(text, str):
+        text = str(text)
+    return sum(math.ceil(len(piece) / CHARS_PER_TOKEN) for piece in _PIECE.findall(text))
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts `text` at a word boundary so its estimate fits in `max_tokens`."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max_tokens * CHARS_PER_TOKEN
+    while limit > 0:
+        cut = text.rfind(" ", 0, limit)
+        trimmed = text[:cut if cut > 0 else limit]
+        if estimate_tokens(trimmed) <= max_tokens:
+            return trimmed
+        limit = int(limit * 0.9)
+    return ""
+
+
+class Route(NamedTuple):
+    task: str
+    model: str
+    estimated_tokens: int
+
+
+class ModelRouter:
+    """
+    Picks the Gemini model for each request from its estimated size.
+
+    Documents at or under `pro_min_tokens` go to the fast model in a
+    single call; longer ones go to the pro model. No request carries more
+    than `max_request_tokens`: document text is chunked below it and other
+    prompts are trimmed to it. Every decision is counted, and each call's
+    estimated and actual prompt tokens and its latency are recorded so the
+    thresholds can be tuned (see `stats()`).
+    """
+
+    def __init__(self, fast_model: str = None, pro_model: str = None, pro_min_tokens: int = None,
+                 max_request_tokens: int = None, history: int = 500):
+        self.fast_model = fast_model or getattr(settings, 'AI_FAST_MODEL', 'gemini-2.5-flash')
+        self.pro_model = pro_model or getattr(settings, 'AI_PRO_MODEL', 'gemini-2.5-pro')
+        self.pro_min_tokens = pro_min_tokens or getattr(settings, 'AI_PRO_MODEL_MIN_TOKENS', 8000)
+        self.max_request_tokens = max_request_tokens or getattr(settings, 'AI_MAX_REQUEST_TOKENS', 30000)
+
+        self._lock = threading.Lock()
+        self._decisions = defaultdict(int)  # (task, model) -> routed requests
+        self._calls = defaultdict(lambda: {'calls': 0, 'estimated_tokens': 0, 'actual_tokens': 0,
+                                           'latencies': deque(maxlen=history)})
+        self.recent = deque(maxlen=history)
+
+    def signature(self) -> str:
+        """Identifies the routing configuration (part of the document cache fingerprint)."""
+        return f"{self.fast_model}|{self.pro_model}|{self.pro_min_tokens}|{self.max_request_tokens}"
+
+    def chunk_chars(self, default: int) -> int:
+        """Largest document chunk (in characters) that keeps a request under the ceiling."""
+        ceiling = (self.max_request_tokens - PROMPT_OVERHEAD_TOKENS) * CHARS_PER_TOKEN
+        return max(CHARS_PER_TOKEN, min(default, ceiling))
+
+    def fit(self, prompt: str) -> str:
+        """Trims a prompt to the per-request token ceiling."""
+        return trim_to_tokens(prompt, self.max_request_tokens)
+
+    def route(self, task: str, text: str) -> Route:
+        """Chooses the model for a request; only documents are ever sent to the pro model."""
+        estimated = estimate_tokens(text)
+        model = self.pro_model if task == 'document' and estimated > self.pro_min_tokens else self.fast_model
+        with self._lock:
+            self._decisions[(task, model)] += 1
+        return Route(task, model, estimated)
+
+    def record(self, task: str, model: str, estimated_tokens: int, response, elapsed: float):
+        """Records one model call: estimated vs. actual prompt tokens, and latency."""
+        usage = getattr(response, 'usage_metadata', None)
+        actual = getattr(usage, 'prompt_token_count', None)
+        if not isinstance(actual, int):
+            actual = None
+
+        with self._lock:
+            entry = self._calls[(task, model)]
+            entry['calls'] += 1
+            entry['latencies'].append(elapsed)
+            if actual is not None:
+                entry['estimated_tokens'] += estimated_tokens
+                entry['actual_tokens'] += actual
+            self.recent.append({'task': task, 'model': model, 'estimated_tokens': estimated_tokens,
+                                'actual_tokens': actual, 'seconds': round(elapsed, 3)})
+
+    def stats(self) -> dict:
+        """Routing counts plus per task/model token accuracy and p95 latency."""
+        with self._lock:
+            calls = {}
+            for (task, model), entry in self._calls.items():
+                latencies = sorted(entry['latencies'])
+                p95 = latencies[min(len(latencies) - 1, math.ceil(0.95 * len(latencies)) - 1)] if latencies else None
+                calls[f"{task}:{model}"] = {
+                    'calls': entry['calls'],
+                    'estimated_tokens': entry['estimated_tokens'],
+                    'actual_tokens': entry['actual_tokens'],
+                    # Above 1 means the local estimate undercounts
+                    'actual_to_estimated': (round(entry['actual_tokens'] / entry['estimated_tokens'], 3)
+                                            if entry['estimated_tokens'] else None),
+                    'p95_seconds': p95,
+                }
+            return {
+                'decisions': {f"{task}:{model}": count for (task, model), count in self._decisions.items()},
+                'calls': calls,
+                'recent': list(self.recent),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._decisions.clear()
+            self._calls.clear()
+            self.recent.clear()
+
+
+# One router per worker process.
+model_router = ModelRouter()
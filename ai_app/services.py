@@ -1,14 +1,64 @@
 # ai_app/services.py
 
+import json
 import os
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from dotenv import load_dotenv
-from google import genai
 from google.genai.errors import APIError
 
+from .cache import content_key, document_cache, fingerprint
+from .chunking import amap_chunks, chunk_chars, dedupe_cards, map_chunks, split_document
+from .clients import get_client
+from .coalescing import flight_key, single_flight
+from .resilience import gemini_resilience
+from .routing import estimate_tokens, model_router
+from .suggestions import MoodSuggestionPool
+
 # Load environment variables
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Use a structured output format for the most reliable parsing
+DOCUMENT_SYSTEM_INSTRUCTION = (
+    "You are a study aid AI. Your task is to process the provided text. "
+    "First, generate a concise summary (around 3-4 paragraphs) of the key points. "
+    "Second, generate a minimum of 5 and a maximum of 10 detailed flashcards "
+    "from the most important concepts. The output MUST be a valid JSON object."
+)
+
+DOCUMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string", "description": "The concise 3-4 paragraph summary of the text."},
+        "flashcards": {
+            "type": "array",
+            "description": "A list of 5-10 detailed flashcards.",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "question": {"type": "string", "description": "The flashcard question."},
+                    "answer": {"type": "string", "description": "The detailed flashcard answer."}
+                },
+                "required": ["question", "answer"]
+            }
+        }
+    },
+    "required": ["summary", "flashcards"]
+}
+
+DOCUMENT_CONFIG = dict(
+    temperature=0.3,
+    response_mime_type="application/json",
+    response_schema=DOCUMENT_SCHEMA
+)
+
+
+def document_fingerprint() -> str:
+    """Cache fingerprint for document results: routing configuration, schema and prompt."""
+    return fingerprint(model_router.signature(), DOCUMENT_SCHEMA, DOCUMENT_SYSTEM_INSTRUCTION)
+
 
 class GeminiAIService:
     def __init__(self):
@@ -21,29 +71,55 @@ class GeminiAIService:
     """Service class for interacting with the Google Gemini API."""
 
     def __init__(self):
-        """Initializes the Gemini client."""
+        """Attaches the shared Gemini client."""
         if not GEMINI_API_KEY:
             raise ValueError("GEMINI_API_KEY not found in environment variables.")
 
-        # Initialize the client
+        # Borrow the process-wide client so connections stay warm across requests
         try:
-            self.client = genai.Client(api_key=GEMINI_API_KEY)
-            self.model = 'gemini-2.5-flash'  # A fast, versatile model
+            self.client = get_client(GEMINI_API_KEY)
+            self.model = model_router.fast_model  # A fast, versatile model
         except Exception as e:
             print(f"Error initializing Gemini client: {e}")
             raise
 
+    def _generate(self, task: str, model: str, contents: str, config: dict):
+        """
+        Calls the model behind the circuit breaker, with the task's deadline,
+        and records estimated vs. actual prompt tokens for routing.
+        Generation has no side effects, so failed calls may be retried.
+        """
+        started = time.perf_counter()
+        response = gemini_resilience.call(
+            task,
+            lambda: self.client.models.generate_content(model=model, contents=contents, config=config),
+            idempotent=True,
+        )
+        model_router.record(task, model, estimate_tokens(contents), response, time.perf_counter() - started)
+        return response
+
+    async def _agenerate(self, task: str, model: str, contents: str, config: dict):
+        started = time.perf_counter()
+        response = await gemini_resilience.acall(
+            task,
+            lambda: self.client.aio.models.generate_content(model=model, contents=contents, config=config),
+            idempotent=True,
+        )
+        model_router.record(task, model, estimate_tokens(contents), response, time.perf_counter() - started)
+        return response
+
     def get_ai_chat_response(self, prompt: str) -> str:
         """Sends a message to the AI and returns the text response."""
+
+        prompt = model_router.fit(prompt)
+        route = model_router.route('chat', prompt)
+
+        def generate():
+            return self._generate('chat', route.model, prompt, dict(temperature=0.7)).text
+
         try:
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt,
-                config=dict(
-                    temperature=0.7,
-                ),
-            )
-            return response.text
+            # Identical prompts already in flight share one upstream call
+            return single_flight.do(flight_key('chat', route.model, prompt), generate)
         except APIError as e:
             print(f"Gemini API Error (Chat): {e}")
             return "Sorry, I ran into an issue communicating with the AI service."
@@ -51,9 +127,42 @@ class GeminiAIService:
             print(f"General Error (Chat): {e}")
             return "An unexpected error occurred."
 
-    def get_mood_suggestion(self, mood_code: str, notes: str = "") -> str:
-        """Analyzes a mood and provides a personalized suggestion."""
-        prompt = (
+    def stream_ai_chat_response(self, prompt: str):
+        """
+        Yields the AI response as text chunks as soon as the model produces them.
+
+        Unlike `get_ai_chat_response`, errors are raised rather than turned
+        into a reply, because part of the answer may already have been sent.
+        """
+        prompt = model_router.fit(prompt)
+        route = model_router.route('chat', prompt)
+        for chunk in gemini_resilience.stream('chat', lambda: self.client.models.generate_content_stream(
+            model=route.model,
+            contents=prompt,
+            config=dict(
+                temperature=0.7,
+            ),
+        )):
+            if chunk.text:
+                yield chunk.text
+
+    async def astream_ai_chat_response(self, prompt: str):
+        """Async counterpart of `stream_ai_chat_response`, on the async Gemini client."""
+        prompt = model_router.fit(prompt)
+        route = model_router.route('chat', prompt)
+        async for chunk in gemini_resilience.astream('chat', lambda: self.client.aio.models.generate_content_stream(
+            model=route.model,
+            contents=prompt,
+            config=dict(
+                temperature=0.7,
+            ),
+        )):
+            if chunk.text:
+                yield chunk.text
+
+    @staticmethod
+    def _mood_prompt(mood_code: str, notes: str = "") -> str:
+        return (
             f"The user has logged their mood as '{mood_code}'. "
             f"{f'They also added notes: "{notes}"' if notes else ''}. "
             "Based on this mood, provide a short (2-3 sentence), empathetic, and actionable "
@@ -61,15 +170,17 @@ class GeminiAIService:
             "If 'joyful', suggest planning the next task while feeling motivated. "
             "Your response should be only the suggestion text."
         )
+
+    def get_mood_suggestion(self, mood_code: str, notes: str = "") -> str:
+        """Analyzes a mood and provides a personalized suggestion."""
+        # Without notes the answer depends only on the mood code, so serve it from the pregenerated pool
+        if not (notes or "").strip() and mood_suggestion_pool.supports(mood_code):
+            return mood_suggestion_pool.get(mood_code)
+
+        prompt = model_router.fit(self._mood_prompt(mood_code, notes))
+        route = model_router.route('mood', prompt)
         try:
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt,
-                config=dict(
-                    temperature=0.8,
-                ),
-            )
-            return response.text
+            return self._generate('mood', route.model, prompt, dict(temperature=0.8)).text
         except APIError as e:
             print(f"Gemini API Error (Mood): {e}")
             return "Could not generate AI suggestion due to an API error."
@@ -77,56 +188,219 @@ class GeminiAIService:
             print(f"General Error (Mood): {e}")
             return "An unexpected error occurred."
 
-    def process_document(self, text_content: str, title: str) -> dict:
-        """Summarizes a document and generates flashcards from the text."""
-
-        # Use a structured output format for the most reliable parsing
-        system_instruction = (
-            "You are a study aid AI. Your task is to process the provided text. "
-            "First, generate a concise summary (around 3-4 paragraphs) of the key points. "
-            "Second, generate a minimum of 5 and a maximum of 10 detailed flashcards "
-            "from the most important concepts. The output MUST be a valid JSON object."
+    def generate_mood_suggestions(self, mood_code: str, count: int) -> list:
+        """Generates a batch of distinct suggestions for a mood (used to refill the suggestion pool)."""
+        prompt = (
+            f"The user has logged their mood as '{mood_code}'. "
+            f"Write {count} different short (2-3 sentence), empathetic, and actionable suggestions "
+            "related to productivity or wellness. For example, if 'stressed', suggest a 5-minute break. "
+            "If 'joyful', suggest planning the next task while feeling motivated. "
+            "Return the suggestions as a JSON array of strings."
+        )
+        route = model_router.route('mood_pool', prompt)
+        response = self._generate(
+            'mood_pool', route.model, prompt,
+            dict(
+                temperature=1.0,
+                response_mime_type="application/json",
+                response_schema={"type": "array", "items": {"type": "string"}},
+            ),
+        )
+        suggestions = json.loads(response.text)
+        if not isinstance(suggestions, list):
+            raise ValueError("Gemini returned an invalid JSON structure (not a list).")
+        return [str(s) for s in suggestions]
+
+    @staticmethod
+    def _document_prompt(text_content: str, title: str, part: int = 1, parts: int = 1) -> str:
+        if parts > 1:
+            return (
+                f"Please process part {part} of {parts} of the document titled '{title}'. "
+                f"Only use this part of the text. Document text: \n\n{text_content}"
+            )
+        return f"Please process the following document titled '{title}'. Document text: \n\n{text_content}"
+
+    @staticmethod
+    def _reduce_prompt(summaries: list, title: str) -> str:
+        sections = "\n\n".join(f"Part {i}:\n{summary}" for i, summary in enumerate(summaries, 1))
+        return (
+            f"The following are summaries of consecutive parts of the document titled '{title}'. "
+            "Combine them into one concise summary (around 3-4 paragraphs) of the key points of the "
+            "whole document. Your response should be only the summary text.\n\n" + sections
         )
 
-        json_schema = {
-            "type": "object",
-            "properties": {
-                "summary": {"type": "string", "description": "The concise 3-4 paragraph summary of the text."},
-                "flashcards": {
-                    "type": "array",
-                    "description": "A list of 5-10 detailed flashcards.",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "question": {"type": "string", "description": "The flashcard question."},
-                            "answer": {"type": "string", "description": "The detailed flashcard answer."}
-                        },
-                        "required": ["question", "answer"]
-                    }
-                }
-            },
-            "required": ["summary", "flashcards"]
+    @staticmethod
+    def _combine_parts(partials: list, summary: str) -> dict:
+        cards = [card for part in partials for card in part.get("flashcards", [])]
+        return {
+            "summary": summary,
+            "flashcards": dedupe_cards(cards, "question", limit=getattr(settings, 'AI_MAX_FLASHCARDS', 30)),
         }
 
-        user_prompt = f"Please process the following document titled '{title}'. Document text: \n\n{text_content}"
+    def _process_part(self, text_content: str, title: str, part: int = 1, parts: int = 1, model: str = None) -> dict:
+        response = self._generate(
+            'document', model or model_router.pro_model,
+            self._document_prompt(text_content, title, part, parts),
+            DOCUMENT_CONFIG,
+        )
+        # The response.text is a JSON string matching the schema
+        return json.loads(response.text)
+
+    def _compute_document(self, text_content: str, title: str, cache_key: str, request_fingerprint: str) -> dict:
+        # Short documents go to the fast model; no chunk exceeds the per-request token ceiling
+        route = model_router.route('document', text_content)
+        chunks = split_document(text_content, max_chars=model_router.chunk_chars(chunk_chars()))
+
+        if len(chunks) == 1:
+            result = self._process_part(chunks[0], title, model=route.model)
+        else:
+            partials = map_chunks(
+                lambda item: self._process_part(item[1], title, item[0], len(chunks), model=route.model),
+                list(enumerate(chunks, 1)),
+            )
+            response = self._generate(
+                'reduce', self.model,
+                self._reduce_prompt([p.get("summary", "") for p in partials], title),
+                dict(temperature=0.3),
+            )
+            result = self._combine_parts(partials, response.text)
+
+        document_cache.set(cache_key, result, request_fingerprint)
+        return result
+
+    def process_document(self, text_content: str, title: str) -> dict:
+        """
+        Summarizes a document and generates flashcards from the text.
+
+        Long documents are split on page/section boundaries and the parts are
+        processed concurrently (map); the part summaries are then merged and
+        the flashcards deduplicated (reduce), so nothing is truncated.
+        """
+
+        # Identical documents processed under the same model/schema/prompt are served from cache
+        request_fingerprint = document_fingerprint()
+        cache_key = content_key(text_content, request_fingerprint)
+        cached = document_cache.get(cache_key)
+        if cached is not None:
+            return {"title": title, **cached}
 
         try:
-            response = self.client.models.generate_content(
-                model='gemini-2.5-pro',  # Use a more capable model for complex summarization/card generation
-                contents=user_prompt,
-                config=dict(
-                    temperature=0.3,
-                    response_mime_type="application/json",
-                    response_schema=json_schema
-                ),
+            # Concurrent uploads of the same document wait for the first one's result
+            result = single_flight.do(
+                flight_key('process_document', cache_key),
+                lambda: self._compute_document(text_content, title, cache_key, request_fingerprint),
             )
+            return {"title": title, **result}
+
+        except APIError as e:
+            print(f"Gemini API Error (Document Processing): {e}")
+            return {"error": "API communication failed during document processing."}
+        except Exception as e:
+            print(f"General Error (Document Processing): {e}")
+            return {"error": "An internal error occurred during processing."}
+
+    # --- Async variants, used by the ASGI endpoints in async_views.py ---
 
-            # The response.text is a JSON string matching the schema
-            return {"title": title, **response.json()}
+    async def aget_ai_chat_response(self, prompt: str) -> str:
+        """Async version of `get_ai_chat_response`; frees the worker while the model generates."""
+        prompt = model_router.fit(prompt)
+        route = model_router.route('chat', prompt)
+
+        async def generate():
+            return (await self._agenerate('chat', route.model, prompt, dict(temperature=0.7))).text
+
+        try:
+            return await single_flight.ado(flight_key('chat', route.model, prompt), generate)
+        except APIError as e:
+            print(f"Gemini API Error (Chat): {e}")
+            return "Sorry, I ran into an issue communicating with the AI service."
+        except Exception as e:
+            print(f"General Error (Chat): {e}")
+            return "An unexpected error occurred."
+
+    async def aget_mood_suggestion(self, mood_code: str, notes: str = "") -> str:
+        """Async version of `get_mood_suggestion`."""
+        if not (notes or "").strip() and mood_suggestion_pool.supports(mood_code):
+            return mood_suggestion_pool.get(mood_code)
+
+        prompt = model_router.fit(self._mood_prompt(mood_code, notes))
+        route = model_router.route('mood', prompt)
+        try:
+            response = await self._agenerate('mood', route.model, prompt, dict(temperature=0.8))
+            return response.text
+        except APIError as e:
+            print(f"Gemini API Error (Mood): {e}")
+            return "Could not generate AI suggestion due to an API error."
+        except Exception as e:
+            print(f"General Error (Mood): {e}")
+            return "An unexpected error occurred."
+
+    async def _aprocess_part(self, text_content: str, title: str, part: int = 1, parts: int = 1,
+                             model: str = None) -> dict:
+        response = await self._agenerate(
+            'document', model or model_router.pro_model,
+            self._document_prompt(text_content, title, part, parts),
+            DOCUMENT_CONFIG,
+        )
+        return json.loads(response.text)
+
+    async def _acompute_document(self, text_content: str, title: str, cache_key: str,
+                                 request_fingerprint: str) -> dict:
+        route = model_router.route('document', text_content)
+        chunks = split_document(text_content, max_chars=model_router.chunk_chars(chunk_chars()))
+
+        if len(chunks) == 1:
+            result = await self._aprocess_part(chunks[0], title, model=route.model)
+        else:
+            partials = await amap_chunks(
+                lambda item: self._aprocess_part(item[1], title, item[0], len(chunks), model=route.model),
+                list(enumerate(chunks, 1)),
+            )
+            response = await self._agenerate(
+                'reduce', self.model,
+                self._reduce_prompt([p.get("summary", "") for p in partials], title),
+                dict(temperature=0.3),
+            )
+            result = self._combine_parts(partials, response.text)
+
+        await sync_to_async(document_cache.set)(cache_key, result, request_fingerprint)
+        return result
+
+    async def aprocess_document(self, text_content: str, title: str) -> dict:
+        """Async version of `process_document`."""
+        request_fingerprint = document_fingerprint()
+        cache_key = content_key(text_content, request_fingerprint)
+        cached = await sync_to_async(document_cache.get)(cache_key)
+        if cached is not None:
+            return {"title": title, **cached}
+
+        try:
+            result = await single_flight.ado(
+                flight_key('process_document', cache_key),
+                lambda: self._acompute_document(text_content, title, cache_key, request_fingerprint),
+            )
+            return {"title": title, **result}
 
         except APIError as e:
             print(f"Gemini API Error (Document Processing): {e}")
             return {"error": "API communication failed during document processing."}
         except Exception as e:
             print(f"General Error (Document Processing): {e}")
-            return {"error": "An internal error occurred during processing."}
\ No newline at end of file
+            return {"error": "An internal error occurred during processing."}
+
+
+def invalidate_document_cache(keep_current: bool = True) -> int:
+    """
+    Drops cached document results. By default only results produced under an
+    older model/schema/prompt are removed; pass keep_current=False to wipe all.
+    """
+    current = document_fingerprint() if keep_current else None
+    return document_cache.invalidate(keep_fingerprint=current)
+
+
+def _generate_pooled_mood_suggestions(mood_code: str, count: int) -> list:
+    return GeminiAIService().generate_mood_suggestions(mood_code, count)
+
+
+# Pregenerated mood suggestions, refilled in the background by the LLM
+mood_suggestion_pool = MoodSuggestionPool(_generate_pooled_mood_suggestions)
@@ -0,0 +1,107 @@
+# ai_app/suggestions.py
+
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+# Seed suggestions so the very first mood log of a process is served without an LLM call.
+SEED_SUGGESTIONS = {
+    'joy': [
+        "That's wonderful! Use this energy to plan your next task while you're feeling motivated.",
+        "Great mood! Tackle the task you've been putting off while the momentum is on your side.",
+    ],
+    'calm': [
+        "A sense of peace is great. Try a focused 25-minute study block to make the most of it.",
+        "Calm is a good state for deep work. Pick one important task and give it your full attention.",
+    ],
+    'neutral': [
+        "It's okay to feel neutral. A short walk or a change of scene could give your energy a lift.",
+        "Start with a small, easy task to build momentum, then move on to something bigger.",
+    ],
+    'tired': [
+        "Rest is productive. Schedule a short break and prioritize only your essential tasks today.",
+        "Try a 10-minute power nap or some water and fresh air before your next study session.",
+    ],
+    'stressed': [
+        "Take a deep breath. Step away for a 5-minute break, then split your biggest task into smaller steps.",
+        "Write down everything on your mind, then pick just one thing to do next. One step at a time.",
+    ],
+    'sad': [
+        "I'm sorry you're feeling down. Be kind to yourself and aim for one small accomplishment today.",
+        "Reach out to a friend or take a gentle walk. Small moments of connection can shift your day.",
+    ],
+}
+
+MOOD_CODES = tuple(SEED_SUGGESTIONS)
+
+
+class MoodSuggestionPool:
+    """
+    Per-mood pools of pre-generated suggestions.
+
+    `get()` pops a random suggestion in microseconds. When a mood's pool drops
+    to the low-water mark, a background worker asks `generator(mood_code, n)`
+    for a fresh batch, so the LLM stays off the request path.
+    """
+
+    def __init__(self, generator, pool_size: int = None, low_water: int = None):
+        self.generator = generator
+        self.pool_size = pool_size or getattr(settings, 'MOOD_SUGGESTION_POOL_SIZE', 8)
+        self.low_water = low_water if low_water is not None else getattr(settings, 'MOOD_SUGGESTION_LOW_WATER', 3)
+        self._lock = threading.Lock()
+        self._pools = {code: list(seeds) for code, seeds in SEED_SUGGESTIONS.items()}
+        self._refills = {}  # mood_code -> Future of an in-flight refill
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='mood-suggestions')
+
+    def supports(self, mood_code: str) -> bool:
+        return mood_code in self._pools
+
+    def get(self, mood_code: str) -> str:
+        """Serves a random pooled suggestion and schedules a refill if the pool is low."""
+        with self._lock:
+            pool = self._pools[mood_code]
+            if len(pool) > 1:
+                suggestion = pool.pop(random.randrange(len(pool)))
+            else:
+                # Never hand out the last one; repeat it until the refill lands
+                suggestion = pool[0]
+            low = len(pool) <= self.low_water
+
+        if low:
+            self._schedule_refill(mood_code)
+        return suggestion
+
+    def _schedule_refill(self, mood_code: str):
+        with self._lock:
+            in_flight = self._refills.get(mood_code)
+            if in_flight is not None and not in_flight.done():
+                return
+            self._refills[mood_code] = self._executor.submit(self.refill, mood_code)
+
+    def refill(self, mood_code: str):
+        """Tops up one mood's pool from the generator (runs on the background worker)."""
+        with self._lock:
+            missing = self.pool_size - len(self._pools[mood_code])
+        if missing <= 0:
+            return
+
+        try:
+            fresh = [s.strip() for s in self.generator(mood_code, missing) if s and s.strip()]
+        except Exception as e:
+            print(f"Mood suggestion refill failed for '{mood_code}': {e}")
+            return
+
+        with self._lock:
+            self._pools[mood_code].extend(fresh[:missing])
+
+    def wait_for_refills(self, timeout: float = None):
+        """Blocks until in-flight refills finish (useful at shutdown and in tests)."""
+        with self._lock:
+            futures = list(self._refills.values())
+        wait(futures, timeout=timeout)
+
+    def sizes(self) -> dict:
+        with self._lock:
+            return {code: len(pool) for code, pool in self._pools.items()}
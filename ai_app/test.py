@@ -1,8 +1,32 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+import fitz
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.test import AsyncClient, TestCase
 from django.urls import reverse
 from rest_framework.test import APIClient
 from django.contrib.auth import get_user_model
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
+from google.genai.errors import ClientError, ServerError
+from concurrent.futures import ThreadPoolExecutor
+
+from study_tools.models import StudyJob
+
+from .cache import DocumentResultCache, content_key
+from .chunking import PAGE_BREAK, dedupe_cards, map_chunks, split_document
+from .clients import GeminiClientRegistry
+from .coalescing import SingleFlight, flight_key
+from . import extraction
+from .benchmarking import CorpusDocument, generate_corpus, make_pdf
+from .models import DocumentResultCacheEntry
+from .resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, ResilientCaller
+from .routing import ModelRouter, estimate_tokens, trim_to_tokens
+from .suggestions import MoodSuggestionPool
 
 User = get_user_model()
 
@@ -38,3 +62,719 @@ class PlannerQueryViewTest(TestCase):
         self.assertEqual(response.status_code, 403)  # Forbidden
 
 # Add tests for MoodDetectionView and service layer if needed.
+
+
+class GeminiClientRegistryTest(TestCase):
+    def setUp(self):
+        self.registry = GeminiClientRegistry()
+
+    def test_client_is_reused_across_calls(self):
+        first = self.registry.get('test-key')
+        second = self.registry.get('test-key')
+
+        self.assertIs(first, second)
+        self.assertEqual(self.registry.stats(), {'clients': 1, 'hits': 1, 'misses': 1})
+
+    def test_concurrent_callers_share_one_client(self):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            clients = list(pool.map(lambda _: self.registry.get('test-key'), range(32)))
+
+        self.assertEqual(len({id(c) for c in clients}), 1)
+        self.assertEqual(self.registry.stats()['misses'], 1)
+
+    @patch.dict('os.environ', {}, clear=True)
+    def test_missing_api_key_raises(self):
+        with self.assertRaises(ValueError):
+            self.registry.get()
+
+
+class DocumentResultCacheTest(TestCase):
+    def setUp(self):
+        self.cache = DocumentResultCache(max_bytes=200)
+        self.result = {"summary": "s", "flashcards": [{"question": "q", "answer": "a"}]}
+
+    def test_key_depends_on_text_and_fingerprint(self):
+        self.assertEqual(content_key("text", "fp"), content_key("text", "fp"))
+        self.assertNotEqual(content_key("text", "fp"), content_key("text", "fp2"))
+        self.assertNotEqual(content_key("text", "fp"), content_key("text2", "fp"))
+
+    def test_miss_then_hit(self):
+        self.assertIsNone(self.cache.get("k"))
+        self.cache.set("k", self.result, "fp")
+
+        self.assertEqual(self.cache.get("k"), self.result)
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_lru_evicts_by_size_and_falls_back_to_db(self):
+        for i in range(10):
+            self.cache.set(f"k{i}", self.result, "fp")
+
+        self.assertGreater(self.cache.stats()['evictions'], 0)
+        self.assertLessEqual(self.cache.stats()['bytes'], 200)
+
+        # Evicted from memory, but still served by the persistent tier
+        self.assertEqual(self.cache.get("k0"), self.result)
+        self.assertEqual(self.cache.stats()['db_hits'], 1)
+
+    def test_invalidate_keeps_current_fingerprint(self):
+        self.cache.set("old", self.result, "old-fp")
+        self.cache.set("new", self.result, "new-fp")
+
+        self.assertEqual(self.cache.invalidate(keep_fingerprint="new-fp"), 1)
+        self.assertEqual(list(DocumentResultCacheEntry.objects.values_list('key', flat=True)), ["new"])
+
+
+class ProcessDocumentCacheTest(TestCase):
+    @patch.dict('os.environ', {'GEMINI_API_KEY': 'test-key'})
+    @patch('ai_app.services.GEMINI_API_KEY', 'test-key')
+    def test_repeat_upload_skips_the_model(self):
+        from .services import GeminiAIService, invalidate_document_cache
+
+        invalidate_document_cache(keep_current=False)
+        service = GeminiAIService()
+        with patch.object(service.client.models, 'generate_content') as mock_generate:
+            mock_generate.return_value.text = '{"summary": "s", "flashcards": []}'
+
+            first = service.process_document("same lecture text", "a.pdf")
+            second = service.process_document("same lecture text", "b.pdf")
+
+        self.assertEqual(mock_generate.call_count, 1)
+        self.assertEqual(first["summary"], second["summary"])
+        self.assertEqual(second["title"], "b.pdf")
+
+
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        self.flight = SingleFlight(wait_timeout=5, poll_interval=0.01)
+        self.key = flight_key('test', self._testMethodName)
+
+    def test_concurrent_identical_calls_share_one_upstream_call(self):
+        release, calls = threading.Event(), []
+
+        def slow_call():
+            calls.append(1)
+            release.wait(5)
+            return {"summary": "s"}
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(self.flight.do, self.key, slow_call) for _ in range(4)]
+            while self.flight.stats()['followers'] < 3:
+                pass
+            release.set()
+            results = [f.result() for f in futures]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"summary": "s"}] * 4)
+        self.assertEqual(self.flight.stats(), {'leaders': 1, 'followers': 3, 'in_flight': 0})
+
+    def test_followers_receive_the_leaders_error(self):
+        release = threading.Event()
+
+        def failing_call():
+            release.wait(5)
+            raise RuntimeError("upstream down")
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(self.flight.do, self.key, failing_call) for _ in range(2)]
+            while self.flight.stats()['followers'] < 1:
+                pass
+            release.set()
+            for future in futures:
+                with self.assertRaisesMessage(RuntimeError, "upstream down"):
+                    future.result()
+
+        # Nothing is left behind, so the next call runs again
+        self.assertEqual(self.flight.do(self.key, lambda: "ok"), "ok")
+
+    def test_waits_for_a_result_published_by_another_process(self):
+        lock_key, result_key = f"singleflight:lock:{self.key}", f"singleflight:result:{self.key}"
+        self.flight.cache.set(lock_key, -1, 60)
+
+        def other_process_finishes():
+            self.flight.cache.set(result_key, "from elsewhere", 60)
+            self.flight.cache.delete(lock_key)
+
+        timer = threading.Timer(0.05, other_process_finishes)
+        timer.start()
+        result = self.flight.do(self.key, lambda: self.fail("should not be called"))
+        timer.join()
+
+        self.assertEqual(result, "from elsewhere")
+        self.flight.cache.delete(result_key)
+
+    def test_async_calls_are_coalesced(self):
+        calls = []
+
+        async def slow_call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "reply"
+
+        async def run():
+            return await asyncio.gather(*(self.flight.ado(self.key, slow_call) for _ in range(3)))
+
+        self.assertEqual(asyncio.run(run()), ["reply"] * 3)
+        self.assertEqual(len(calls), 1)
+
+
+class MoodSuggestionPoolTest(TestCase):
+    def setUp(self):
+        self.calls = []
+
+        def generator(mood_code, count):
+            self.calls.append((mood_code, count))
+            return [f"{mood_code} tip {i}" for i in range(count)]
+
+        self.pool = MoodSuggestionPool(generator, pool_size=6, low_water=2)
+
+    def test_serves_without_calling_generator_when_stocked(self):
+        self.pool.refill('calm')
+        self.calls.clear()
+
+        suggestion = self.pool.get('calm')
+
+        self.assertTrue(suggestion)
+        self.assertEqual(self.calls, [])
+
+    def test_low_pool_is_refilled_in_background(self):
+        self.pool.get('stressed')
+        self.pool.wait_for_refills(timeout=5)
+
+        self.assertEqual(self.calls[0][0], 'stressed')
+        self.assertEqual(self.pool.sizes()['stressed'], 6)
+
+    def test_failed_refill_keeps_serving(self):
+        pool = MoodSuggestionPool(lambda mood, count: 1 / 0, pool_size=6, low_water=2)
+        for _ in range(5):
+            self.assertTrue(pool.get('sad'))
+        pool.wait_for_refills(timeout=5)
+
+    @patch.dict('os.environ', {'GEMINI_API_KEY': 'test-key'})
+    @patch('ai_app.services.GEMINI_API_KEY', 'test-key')
+    def test_only_notes_trigger_a_live_call(self):
+        from .services import GeminiAIService
+
+        service = GeminiAIService()
+        with patch.object(service.client.models, 'generate_content') as mock_generate, \
+                patch('ai_app.services.mood_suggestion_pool', self.pool):
+            mock_generate.return_value.text = "Live suggestion."
+
+            self.assertNotEqual(service.get_mood_suggestion('joy'), "Live suggestion.")
+            self.assertEqual(mock_generate.call_count, 0)
+
+            self.assertEqual(service.get_mood_suggestion('joy', "exam tomorrow"), "Live suggestion.")
+            self.assertEqual(mock_generate.call_count, 1)
+
+
+class AIChatStreamingTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('ai_app:ai_chat')
+
+    @patch('ai_app.views.GeminiAIService')
+    def test_stream_sends_chunks_as_events(self, mock_service):
+        mock_service.return_value.stream_ai_chat_response.return_value = iter(["Hel", "lo"])
+
+        response = self.client.post(f"{self.url}?stream=1", {"message": "hi"}, format='json')
+        body = b"".join(response.streaming_content).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(body, 'data: {"delta": "Hel"}\n\ndata: {"delta": "lo"}\n\nevent: done\ndata: {}\n\n')
+
+    @patch('ai_app.views.GeminiAIService')
+    def test_stream_failure_is_reported_as_error_event(self, mock_service):
+        def broken_stream(prompt):
+            yield "partial"
+            raise RuntimeError("upstream went away")
+
+        mock_service.return_value.stream_ai_chat_response.side_effect = broken_stream
+
+        response = self.client.post(self.url, {"message": "hi"}, format='json', HTTP_ACCEPT='text/event-stream')
+        body = b"".join(response.streaming_content).decode()
+
+        self.assertIn('data: {"delta": "partial"}', body)
+        self.assertTrue(body.endswith('event: error\ndata: {"error": "An unexpected error occurred."}\n\n'))
+
+    @patch('ai_app.views.GeminiAIService')
+    async def test_asgi_stream_sends_the_first_chunk_before_the_rest_exists(self, mock_service):
+        async def slow_stream(prompt):
+            for chunk in ("One", "Two", "Three"):
+                yield chunk
+                await asyncio.sleep(0.3)
+
+        mock_service.return_value.astream_ai_chat_response.side_effect = slow_stream
+
+        started = time.monotonic()
+        response = await AsyncClient().post(f"{self.url}?stream=1", {"message": "hi"},
+                                            content_type='application/json')
+        arrivals = []
+        async for part in response.streaming_content:
+            arrivals.append((time.monotonic() - started, part))
+
+        self.assertEqual(arrivals[0][1], b'data: {"delta": "One"}\n\n')
+        self.assertLess(arrivals[0][0], 0.3)  # not held back until the model finishes
+        self.assertGreaterEqual(arrivals[-1][0], 0.9)
+        mock_service.return_value.stream_ai_chat_response.assert_not_called()
+
+    @patch('ai_app.views.GeminiAIService')
+    def test_json_contract_is_unchanged(self, mock_service):
+        mock_service.return_value.get_ai_chat_response.return_value = "Hello"
+
+        response = self.client.post(self.url, {"message": "hi"}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"response": "Hello"})
+
+    def test_invalid_stream_request_is_an_error_event(self):
+        response = self.client.post(self.url, {}, format='json', HTTP_ACCEPT='text/event-stream')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.content.startswith(b'event: error\n'))
+
+
+class AsyncAIEndpointTest(TestCase):
+    def setUp(self):
+        self.async_client = AsyncClient()
+
+    @patch('ai_app.async_views.GeminiAIService')
+    async def test_chat_matches_sync_contract(self, mock_service):
+        mock_service.return_value.aget_ai_chat_response = AsyncMock(return_value="Hello")
+
+        response = await self.async_client.post(
+            reverse('ai_app:ai_chat_async'), {"message": "hi"}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"response": "Hello"})
+
+    @patch('ai_app.async_views.GeminiAIService')
+    async def test_mood_matches_sync_contract(self, mock_service):
+        mock_service.return_value.aget_mood_suggestion = AsyncMock(return_value="Take a break.")
+
+        response = await self.async_client.post(
+            reverse('ai_app:mood_log_save_async'), {"mood": "stressed"}, content_type='application/json')
+
+        self.assertEqual(response.json(), {"mood": "stressed", "ai_suggestion": "Take a break."})
+        mock_service.return_value.aget_mood_suggestion.assert_awaited_once_with("stressed", "")
+
+    async def test_serializer_validation_is_preserved(self):
+        response = await self.async_client.post(
+            reverse('ai_app:ai_chat_async'), {"message": "x" * 2001}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("message", response.json())
+
+    async def test_only_post_is_allowed(self):
+        response = await self.async_client.get(reverse('ai_app:ai_chat_async'))
+
+        self.assertEqual(response.status_code, 405)
+
+    async def test_study_tools_requires_a_file(self):
+        response = await self.async_client.post(reverse('ai_app:study_tools_async'))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "No PDF file uploaded."})
+
+    @patch('ai_app.async_views.GeminiAIService')
+    async def test_study_tools_answers_inline_without_a_job(self, mock_service):
+        result = {"summary": "Short.", "flashcards": [], "title": "notes.pdf"}
+        mock_service.return_value.aprocess_document = AsyncMock(return_value=result)
+        upload = SimpleUploadedFile("notes.pdf", make_pdf(["Cell biology"]), content_type="application/pdf")
+
+        response = await self.async_client.post(reverse('ai_app:study_tools_async'), {'pdf_file': upload})
+
+        self.assertEqual((response.status_code, response.json()), (200, result))
+        self.assertFalse(await StudyJob.objects.aexists())
+
+
+class DocumentChunkingTest(TestCase):
+    def test_short_document_is_one_chunk(self):
+        self.assertEqual(split_document("short text", max_chars=100), ["short text"])
+
+    def test_pages_are_packed_without_exceeding_limit(self):
+        pages = [f"page {i} " + "word " * 15 for i in range(10)]
+        chunks = split_document(PAGE_BREAK.join(pages), max_chars=200)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= 200 for chunk in chunks))
+        # Every page lands in exactly one chunk, in order
+        joined = "\n".join(chunks)
+        self.assertEqual([joined.index(f"page {i} ") for i in range(10)],
+                         sorted(joined.index(f"page {i} ") for i in range(10)))
+
+    def test_oversized_page_splits_on_sections_then_words(self):
+        page = "Intro paragraph.\n\n" + "alpha " * 100 + "\n\nClosing paragraph."
+        chunks = split_document(page, max_chars=120)
+
+        self.assertTrue(all(len(chunk) <= 120 for chunk in chunks))
+        self.assertIn("Intro paragraph.", chunks[0])
+        self.assertIn("Closing paragraph.", chunks[-1])
+        self.assertEqual(" ".join(chunks).count("alpha"), 100)
+
+    def test_map_keeps_chunk_order(self):
+        self.assertEqual(map_chunks(str.upper, ["a", "b", "c"], max_workers=3), ["A", "B", "C"])
+
+    def test_dedupe_ignores_case_and_punctuation(self):
+        cards = [{"question": "What is ATP?"}, {"question": "what is atp"}, {"question": "Define DNA."}]
+
+        self.assertEqual(dedupe_cards(cards, "question"), [cards[0], cards[2]])
+
+    @patch.dict('os.environ', {'GEMINI_API_KEY': 'test-key'})
+    @patch('ai_app.services.GEMINI_API_KEY', 'test-key')
+    def test_long_document_is_map_reduced(self):
+        from .services import GeminiAIService, invalidate_document_cache
+
+        invalidate_document_cache(keep_current=False)
+        service = GeminiAIService()
+        parts = [
+            {"summary": "first", "flashcards": [{"question": "Q1?", "answer": "A"}]},
+            {"summary": "second", "flashcards": [{"question": "q1", "answer": "A"}, {"question": "Q2", "answer": "B"}]},
+        ]
+        with self.settings(AI_DOCUMENT_CHUNK_CHARS=50), \
+                patch.object(service, '_process_part', side_effect=lambda text, title, part, parts_, model=None: parts[part - 1]) as mock_part, \
+                patch.object(service.client.models, 'generate_content') as mock_reduce:
+            mock_reduce.return_value.text = "merged summary"
+
+            result = service.process_document("a" * 40 + PAGE_BREAK + "b" * 40, "notes.pdf")
+
+        self.assertEqual(mock_part.call_count, 2)
+        self.assertEqual(result["summary"], "merged summary")
+        self.assertEqual([c["question"] for c in result["flashcards"]], ["Q1?", "Q2"])
+
+
+class ModelRoutingTest(TestCase):
+    def setUp(self):
+        self.router = ModelRouter(fast_model='fast', pro_model='pro', pro_min_tokens=100, max_request_tokens=1000)
+
+    def test_estimate_counts_words_and_punctuation(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("Hi, all!"), 4)
+        self.assertEqual(estimate_tokens("internationalization"), 5)
+
+    def test_trim_respects_the_ceiling(self):
+        trimmed = trim_to_tokens("word " * 500, 100)
+
+        self.assertLessEqual(estimate_tokens(trimmed), 100)
+        self.assertTrue(trimmed.startswith("word word"))
+
+    def test_only_long_documents_go_to_the_pro_model(self):
+        self.assertEqual(self.router.route('document', "short notes").model, 'fast')
+        self.assertEqual(self.router.route('document', "word " * 200).model, 'pro')
+        self.assertEqual(self.router.route('chat', "word " * 200).model, 'fast')
+        self.assertEqual(self.router.stats()['decisions'], {'document:fast': 1, 'document:pro': 1, 'chat:fast': 1})
+
+    def test_chunks_stay_under_the_request_ceiling(self):
+        self.assertEqual(self.router.chunk_chars(20000), (1000 - 500) * 4)
+        self.assertEqual(self.router.chunk_chars(100), 100)
+
+    def test_records_estimated_and_actual_tokens(self):
+        response = type('Response', (), {'usage_metadata': type('Usage', (), {'prompt_token_count': 120})()})()
+        self.router.record('document', 'pro', 100, response, 0.5)
+
+        calls = self.router.stats()['calls']['document:pro']
+        self.assertEqual((calls['estimated_tokens'], calls['actual_tokens']), (100, 120))
+        self.assertEqual(calls['actual_to_estimated'], 1.2)
+        self.assertEqual(calls['p95_seconds'], 0.5)
+
+    @patch.dict('os.environ', {'GEMINI_API_KEY': 'test-key'})
+    @patch('ai_app.services.GEMINI_API_KEY', 'test-key')
+    def test_short_document_is_processed_by_the_fast_model(self):
+        from .services import GeminiAIService, invalidate_document_cache, model_router
+
+        invalidate_document_cache(keep_current=False)
+        service = GeminiAIService()
+        with patch.object(service.client.models, 'generate_content') as mock_generate:
+            mock_generate.return_value.text = '{"summary": "s", "flashcards": []}'
+            service.process_document("a short handout", "handout.pdf")
+
+        self.assertEqual(mock_generate.call_args.kwargs['model'], model_router.fast_model)
+
+
+def unavailable():
+    return ServerError(503, {'error': {'message': 'unavailable', 'status': 'UNAVAILABLE'}})
+
+
+class FakeGeminiBackend:
+    """Local stand-in for the Gemini API; each call follows the next (delay, error) step of the script."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _step(self):
+        with self._lock:
+            index = self.calls
+            self.calls += 1
+        return index, self.script[min(index, len(self.script) - 1)]
+
+    def generate_content(self, **kwargs):
+        index, (delay, error) = self._step()
+        time.sleep(delay)
+        if error:
+            raise error
+        return SimpleNamespace(text=f"reply {index}", usage_metadata=None)
+
+    async def agenerate_content(self, **kwargs):
+        index, (delay, error) = self._step()
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return SimpleNamespace(text=f"reply {index}", usage_metadata=None)
+
+
+class ResilienceTest(TestCase):
+    def caller(self, **kwargs):
+        options = dict(breaker=CircuitBreaker(min_calls=4, error_rate=0.5, reset_timeout=60),
+                       deadlines={'chat': 1}, retries=2, backoff=0.01, hedge=False)
+        options.update(kwargs)
+        return ResilientCaller(**options)
+
+    def test_idempotent_calls_retry_upstream_failures(self):
+        backend, caller = FakeGeminiBackend((0, unavailable()), (0, None)), self.caller()
+
+        response = caller.call('chat', backend.generate_content, idempotent=True)
+
+        self.assertEqual((response.text, backend.calls), ("reply 1", 2))
+        self.assertEqual(caller.stats()['retries'], 1)
+
+    def test_non_idempotent_and_client_errors_are_not_retried(self):
+        backend, caller = FakeGeminiBackend((0, unavailable())), self.caller()
+        with self.assertRaises(ServerError):
+            caller.call('chat', backend.generate_content)
+
+        bad_request = FakeGeminiBackend((0, ClientError(400, {'error': {'message': 'bad', 'status': 'INVALID'}})))
+        with self.assertRaises(ClientError):
+            caller.call('chat', bad_request.generate_content, idempotent=True)
+        self.assertEqual((backend.calls, bad_request.calls), (1, 1))
+
+    def test_slow_upstream_hits_the_deadline(self):
+        backend, caller = FakeGeminiBackend((1, None)), self.caller(deadlines={'chat': 0.05})
+
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            caller.call('chat', backend.generate_content, idempotent=True)
+
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(caller.stats()['deadline_exceeded'], 1)
+
+    def test_breaker_fails_fast_then_probes(self):
+        now = [0.0]
+        breaker = CircuitBreaker(min_calls=4, error_rate=0.5, reset_timeout=30, clock=lambda: now[0])
+        backend, caller = FakeGeminiBackend((0, unavailable())), self.caller(breaker=breaker, retries=0)
+
+        for _ in range(4):
+            with self.assertRaises(ServerError):
+                caller.call('chat', backend.generate_content, idempotent=True)
+        with self.assertRaises(CircuitOpenError):
+            caller.call('chat', backend.generate_content, idempotent=True)
+
+        self.assertEqual(backend.calls, 4)
+        self.assertEqual(caller.stats()['breaker'],
+                         {'name': 'gemini', 'state': 'open', 'trips': 1, 'rejected': 1,
+                          'window_calls': 0, 'window_error_rate': 0.0})
+
+        # After the reset timeout one probe goes through and closes the breaker
+        now[0] = 31
+        backend.script = [(0, None)]
+        caller.call('chat', backend.generate_content, idempotent=True)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_hedged_request_wins_over_a_straggler(self):
+        backend = FakeGeminiBackend((1, None), (0, None))
+        caller = self.caller(hedge=True, hedge_min_samples=1, deadlines={'chat': 3})
+        caller._observe('chat', 0.02)
+
+        started = time.monotonic()
+        response = caller.call('chat', backend.generate_content, idempotent=True)
+
+        self.assertEqual(response.text, "reply 1")
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual((caller.stats()['hedges'], caller.stats()['hedge_wins']), (1, 1))
+
+    def test_async_calls_retry_and_respect_deadlines(self):
+        backend, caller = FakeGeminiBackend((0, unavailable()), (0, None)), self.caller()
+        response = asyncio.run(caller.acall('chat', backend.agenerate_content, idempotent=True))
+        self.assertEqual(response.text, "reply 1")
+
+        slow, caller = FakeGeminiBackend((1, None)), self.caller(deadlines={'chat': 0.05})
+        with self.assertRaises(DeadlineExceeded):
+            asyncio.run(caller.acall('chat', slow.agenerate_content))
+
+    def test_async_stream_failures_count_against_the_breaker(self):
+        async def start_stream():
+            async def chunks():
+                yield "partial"
+                raise unavailable()
+            return chunks()
+
+        async def consume(caller):
+            received = []
+            with self.assertRaises(ServerError):
+                async for chunk in caller.astream('chat', start_stream):
+                    received.append(chunk)
+            return received
+
+        caller = self.caller(breaker=CircuitBreaker(min_calls=1, error_rate=0.5, reset_timeout=60))
+        self.assertEqual(asyncio.run(consume(caller)), ["partial"])
+        self.assertEqual(caller.breaker.state, CircuitBreaker.OPEN)
+
+    @patch.dict('os.environ', {'GEMINI_API_KEY': 'test-key'})
+    @patch('ai_app.services.GEMINI_API_KEY', 'test-key')
+    def test_open_breaker_returns_the_canned_reply_without_calling_gemini(self):
+        from .services import GeminiAIService
+
+        caller = self.caller()
+        caller.breaker._trip()
+        service = GeminiAIService()
+        with patch('ai_app.services.gemini_resilience', caller), \
+                patch.object(service.client.models, 'generate_content') as mock_generate:
+            reply = service.get_ai_chat_response("hello there")
+
+        self.assertEqual(reply, "An unexpected error occurred.")
+        mock_generate.assert_not_called()
+
+    def test_metrics_are_staff_only(self):
+        url = reverse('ai_app:ai_metrics')
+        self.assertEqual(APIClient().get(url).status_code, 403)
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='ops', password='pw', is_staff=True))
+        response = client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('state', response.data['resilience']['breaker'])
+
+
+class PdfExtractionTest(TestCase):
+    def setUp(self):
+        self.pdf = make_pdf([f"Page number {i}" for i in range(1, 6)])
+
+    def test_both_backends_yield_pages_in_order(self):
+        for backend in ('pymupdf', 'pypdf'):
+            pages = [text.strip() for text in extraction.iter_pages(self.pdf, backend)]
+            self.assertEqual(pages, [f"Page number {i}" for i in range(1, 6)], backend)
+
+    def test_auto_picks_the_fastest_installed_backend(self):
+        self.assertEqual(extraction.choose_backend('auto'), 'pymupdf')
+        with patch.object(extraction, 'fitz', None):
+            self.assertEqual(extraction.choose_backend('auto'), 'pypdf')
+
+    def test_character_budget_stops_parsing_early(self):
+        parsed = []
+        iter_pages = extraction.iter_pages
+
+        def counting_pages(source, backend=None, parallel=None):
+            for text in iter_pages(source, backend, parallel):
+                parsed.append(text)
+                yield text
+
+        with patch.object(extraction, 'iter_pages', counting_pages):
+            text = extraction.extract_text(SimpleUploadedFile("a.pdf", self.pdf), max_chars=20)
+
+        self.assertEqual(len(text), 20)
+        self.assertTrue(text.startswith("Page number 1"))
+        self.assertEqual(len(parsed), 2)
+
+    def test_token_budget_and_page_breaks(self):
+        full = extraction.extract_text(self.pdf)
+        self.assertEqual(full.count(PAGE_BREAK), 5)
+
+        limited = extraction.extract_text(self.pdf, max_tokens=8)
+        self.assertLessEqual(estimate_tokens(limited), 8)
+        self.assertIn("Page number 1", limited)
+        self.assertNotIn("Page number 3", limited)
+
+
+class ZeroCopyUploadTest(TestCase):
+    def setUp(self):
+        self.pdf = make_pdf(["First page", "Second page"])
+
+    def test_temporary_upload_is_read_from_its_path(self):
+        upload = TemporaryUploadedFile("big.pdf", "application/pdf", len(self.pdf), None)
+        upload.write(self.pdf)
+        upload.flush()
+
+        with patch.object(TemporaryUploadedFile, 'read', property(self.fail)):
+            text, digest = extraction.extract_text_and_digest(upload)
+
+        self.assertEqual(extraction.PdfSource(upload).path, upload.temporary_file_path())
+        self.assertIn("Second page", text)
+        self.assertEqual(digest, hashlib.sha256(self.pdf).hexdigest())
+        upload.close()
+
+    def test_in_memory_upload_is_shared_not_copied(self):
+        upload = SimpleUploadedFile("small.pdf", self.pdf)
+
+        with patch.object(SimpleUploadedFile, 'read', property(self.fail)):
+            with extraction.PdfSource(upload) as pdf:
+                self.assertIsNone(pdf.path)
+                self.assertIsInstance(pdf.view(), memoryview)
+                text = extraction.extract_text(pdf, backend='pypdf')
+                digest = pdf.sha256()
+
+        self.assertIn("First page", text)
+        self.assertEqual(digest, hashlib.sha256(self.pdf).hexdigest())
+        # The view was released, so the upload's buffer is writable again
+        upload.file.write(b"%")
+
+
+class ParallelExtractionTest(TestCase):
+    def tearDown(self):
+        extraction.shutdown_pool()
+
+    def test_pool_keeps_page_order(self):
+        pdf = make_pdf([f"Page number {i}" for i in range(1, 12)])
+        with self.settings(PDF_EXTRACTION_PROCESSES=3):
+            pages = [text.strip() for text in extraction.iter_pages(pdf, parallel=True)]
+            text = extraction.extract_text(SimpleUploadedFile("a.pdf", pdf), parallel=True)
+
+        self.assertEqual(pages, [f"Page number {i}" for i in range(1, 12)])
+        self.assertEqual(text, extraction.extract_text(pdf, parallel=False))
+
+    def test_budget_stops_the_pool_early(self):
+        pdf = make_pdf([f"Page number {i}" for i in range(1, 12)])
+        with self.settings(PDF_EXTRACTION_PROCESSES=2):
+            text = extraction.extract_text(pdf, max_chars=30, parallel=True)
+
+        self.assertEqual(text, extraction.extract_text(pdf, max_chars=30, parallel=False))
+
+    def test_small_files_are_extracted_inline(self):
+        pdf = make_pdf(["tiny"])
+        with self.settings(PDF_EXTRACTION_PROCESSES=4), \
+                patch.object(extraction, 'process_pool') as mock_pool:
+            self.assertFalse(extraction.should_parallelize(pdf))
+            self.assertIn("tiny", extraction.extract_text(pdf))
+
+        mock_pool.assert_not_called()
+
+
+class BenchmarkCorpusTest(TestCase):
+    def test_corpus_documents_have_the_requested_shape(self):
+        spec = (CorpusDocument('deck', pages=4, words_per_page=50, images_per_page=2),)
+        with tempfile.TemporaryDirectory() as directory:
+            path, = generate_corpus(directory, spec, scale=0.5)
+            doc = fitz.open(path)
+            self.assertEqual(doc.page_count, 2)
+            self.assertEqual(len(doc[0].get_images()), 2)
+            self.assertEqual(len(doc[1].get_text().split()), 52)  # "Page 2" plus the words
+            doc.close()
+
+            # Deterministic, so an existing file is reused rather than regenerated
+            with patch('ai_app.benchmarking.synthetic_pdf') as mock_generate:
+                self.assertEqual(generate_corpus(directory, spec, scale=0.5), [path])
+            mock_generate.assert_not_called()
+
+
+class StudyToolsJobTest(TestCase):
+    @patch('ai_app.views.enqueue_study_job')
+    def test_upload_is_accepted_as_a_background_job(self, mock_enqueue):
+        upload = SimpleUploadedFile("lecture.pdf", b"%PDF-1.4", content_type="application/pdf")
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            response = APIClient().post(reverse('ai_app:study_tools'), {'pdf_file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 202)
+        job = StudyJob.objects.get(id=response.data['job_id'])
+        self.assertEqual((job.kind, job.title), ('SUMMARY', 'lecture.pdf'))
+        self.assertEqual(response.data['status_url'], reverse('st:job_status', args=[job.id]))
+        mock_enqueue.assert_called_once_with(job)
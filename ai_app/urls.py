@@ -1,7 +1,7 @@
 # ai_app/urls.py
 
 from django.urls import path
-from . import views
+from . import async_views, views
 
 # Add this line to define the application namespace
 app_name = 'ai_app'
@@ -18,7 +18,7 @@ urlpatterns = [
 ]# ai_app/urls.py
 
 from django.urls import path
-from . import views
+from . import async_views, views
 
 # Add this line to define the application namespace
 app_name = 'ai_app'
@@ -34,4 +34,12 @@ urlpatterns = [
     path('study-tools/', views.StudyToolsView.as_view(), name='study_tools'),
 
     path('mood/save/', views.MoodLogView.as_view(), name='mood_log_save'),
+
+    # Async (ASGI) versions of the AI endpoints; same request/response contracts
+    path('async/ai/plan/', async_views.ai_chat, name='ai_chat_async'),
+    path('async/mood/save/', async_views.mood_log, name='mood_log_save_async'),
+    path('async/study-tools/', async_views.study_tools, name='study_tools_async'),
+
+    # Breaker state, routing and cache counters for this worker (staff only)
+    path('ai/metrics/', views.AIMetricsView.as_view(), name='ai_metrics'),
 ]
\ No newline at end of file
@@ -1,33 +1,55 @@
 # ai_app/utils.py
 
-import fitz  # PyMuPDF
-from io import BytesIO
+from asgiref.sync import sync_to_async
 
+from .extraction import PdfSource, extract_text, max_document_chars
 
-def extract_text_from_pdf(pdf_file) -> str:
+
+def extract_text_from_pdf(pdf_file, max_chars: int = None) -> str:
     """
-    Extracts all text from an uploaded PDF file using PyMuPDF (fitz).
+    Extracts the text from an uploaded PDF file (see extraction.py).
 
     Args:
         pdf_file: A Django UploadedFile object.
+        max_chars: Stop parsing once this many characters are extracted
+            (defaults to AI_MAX_DOCUMENT_CHARS).
 
     Returns:
-        The concatenated text content of the PDF.
+        The text content of the PDF, pages separated by a form feed.
     """
-    text = ""
+    from users.models import ResourceText
+
+    max_chars = max_chars or max_document_chars()
     try:
-        # Read file content into a memory stream
-        pdf_data = pdf_file.read()
-        pdf_stream = BytesIO(pdf_data)
+        with PdfSource(pdf_file) as pdf:
+            # A library document with identical content has already been parsed
+            stored = ResourceText.objects.stored_text(pdf.sha256())
+            if stored is not None:
+                return stored[:max_chars]
+            return extract_text(pdf, max_chars=max_chars)
+
+    except Exception as e:
+        print(f"Error extracting text from PDF: {e}")
+        return ""
 
-        # Open PDF from memory stream
-        doc = fitz.open(stream=pdf_stream, filetype="pdf")
 
-        for page in doc:
-            text += page.get_text()
+async def aextract_text_from_pdf(pdf_file, max_chars: int = None) -> str:
+    """
+    extract_text_from_pdf() for async views. Hashing and parsing are CPU-bound
+    and run on a worker thread off the event loop; the stored-text lookup is a
+    query, so it runs thread-sensitively, where Django manages the connection.
+    """
+    from users.models import ResourceText
 
-        return text
+    max_chars = max_chars or max_document_chars()
+    try:
+        with PdfSource(pdf_file) as pdf:
+            digest = await sync_to_async(pdf.sha256, thread_sensitive=False)()
+            stored = await sync_to_async(ResourceText.objects.stored_text)(digest)
+            if stored is not None:
+                return stored[:max_chars]
+            return await sync_to_async(extract_text, thread_sensitive=False)(pdf, max_chars=max_chars)
 
     except Exception as e:
         print(f"Error extracting text from PDF: {e}")
-        return ""
\ No newline at end of file
+        return ""
@@ -1,8 +1,14 @@
 # ai_app/views.py
 
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from google.genai.errors import APIError
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.settings import api_settings
 from drf_yasg.utils import swagger_auto_schema
 
 from .models import MoodLog
@@ -11,14 +17,38 @@ from .serializers import MoodLogSerializer, MoodLogFetchSerializer
 from .serializers import (
     ChatRequestSerializer, ChatResponseSerializer,
     MoodRequestSerializer, MoodResponseSerializer,
-    StudyToolResponseSerializer
 )
+from .cache import document_cache
+from .clients import client_registry
+from .coalescing import single_flight
+from .renderers import EventStreamRenderer, sse_event
+from .resilience import gemini_resilience
+from .routing import model_router
 from .services import GeminiAIService
-from .utils import extract_text_from_pdf
+from study_tools.celery import enqueue_study_job
+from study_tools.models import StudyJob
+
+
+def build_chat_prompt(user_message: str) -> str:
+    """Contextual prompt for the assistant."""
+    return (
+        "You are SmartAid, a supportive and actionable productivity and wellness companion. "
+        "Keep your responses concise and focused on planning, tracking, or brainstorming. "
+        f"User message: {user_message}"
+    )
+
+
+def wants_stream(request) -> bool:
+    """Streaming is opt-in (`?stream=1` or `Accept: text/event-stream`) so JSON API clients are unaffected."""
+    return (
+        request.query_params.get('stream') in ('1', 'true')
+        or 'text/event-stream' in request.headers.get('Accept', '')
+    )
 
 
 class AIChatView(APIView):
     """API endpoint for AI Assistant chat interaction."""
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
 
     @swagger_auto_schema(request_body=ChatRequestSerializer, responses={200: ChatResponseSerializer})
     def post(self, request):
@@ -29,12 +59,11 @@ class AIChatView(APIView):
                 ai_service = GeminiAIService()
                 user_message = serializer.validated_data['message']
 
-                # Contextual prompt for the assistant
-                system_prompt = (
-                    "You are SmartAid, a supportive and actionable productivity and wellness companion. "
-                    "Keep your responses concise and focused on planning, tracking, or brainstorming. "
-                    f"User message: {user_message}"
-                )
+                system_prompt = build_chat_prompt(user_message)
+
+                if wants_stream(request):
+                    return self.stream_response(ai_service, system_prompt,
+                                                asgi=isinstance(request._request, ASGIRequest))
 
                 ai_response = ai_service.get_ai_chat_response(system_prompt)
 
@@ -49,6 +78,46 @@ class AIChatView(APIView):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @staticmethod
+    def stream_error_event(e) -> str:
+        if isinstance(e, APIError):
+            print(f"Gemini API Error (Chat Stream): {e}")
+            return sse_event({'error': "Sorry, I ran into an issue communicating with the AI service."},
+                             event='error')
+        print(f"General Error (Chat Stream): {e}")
+        return sse_event({'error': "An unexpected error occurred."}, event='error')
+
+    @classmethod
+    def stream_response(cls, ai_service, prompt, asgi=False):
+        """
+        Relays model chunks to the browser as Server-Sent Events.
+
+        Under ASGI the events come from an async generator on the async
+        Gemini client: Django would read a sync iterator to the end before
+        sending anything. WSGI servers iterate the sync one as it goes.
+        """
+
+        def events():
+            try:
+                for chunk in ai_service.stream_ai_chat_response(prompt):
+                    yield sse_event({'delta': chunk})
+                yield sse_event({}, event='done')
+            except Exception as e:
+                yield cls.stream_error_event(e)
+
+        async def aevents():
+            try:
+                async for chunk in ai_service.astream_ai_chat_response(prompt):
+                    yield sse_event({'delta': chunk})
+                yield sse_event({}, event='done')
+            except Exception as e:
+                yield cls.stream_error_event(e)
+
+        response = StreamingHttpResponse(aevents() if asgi else events(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+        return response
+
 
 # -----------------------------------------------------------------------------
 
@@ -94,39 +163,28 @@ class StudyToolsView(APIView):
 
     # We use manual handling instead of request_body for file upload in swagger
     def post(self, request, format=None):
-        """Handles POST request for file upload and processing."""
+        """
+        Handles POST request for file upload and queues the processing.
+
+        Extraction and the AI call run in a background job, so this responds
+        202 with a job id immediately. Poll `status_url` for progress; the
+        finished job's `result` has the StudyToolResponseSerializer shape.
+        """
 
         if 'pdf_file' not in request.FILES:
             return Response({"error": "No PDF file uploaded."}, status=status.HTTP_400_BAD_REQUEST)
 
         pdf_file = request.FILES['pdf_file']
-        title = pdf_file.name
-
-        # 1. Extract Text from PDF
-        text_content = extract_text_from_pdf(pdf_file)
-
-        if not text_content:
-            return Response(
-                {"error": "Could not extract text from the PDF file. Check if it's a valid text-based PDF."},
-                status=status.HTTP_400_BAD_REQUEST)
+        user = request.user if request.user.is_authenticated else None
 
-        # 2. Process Document via AI
-        try:
-            ai_service = GeminiAIService()
-            processed_data = ai_service.process_document(text_content, title)
+        job = StudyJob.objects.create(user=user, kind='SUMMARY', title=pdf_file.name, file=pdf_file)
+        enqueue_study_job(job)
 
-            if 'error' in processed_data:
-                return Response({"error": processed_data['error']}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            # 3. Serialize and return structured response
-            response_serializer = StudyToolResponseSerializer(processed_data)
-            return Response(response_serializer.data, status=status.HTTP_200_OK)
-
-        except ValueError as e:
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        except Exception as e:
-            return Response({"error": "An error occurred during AI document processing."},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({
+            "status": "queued",
+            "job_id": str(job.id),
+            "status_url": reverse('st:job_status', args=[job.id]),
+        }, status=status.HTTP_202_ACCEPTED)
 
     class MoodLogView(APIView):
         """Handles logging and fetching user mood data."""
@@ -175,4 +233,18 @@ class StudyToolsView(APIView):
             latest_logs = MoodLog.objects.all()[:5]
             # Use the MoodLogFetchSerializer to format the output
             serializer = MoodLogFetchSerializer(latest_logs, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+            return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class AIMetricsView(APIView):
+    """Per-process AI metrics for staff: circuit breaker, routing, coalescing and cache counters."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "resilience": gemini_resilience.stats(),
+            "routing": model_router.stats(),
+            "coalescing": single_flight.stats(),
+            "document_cache": document_cache.stats(),
+            "clients": client_registry.stats(),
+        })
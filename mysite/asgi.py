@@ -12,6 +12,7 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import peer_connect.routing # Import your app's routing
+from peer_connect.writebehind import lifespan
 
 # Set up Django environment
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
@@ -25,4 +26,6 @@ application = ProtocolTypeRouter({
             peer_connect.routing.websocket_urlpatterns
         )
     ),
+    # Saves buffered chat messages on shutdown (servers that send lifespan events)
+    "lifespan": lifespan,
 })
@@ -89,6 +89,22 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Chat versions and memberships (peer_connect.polling) and AI request locks
+# live here. A per-process cache is fine for one worker; with several, they
+# only see each other's chat messages once a version expires.
+# For production, share it with Redis like the channel layer:
+# "BACKEND": "django.core.cache.backends.redis.RedisCache",
+# "LOCATION": "redis://localhost:6379/1",
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "smartaid",
+        # One key per chat group plus one per member polling it; the default of
+        # 300 culled group versions and turned ring reads into rebuilds
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    },
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -3,10 +3,12 @@ URL configuration for mysite project.
 ...
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings  # Import settings
 from django.conf.urls.static import static  # Import static
 
+from users.storage import BLOB_DIR, serve_blob
+
 # You MUST NOT have 'from . import views' here. Instead, route to the app.
 
 
@@ -25,6 +27,9 @@ if settings.DEBUG:
     # This line serves your static files (like CSS, JS)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
+    # Content-addressed uploads get long-lived cache headers (configure the same in production)
+    urlpatterns += [re_path(rf'^{settings.MEDIA_URL.lstrip("/")}{BLOB_DIR}/(?P<path>.*)$', serve_blob)]
+
     # 🌟 THIS LINE FIXES YOUR MEDIA FILE 404 ERROR 🌟
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
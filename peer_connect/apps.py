@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
+
+
+def forget_cached_membership(sender, instance, **kwargs):
+    """Stops polls trusting a membership that was just removed (or whose group was deleted)."""
+    from .polling import forget_membership
+    forget_membership(instance.group_id, instance.user_id)
+
+
+def forget_deleted_group(sender, instance, **kwargs):
+    from .history import forget_group
+    forget_group(instance.pk)
 
 
 class PeerConnectConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'peer_connect'
+
+    def ready(self):
+        from .models import GroupMembership, StudyGroup
+
+        post_delete.connect(forget_cached_membership, sender=GroupMembership)
+        post_delete.connect(forget_deleted_group, sender=StudyGroup)
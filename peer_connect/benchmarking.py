@@ -0,0 +1,46 @@
+# peer_connect/benchmarking.py
+#
+# Drives ChatConsumer over the ASGI WebSocket protocol, the way a browser
+# would, without a server. Used by the benchmark_chat command and the tests.
+
+import json
+
+from asgiref.testing import ApplicationCommunicator
+from channels.routing import URLRouter
+
+from .routing import websocket_urlpatterns
+
+
+def chat_path(group) -> str:
+    return f"/ws/chat/{group.id}/"
+
+
+class ChatSocket:
+    """One client connection to the chat consumer, authenticated as `user`."""
+
+    def __init__(self, user, path):
+        scope = {'type': 'websocket', 'path': path, 'user': user, 'headers': [], 'subprotocols': []}
+        self.communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+
+    async def connect(self, timeout=3):
+        """Sends the handshake; returns the consumer's answer (a refused user gets a close right after it)."""
+        await self.communicator.send_input({'type': 'websocket.connect'})
+        return await self.communicator.receive_output(timeout=timeout)
+
+    async def send(self, data):
+        await self.communicator.send_input({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def receive(self, timeout=3):
+        frame = await self.communicator.receive_output(timeout=timeout)
+        return json.loads(frame['text'])
+
+    async def receive_message(self, timeout=3):
+        """The next 'message' frame, skipping the 'saved' frames that follow each batch insert."""
+        while True:
+            frame = await self.receive(timeout=timeout)
+            if frame['type'] == 'message':
+                return frame
+
+    async def close(self, timeout=3):
+        await self.communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await self.communicator.wait(timeout=timeout)
@@ -1,72 +1,124 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from asgiref.sync import sync_to_async
-from .models import StudyGroup, GroupMessage
-from django.contrib.auth.models import User
+from channels.db import database_sync_to_async
+from .history import message_page
+from .models import GroupMembership, GroupMessage
+from .writebehind import message_buffer
+
+# Close codes for refused connections (4000-4999 are free for applications)
+CLOSE_UNAUTHENTICATED = 4401
+CLOSE_NOT_A_MEMBER = 4403
+
+
+def room_channel(group_id) -> str:
+    """The channel layer group of a study group's sockets."""
+    return 'chat_%s' % group_id
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    Live chat for one study group. Every frame sent to the client is JSON
+    with a `type`: 'history' (the recent messages, once on connect),
+    'message' (one new message), 'saved' (the ids of messages sent live,
+    by key) or 'error' (with the `message` it is about when one of the
+    user's messages could not be saved). Messages use the same shape as
+    the fetch_messages view, so the page renders both the same way.
+
+    The user and their membership of the group are checked once, in
+    connect(). After that a message is broadcast straight away and saved
+    in a batch by the write-behind buffer (writebehind.py), so live
+    messages carry no `id` yet, only their `key`; clients tell messages
+    apart by key everywhere and learn the ids from the 'saved' frame.
+    """
+
     async def connect(self):
-        # Use the group name from the URL path, converted back from slug
-        self.group_name_slug = self.scope['url_route']['kwargs']['group_name']
-        self.group_name = self.group_name_slug.replace('_', ' ')
-        self.group_channel_name = 'chat_%s' % self.group_name_slug
+        self.user = self.scope['user']
+        self.group_id = int(self.scope['url_route']['kwargs']['group_id'])
+        self.group_channel_name = room_channel(self.group_id)
+
+        # 1. Turn away anonymous users and non-members. Accepted first: closing
+        # before accept rejects the handshake with an HTTP 403, and the browser
+        # then only sees close code 1006, not why
+        if self.user.is_anonymous:
+            refused = CLOSE_UNAUTHENTICATED
+        elif not await self.is_member(self.user, self.group_id):
+            refused = CLOSE_NOT_A_MEMBER
+        else:
+            refused = None
+        if refused is not None:
+            await self.accept()
+            await self.close(code=refused)
+            return
 
-        # 1. Join room group
+        # 2. Join room group
         await self.channel_layer.group_add(
             self.group_channel_name,
             self.channel_name
         )
 
-        # 2. Accept the connection
+        # 3. Accept the connection
         await self.accept()
 
+        # 4. Backfill the recent history (the same page as the first HTTP fetch);
+        # anything sent from here on arrives live
+        messages, has_more = await self.recent_messages(self.group_id)
+        await self.send_json({'type': 'history', 'messages': messages, 'has_more': has_more})
+
     async def disconnect(self, close_code):
-        # Leave room group
+        # Leave room group (a no-op if the connection was refused)
         await self.channel_layer.group_discard(
             self.group_channel_name,
             self.channel_name
         )
+        # Don't leave this user's messages waiting on a timer
+        await message_buffer().drain()
 
     # Receive message from WebSocket
     async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json['message']
+        try:
+            content = str(json.loads(text_data).get('message', '')).strip()
+        except (ValueError, AttributeError):
+            await self.send_json({'type': 'error', 'error': 'Invalid JSON format.'})
+            return
 
-        user = self.scope['user']
-        if user.is_anonymous:
-             return # Reject messages from anonymous users
+        if not content:
+            await self.send_json({'type': 'error', 'error': 'Message content cannot be empty.'})
+            return
 
-        # 3. Save the message to the database asynchronously
-        await self.save_message(user, self.group_name, message)
+        # 5. Queue the message for the next batch insert
+        message = GroupMessage(group_id=self.group_id, user=self.user, content=content)
+        message_buffer().add(message, self.channel_name)
 
-        # 4. Send message to room group
+        # 6. Send message to room group (including this socket, which renders it on arrival)
         await self.channel_layer.group_send(
             self.group_channel_name,
             {
                 'type': 'chat.message',
-                'message': message,
-                'username': user.username
+                'message': message.to_dict(),
             }
         )
 
     # Receive message from room group
     async def chat_message(self, event):
-        message = event['message']
-        username = event['username']
-
-        # 5. Send message back to WebSocket
-        await self.send(text_data=json.dumps({
-            'message': message,
-            'username': username
-        }))
-
-    @sync_to_async
-    def save_message(self, user, group_name, content):
-        """Helper function to save the message in the database."""
-        # Note: Must use exact name for lookup
-        group = StudyGroup.objects.get(name=group_name)
-        GroupMessage.objects.create(
-            group=group,
-            user=user,
-            content=content
-        )
+        await self.send_json({'type': 'message', 'message': event['message']})
+
+    # The ids of messages broadcast before they were saved
+    async def chat_saved(self, event):
+        await self.send_json({'type': 'saved', 'messages': event['messages']})
+
+    # Sent to this socket alone when one of its messages couldn't be saved
+    async def chat_dropped(self, event):
+        await self.send_json({'type': 'error', 'error': 'Your message could not be saved.',
+                              'message': event['message']})
+
+    async def send_json(self, data):
+        await self.send(text_data=json.dumps(data))
+
+    @database_sync_to_async
+    def is_member(self, user, group_id):
+        # One query; a group that doesn't exist has no members
+        return GroupMembership.objects.filter(group_id=group_id, user=user).exists()
+
+    @database_sync_to_async
+    def recent_messages(self, group_id):
+        return message_page(group_id)
@@ -0,0 +1,142 @@
+# peer_connect/history.py
+#
+# Pages of a group's chat history, by message id (keyset pagination). A
+# page is one range scan of the (group, id) index, however deep in the
+# history it is, and messages that share a timestamp can't be skipped or
+# repeated between pages.
+#
+# The latest page of each group is also kept in memory (a ring of recent
+# messages), so opening a chat room normally costs no query: the page, its
+# socket's history and the first fetch are all served from it. Saves in
+# this process append to the ring. A ring that is behind the group's
+# version may have missed a message saved by another process, and is
+# rebuilt from the database the next time it is read. The version comes
+# from the cache, or from one MAX(id) query once it has expired there
+# (polling.latest_version), so a ring read never costs more than that
+# unless the ring really is stale.
+
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import GroupMessage
+from .polling import bump_version, latest_version, version_key, version_ttl
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+def ring_size() -> int:
+    return getattr(settings, 'CHAT_RECENT_MESSAGES', PAGE_SIZE)
+
+
+def max_rings() -> int:
+    return getattr(settings, 'CHAT_RECENT_GROUPS', 500)
+
+
+def message_page(group_id, after_id=None, before_id=None, limit=PAGE_SIZE):
+    """
+    Up to `limit` messages of a group as dicts, oldest first, and whether there are more.
+
+    With `after_id`, the messages that follow it ("more": newer ones are
+    left). With `before_id`, the ones just before it, for scrolling back
+    ("more": older ones are left). With neither, the latest messages,
+    from the group's ring when it holds that many.
+    """
+    if after_id is None and before_id is None and limit <= ring_size():
+        return recent_messages(group_id, limit)
+    return _query_page(group_id, after_id, before_id, limit)
+
+
+def _query_page(group_id, after_id, before_id, limit):
+    rows = GroupMessage.objects.filter(group_id=group_id).values(*GroupMessage.VALUE_FIELDS)
+    if after_id is not None:
+        rows = list(rows.filter(id__gt=after_id).order_by('id')[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        if before_id is not None:
+            rows = rows.filter(id__lt=before_id)
+        rows = list(rows.order_by('-id')[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit][::-1]
+    return [GroupMessage.values_to_dict(row) for row in rows], has_more
+
+
+# --- Recent messages ---
+
+class _Ring:
+    __slots__ = ('messages', 'has_more')
+
+    def __init__(self, messages, has_more):
+        self.messages = messages  # dicts, ascending ids
+        self.has_more = has_more  # older messages exist beyond the ring
+
+    @property
+    def latest_id(self):
+        return self.messages[-1]['id'] if self.messages else 0
+
+
+_rings = OrderedDict()  # group id -> _Ring, least recently used first
+_rings_lock = threading.Lock()
+
+
+def recent_messages(group_id, limit=PAGE_SIZE):
+    """The latest `limit` messages of a group (at most ring_size()) and whether older ones exist."""
+    with _rings_lock:
+        cached = group_id in _rings
+    if cached:
+        version = latest_version(group_id)  # outside the lock: it may query
+        with _rings_lock:
+            ring = _rings.get(group_id)
+            if ring is not None and ring.latest_id == version:
+                _rings.move_to_end(group_id)
+                return ring.messages[-limit:], ring.has_more or len(ring.messages) > limit
+
+    # Not in memory (first read, restart, eviction) or stale: one query rebuilds it
+    ring = _Ring(*_query_page(group_id, None, None, ring_size()))
+    with _rings_lock:
+        _rings[group_id] = ring
+        _rings.move_to_end(group_id)
+        while len(_rings) > max_rings():
+            _rings.popitem(last=False)
+    # The ring holds the newest message, so it also knows the group's version
+    cache.add(version_key(group_id), ring.latest_id, version_ttl())
+    return ring.messages[-limit:], ring.has_more or len(ring.messages) > limit
+
+
+def _remember(group_id, messages):
+    version = cache.get(version_key(group_id))
+    with _rings_lock:
+        ring = _rings.get(group_id)
+        if ring is None:
+            return
+        # The new messages must follow the ring, and a cached version must not
+        # be past it (a message saved elsewhere). An expired version says
+        # nothing, so a quiet room keeps its ring
+        if (min(message['id'] for message in messages) <= ring.latest_id
+                or (version is not None and version != ring.latest_id)):
+            del _rings[group_id]  # rebuilt on the next read
+            return
+        # A new list, so pages already handed out don't change
+        combined = sorted(ring.messages + messages, key=lambda message: message['id'])
+        overflow = len(combined) - ring_size()
+        if overflow > 0:
+            combined, ring.has_more = combined[overflow:], True
+        ring.messages = combined
+
+
+def messages_saved(group_id, messages):
+    """
+    Records newly saved messages of a group (dicts with ids, ascending):
+    adds them to its ring, then bumps its polling version.
+    """
+    _remember(group_id, messages)
+    bump_version(group_id, messages[-1]['id'])
+
+
+def forget_group(group_id):
+    with _rings_lock:
+        _rings.pop(group_id, None)
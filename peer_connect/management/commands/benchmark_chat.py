@@ -0,0 +1,156 @@
+# peer_connect/management/commands/benchmark_chat.py
+
+import asyncio
+import json
+import statistics
+import time
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from peer_connect.benchmarking import ChatSocket, chat_path
+from peer_connect.models import GroupMembership, GroupMessage, StudyGroup
+from peer_connect.writebehind import message_buffer
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks the chat WebSocket consumer: queries and latency of connecting and of each "
+            "message, from sending it to every socket in the room receiving it, then sustained "
+            "throughput with every socket sending at once, until all messages are saved. Runs on a "
+            "throwaway test database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500)
+        parser.add_argument('--sockets', type=int, default=5, help="Members connected to the room.")
+        parser.add_argument('--history', type=int, default=5000, help="Messages already in the room.")
+        parser.add_argument('--burst', type=int, default=2000, help="Messages in the throughput run.")
+        parser.add_argument('--batch-size', type=int, help="Overrides CHAT_WRITE_BATCH_SIZE (1 saves each "
+                                                           "message on its own).")
+        parser.add_argument('--delay', type=float, help="Overrides CHAT_WRITE_DELAY, in seconds.")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def _populate(self, sockets, history):
+        users = [User.objects.create_user(f"bench{number}") for number in range(sockets)]
+        group = StudyGroup.objects.create(name="Benchmark Room", created_by=users[0])
+        GroupMembership.objects.bulk_create(GroupMembership(group=group, user=user) for user in users)
+        GroupMessage.objects.bulk_create(
+            GroupMessage(group=group, user=users[number % sockets], content=f"history {number}")
+            for number in range(history))
+        return group, users
+
+    async def _throughput(self, sockets, burst, executed):
+        per_socket = burst // len(sockets)
+        total = per_socket * len(sockets)
+        # Each sender keeps a few messages in flight; the in-memory channel
+        # layer drops messages for sockets more than 100 behind
+        window = 10
+        echoed = [0] * len(sockets)
+        echo = [asyncio.Event() for _ in sockets]
+
+        async def send_all(index, socket):
+            for number in range(per_socket):
+                while number - echoed[index] >= window:
+                    echo[index].clear()
+                    await echo[index].wait()
+                await socket.send({'message': f"burst {index}.{number}"})
+
+        async def receive_all(index, socket):
+            for _ in range(total):
+                frame = await socket.receive_message(timeout=10)
+                if frame['message']['content'].startswith(f"burst {index}."):
+                    echoed[index] += 1
+                    echo[index].set()
+
+        before = executed['queries']
+        started = time.perf_counter()
+        await asyncio.gather(*(send_all(index, socket) for index, socket in enumerate(sockets)),
+                             *(receive_all(index, socket) for index, socket in enumerate(sockets)))
+        delivered = time.perf_counter() - started
+        await message_buffer().drain()
+        saved = time.perf_counter() - started
+        return {'messages': total,
+                'delivered_per_second': round(total / delivered),
+                'saved_per_second': round(total / saved),
+                'queries_each': round((executed['queries'] - before) / total, 3)}
+
+    async def _run(self, group, users, messages, burst, executed):
+        # `executed` counts queries as they run (on the main thread, where the consumer's DB work happens)
+        timings = {'connect': [], 'message': []}
+
+        sockets = []
+        before = executed['queries']
+        for user in users:
+            socket = ChatSocket(user, chat_path(group))
+            started = time.perf_counter()
+            await socket.connect()
+            await socket.receive()  # history
+            timings['connect'].append(time.perf_counter() - started)
+            sockets.append(socket)
+        connect_queries = executed['queries'] - before
+
+        sender = sockets[0]
+        before = executed['queries']
+        for number in range(messages):
+            started = time.perf_counter()
+            await sender.send({'message': f"message {number}"})
+            for socket in sockets:
+                await socket.receive_message()
+            timings['message'].append(time.perf_counter() - started)
+        await message_buffer().drain()
+        message_queries = executed['queries'] - before
+
+        throughput = await self._throughput(sockets, burst, executed)
+        for socket in sockets:
+            await socket.close()
+        return timings, {'connect': connect_queries / len(users), 'message': message_queries / messages}, throughput
+
+    def handle(self, *args, **options):
+        overrides = {}
+        if options['batch_size'] is not None:
+            overrides['CHAT_WRITE_BATCH_SIZE'] = options['batch_size']
+        if options['delay'] is not None:
+            overrides['CHAT_WRITE_DELAY'] = options['delay']
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            group, users = self._populate(options['sockets'], options['history'])
+            executed = {'queries': 0}
+
+            def count(execute, sql, params, many, context):
+                executed['queries'] += 1
+                return execute(sql, params, many, context)
+
+            with override_settings(**overrides), connection.execute_wrapper(count):
+                timings, queries, throughput = async_to_sync(self._run)(
+                    group, users, options['messages'], options['burst'], executed)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        def summary(samples):
+            samples = sorted(samples)
+            return {'samples': len(samples),
+                    'p50_ms': round(statistics.median(samples) * 1000, 3),
+                    'p95_ms': round(samples[int(0.95 * (len(samples) - 1))] * 1000, 3),
+                    'max_ms': round(samples[-1] * 1000, 3)}
+
+        report = {'sockets': options['sockets'], 'history': options['history'],
+                  **{name: {**summary(timings[name]), 'queries_each': round(queries[name], 2)} for name in timings},
+                  'throughput': throughput}
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"{report['sockets']} sockets in a room with {report['history']} messages")
+        for name in timings:
+            row = report[name]
+            self.stdout.write(f"  {name:<8} p50 {row['p50_ms']:>7.3f} ms  p95 {row['p95_ms']:>7.3f} ms  "
+                              f"max {row['max_ms']:>7.3f} ms  {row['queries_each']:>5} queries each  "
+                              f"({row['samples']} samples)")
+        self.stdout.write(f"  burst    {throughput['messages']} messages: {throughput['delivered_per_second']}/s "
+                          f"delivered, {throughput['saved_per_second']}/s saved, "
+                          f"{throughput['queries_each']} queries each")
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:06
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peer_connect', '0004_alter_groupmessage_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='groupmessage',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peer_connect', '0005_alter_groupmessage_timestamp'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='groupmessage',
+            index=models.Index(fields=['group', 'id'], name='peer_connec_group_i_ab87dc_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:40
+
+import uuid
+
+from django.db import migrations, models
+
+
+def fill_keys(apps, schema_editor):
+    # AddField would give every existing message the same default; each needs its own
+    GroupMessage = apps.get_model('peer_connect', 'GroupMessage')
+    messages = list(GroupMessage.objects.only('id'))
+    for message in messages:
+        message.key = uuid.uuid4()
+    GroupMessage.objects.bulk_update(messages, ['key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peer_connect', '0006_groupmessage_peer_connec_group_i_ab87dc_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupmessage',
+            name='key',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='groupmessage',
+            name='key',
+            field=models.UUIDField(default=uuid.uuid4, editable=False),
+        ),
+    ]
@@ -1,5 +1,8 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 # --- Core Group Models ---
@@ -41,7 +44,10 @@ class GroupMessage(models.Model):
     group = models.ForeignKey(StudyGroup, on_delete=models.CASCADE, related_name='messages')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='messages')
     content = models.TextField(max_length=2000)  # Add a reasonable limit
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)  # Index for faster queries
+    # Set when the message is received, not when it's written (messages are saved in batches)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)  # Index for faster queries
+    # Identifies the message from the moment it's received, before it's saved and gets an id
+    key = models.UUIDField(default=uuid.uuid4, editable=False)
 
     class Meta:
         ordering = ['timestamp']
@@ -49,7 +55,34 @@ class GroupMessage(models.Model):
         verbose_name_plural = "Group Messages"
         indexes = [
             models.Index(fields=['group', 'timestamp']),  # Optimize message fetching
+            models.Index(fields=['group', 'id']),  # Keyset pages of a group's history
         ]
 
     def __str__(self):
         return f"Msg by {self.user.username} in {self.group.name} at {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
+
+    # Columns read with values() when paging history, instead of whole instances
+    VALUE_FIELDS = ('id', 'key', 'user_id', 'user__username', 'content', 'timestamp')
+
+    @staticmethod
+    def values_to_dict(row):
+        """to_dict() for a values(*VALUE_FIELDS) row."""
+        return {
+            'id': row['id'],
+            'key': str(row['key']),
+            'user_id': row['user_id'],
+            'username': row['user__username'],
+            'content': row['content'],
+            'timestamp': row['timestamp'].isoformat(),
+        }
+
+    def to_dict(self):
+        """The JSON shape the chat page renders, over HTTP and over the WebSocket."""
+        return {
+            'id': self.id,
+            'key': str(self.key),
+            'user_id': self.user_id,
+            'username': self.user.username,
+            'content': self.content,
+            'timestamp': self.timestamp.isoformat(),
+        }
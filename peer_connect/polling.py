@@ -0,0 +1,143 @@
+# peer_connect/polling.py
+#
+# Conditional and long polling of fetch_messages, for clients without a
+# WebSocket. Each group's version is the id of its newest message, kept in
+# the cache and bumped whenever messages are saved, so a poll that is
+# already current is answered without querying the database. Long polls
+# wait on an asyncio.Event that bump_version() sets as soon as a message is
+# saved in this process, and re-read the version every
+# CHAT_LONG_POLL_RECHECK seconds to notice messages saved by other processes.
+#
+# Versions expire after CHAT_VERSION_TTL seconds and are then read from the
+# database again (one MAX(id) on the (group, id) index). With a shared cache
+# backend that only happens for quiet groups; with a per-process cache it
+# bounds how long a process can miss another process's messages.
+
+import asyncio
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+
+# How long a positive membership check is trusted; leaving or deleting a group forgets it at once
+MEMBERSHIP_TTL = 300
+
+
+def long_poll_seconds() -> float:
+    return getattr(settings, 'CHAT_LONG_POLL_SECONDS', 25)
+
+
+def recheck_seconds() -> float:
+    return getattr(settings, 'CHAT_LONG_POLL_RECHECK', 1.0)
+
+
+def version_ttl() -> float:
+    return getattr(settings, 'CHAT_VERSION_TTL', 5)
+
+
+def version_key(group_id) -> str:
+    return f"chat:version:{group_id}"
+
+
+def membership_key(group_id, user_id) -> str:
+    return f"chat:member:{group_id}:{user_id}"
+
+
+# --- Versions ---
+
+def bump_version(group_id, message_id):
+    """Records a newly saved message and wakes this process's polls waiting on the group."""
+    key = version_key(group_id)
+    # Not atomic, but a lower id only ever loses a race to a newer message
+    if (cache.get(key) or 0) < message_id:
+        cache.set(key, message_id, version_ttl())
+    _wake(group_id)
+
+
+def _latest_id(group_id) -> int:
+    from .models import GroupMessage
+
+    return GroupMessage.objects.filter(group_id=group_id).aggregate(latest=Max('id'))['latest'] or 0
+
+
+def latest_version(group_id) -> int:
+    """The group's newest message id; read from the database only when the cached one has expired."""
+    version = cache.get(version_key(group_id))
+    if version is None:
+        version = _latest_id(group_id)
+        cache.add(version_key(group_id), version, version_ttl())
+    return version
+
+
+async def current_version(group_id) -> int:
+    """latest_version() for async views; a cached version costs no thread hop."""
+    version = await cache.aget(version_key(group_id))
+    if version is None:
+        version = await sync_to_async(latest_version)(group_id)
+    return version
+
+
+# --- Waiting ---
+
+_waiters = {}  # group id -> {(event loop, asyncio.Event)}
+_waiters_lock = threading.Lock()
+
+
+def _wake(group_id):
+    with _waiters_lock:
+        waiters = list(_waiters.get(group_id, ()))
+    for loop, event in waiters:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            pass  # that request's loop is already gone
+
+
+async def wait_for_change(group_id, seen_id, timeout) -> bool:
+    """Waits up to `timeout` seconds for a message newer than `seen_id`; returns whether one came."""
+    loop = asyncio.get_running_loop()
+    waiter = (loop, asyncio.Event())
+    with _waiters_lock:
+        _waiters.setdefault(group_id, set()).add(waiter)
+    try:
+        deadline = loop.time() + timeout
+        while True:
+            # Cleared before reading the version, so a bump in between still wakes us
+            waiter[1].clear()
+            if await current_version(group_id) > seen_id:
+                return True
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(waiter[1].wait(), min(remaining, recheck_seconds()))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        with _waiters_lock:
+            waiters = _waiters.get(group_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del _waiters[group_id]
+
+
+# --- Membership ---
+
+async def is_member(group_id, user_id) -> bool:
+    """Whether the user belongs to the group; a yes is cached, so repeated polls skip the query."""
+    from .models import GroupMembership
+
+    key = membership_key(group_id, user_id)
+    if await cache.aget(key):
+        return True
+    member = await GroupMembership.objects.filter(group_id=group_id, user_id=user_id).aexists()
+    if member:
+        await cache.aset(key, True, MEMBERSHIP_TTL)
+    return member
+
+
+def forget_membership(group_id, user_id):
+    cache.delete(membership_key(group_id, user_id))
@@ -2,6 +2,6 @@ from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
-    # Uses slugified group name (e.g., 'Calculus_II_Problem_Set')
-    re_path(r'ws/chat/(?P<group_name>\w+)/$', consumers.ChatConsumer.as_asgi()),
+    # Uses the group id, like the HTTP chat views (names don't survive a round trip through a slug)
+    re_path(r'ws/chat/(?P<group_id>\d+)/$', consumers.ChatConsumer.as_asgi()),
 ]
@@ -1,3 +1,392 @@
-from django.test import TestCase
+import asyncio
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db import DatabaseError
+from asgiref.testing import ApplicationCommunicator
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .benchmarking import ChatSocket, chat_path
+from .consumers import CLOSE_NOT_A_MEMBER, CLOSE_UNAUTHENTICATED
+from .history import forget_group, message_page
+from .models import StudyGroup, GroupMembership, GroupMessage
+from .polling import bump_version, version_key, wait_for_change
+from .writebehind import lifespan, message_buffer
+
+
+class ChatConsumerTest(TestCase):
+    def setUp(self):
+        cache.clear()  # versions and memberships cached by earlier tests
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.group = StudyGroup.objects.create(name='Calculus II', created_by=self.alice)
+        forget_group(self.group.id)  # a ring left by an earlier test under the same id
+        for user in (self.alice, self.bob):
+            GroupMembership.objects.create(group=self.group, user=user)
+        self.path = chat_path(self.group)
+
+    def test_connect_sends_recent_history(self):
+        for number in range(3):
+            GroupMessage.objects.create(group=self.group, user=self.bob, content=f"note {number}")
+
+        async def scenario():
+            socket = ChatSocket(self.alice, self.path)
+            accepted = await socket.connect()
+            history = await socket.receive()
+            await socket.close()
+            return accepted, history
+
+        accepted, history = async_to_sync(scenario)()
+        self.assertEqual(accepted['type'], 'websocket.accept')
+        self.assertEqual(history['type'], 'history')
+        self.assertEqual([msg['content'] for msg in history['messages']], ['note 0', 'note 1', 'note 2'])
+        self.assertEqual(history['messages'][0]['username'], 'bob')
+
+    def test_message_is_saved_and_delivered_to_every_socket(self):
+        async def scenario():
+            sender, reader = ChatSocket(self.alice, self.path), ChatSocket(self.bob, self.path)
+            for socket in (sender, reader):
+                await socket.connect()
+                await socket.receive()  # history
+            await sender.send({'message': '  see you at 5  '})
+            frames = [await sender.receive(), await reader.receive()]
+            for socket in (sender, reader):
+                await socket.close()
+            return frames
+
+        echoed, delivered = async_to_sync(scenario)()
+        self.assertEqual(echoed, delivered)
+        self.assertEqual(delivered['type'], 'message')
+        saved = GroupMessage.objects.get()
+        # Broadcast before it's saved, so without an id, but with its final key and timestamp
+        self.assertEqual(delivered['message'], {**saved.to_dict(), 'id': None})
+        self.assertEqual((saved.content, saved.user), ('see you at 5', self.alice))
+
+    @override_settings(CHAT_WRITE_DELAY=60)
+    def test_room_learns_the_ids_of_live_messages(self):
+        async def scenario():
+            sender, reader = ChatSocket(self.alice, self.path), ChatSocket(self.bob, self.path)
+            for socket in (sender, reader):
+                await socket.connect()
+                await socket.receive()
+            await sender.send({'message': "hello"})
+            await sender.receive()
+            live = await reader.receive()
+            await message_buffer().drain()
+            saved = await reader.receive()
+            for socket in (sender, reader):
+                await socket.close()
+            return live, saved
+
+        live, saved = async_to_sync(scenario)()
+        message = GroupMessage.objects.get()
+        self.assertEqual(live['message']['key'], str(message.key))
+        self.assertEqual(saved, {'type': 'saved', 'messages': [{'key': str(message.key), 'id': message.id}]})
+
+    def test_message_sent_over_http_reaches_sockets(self):
+        self.client.force_login(self.bob)
+
+        async def scenario():
+            socket = ChatSocket(self.alice, self.path)
+            await socket.connect()
+            await socket.receive()
+            await sync_to_async(self.client.post)(
+                reverse('pc:send_message', args=[self.group.id]), {'content': "from the fallback"},
+                content_type='application/json')
+            frame = await socket.receive()
+            await socket.close()
+            return frame
+
+        frame = async_to_sync(scenario)()
+        self.assertEqual(frame, {'type': 'message', 'message': GroupMessage.objects.get().to_dict()})
+
+    def test_empty_message_is_rejected(self):
+        async def scenario():
+            socket = ChatSocket(self.alice, self.path)
+            await socket.connect()
+            await socket.receive()
+            await socket.send({'message': '   '})
+            reply = await socket.receive()
+            await socket.close()
+            return reply
+
+        self.assertEqual(async_to_sync(scenario)()['type'], 'error')
+        self.assertFalse(GroupMessage.objects.exists())
+
+    def test_chat_room_points_the_page_at_the_socket(self):
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse('pc:chat_room', args=[self.group.id]))
+        self.assertContains(response, '/ws/chat/${GROUP_ID}/')
+
+    def _handshake(self, user):
+        # What the socket gets after the handshake is accepted: the history, or a close code
+        async def scenario():
+            socket = ChatSocket(user, self.path)
+            await socket.connect()
+            return await socket.communicator.receive_output(timeout=3)
+        return async_to_sync(scenario)()
+
+    def test_non_members_are_closed_with_a_code_and_no_history(self):
+        outsider = User.objects.create_user('eve', password='pw')
+        GroupMessage.objects.create(group=self.group, user=self.bob, content="members only")
+
+        # Accepted and then closed, so the browser sees the code instead of 1006
+        self.assertEqual(self._handshake(outsider), {'type': 'websocket.close', 'code': CLOSE_NOT_A_MEMBER})
+        self.assertEqual(self._handshake(AnonymousUser()),
+                         {'type': 'websocket.close', 'code': CLOSE_UNAUTHENTICATED})
+
+    def test_unknown_group_is_refused(self):
+        self.path = '/ws/chat/999999/'
+        self.assertEqual(self._handshake(self.alice)['code'], CLOSE_NOT_A_MEMBER)
+
+    def _send_messages(self, count):
+        async def scenario():
+            socket = ChatSocket(self.alice, self.path)
+            await socket.connect()
+            await socket.receive()
+            for number in range(count):
+                await socket.send({'message': f"message {number}"})
+                await socket.receive()
+            await socket.close()
+
+        async_to_sync(scenario)()
+
+    @override_settings(CHAT_WRITE_DELAY=60)
+    def test_messages_are_saved_in_one_batch(self):
+        # The membership check and the history on connect, then a single
+        # INSERT when the socket disconnects, long before the delay is up
+        with self.assertNumQueries(2 + 1):
+            self._send_messages(5)
+        self.assertEqual(list(GroupMessage.objects.values_list('content', flat=True)),
+                         [f"message {number}" for number in range(5)])
+        self.assertEqual(cache.get(version_key(self.group.id)), GroupMessage.objects.latest('id').id)
+
+    @override_settings(CHAT_WRITE_BATCH_SIZE=2, CHAT_WRITE_DELAY=60)
+    def test_full_batch_is_saved_without_waiting(self):
+        with self.assertNumQueries(2 + 2):
+            self._send_messages(4)
+        self.assertEqual(GroupMessage.objects.count(), 4)
+
+    @override_settings(CHAT_WRITE_DELAY=60)
+    def test_sender_hears_about_a_message_that_could_not_be_saved(self):
+        async def scenario():
+            socket = ChatSocket(self.alice, self.path)
+            await socket.connect()
+            await socket.receive()
+            await socket.send({'message': "lost"})
+            await socket.receive()  # shown before it is saved
+            with mock.patch.object(GroupMessage, 'save', side_effect=DatabaseError("disk full")), \
+                    self.assertLogs('peer_connect.writebehind', 'ERROR'):
+                await message_buffer().drain()
+            reply = await socket.receive()
+            await socket.close()
+            return reply
+
+        reply = async_to_sync(scenario)()
+        self.assertEqual(reply['type'], 'error')
+        self.assertEqual(reply['message']['content'], "lost")
+        self.assertFalse(GroupMessage.objects.exists())
+
+    @override_settings(CHAT_WRITE_DELAY=60)
+    def test_lifespan_shutdown_saves_pending_messages(self):
+        async def scenario():
+            message_buffer().add(GroupMessage(group=self.group, user=self.bob, content="last words"))
+            server = ApplicationCommunicator(lifespan, {'type': 'lifespan'})
+            await server.send_input({'type': 'lifespan.startup'})
+            await server.receive_output(timeout=3)
+            await server.send_input({'type': 'lifespan.shutdown'})
+            return await server.receive_output(timeout=3)
+
+        self.assertEqual(async_to_sync(scenario)(), {'type': 'lifespan.shutdown.complete'})
+        self.assertEqual(GroupMessage.objects.get().content, "last words")
+
+
+class FetchMessagesTest(TestCase):
+    def setUp(self):
+        cache.clear()  # versions and memberships cached by earlier tests
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.group = StudyGroup.objects.create(name='Physics', created_by=self.alice)
+        GroupMembership.objects.create(group=self.group, user=self.alice)
+        # Many messages sharing one timestamp, which a timestamp cursor can't page through
+        moment = timezone.now()
+        GroupMessage.objects.bulk_create(
+            GroupMessage(group=self.group, user=self.alice, content=f"m{number}", timestamp=moment)
+            for number in range(120))
+        self.ids = list(GroupMessage.objects.order_by('id').values_list('id', flat=True))
+        self.client.force_login(self.alice)
+        self.url = reverse('pc:fetch_messages', args=[self.group.id])
+
+    def _page(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [msg['id'] for msg in data['messages']], data['has_more']
+
+    def test_initial_page_is_the_latest_messages(self):
+        self.assertEqual(self._page(), (self.ids[-50:], True))
+
+    def test_scrolling_back_reaches_every_message_once(self):
+        seen, has_more = self._page()
+        while has_more:
+            page, has_more = self._page(before_id=seen[0])
+            seen = page + seen
+        self.assertEqual(seen, self.ids)
+
+    def test_polling_after_an_id_returns_only_newer_messages(self):
+        self.assertEqual(self._page(after_id=self.ids[-3]), (self.ids[-2:], False))
+        self.assertEqual(self._page(after_id=self.ids[0], limit=10), (self.ids[1:11], True))
+
+    def test_page_cost_does_not_depend_on_depth(self):
+        self._page()  # caches the membership
+        # Session, user and one keyset query, at the top or the bottom of the history
+        for before_id in (self.ids[-1], self.ids[5]):
+            with self.assertNumQueries(3):
+                self._page(before_id=before_id)
+
+    def test_bad_cursors_are_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'after_id': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'after_id': 1, 'before_id': 5}).status_code, 400)
+
+
+class LongPollTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.group = StudyGroup.objects.create(name='Chemistry', created_by=self.alice)
+        GroupMembership.objects.create(group=self.group, user=self.alice)
+        self.last = GroupMessage.objects.create(group=self.group, user=self.alice, content="hi")
+        self.client.force_login(self.alice)
+        self.url = reverse('pc:fetch_messages', args=[self.group.id])
+
+    def test_current_poll_is_answered_without_the_database(self):
+        # The first poll caches the membership and reads the group's version from the database
+        self.client.get(self.url, {'after_id': self.last.id})
+        with self.assertNumQueries(2):  # session and user only
+            response = self.client.get(self.url, {'after_id': self.last.id})
+        self.assertEqual(response.status_code, 304)
+
+    def test_sending_bumps_the_version(self):
+        self.assertEqual(self.client.get(self.url, {'after_id': self.last.id}).status_code, 304)
+        self.client.post(reverse('pc:send_message', args=[self.group.id]), {'content': "news"},
+                         content_type='application/json')
+        response = self.client.get(self.url, {'after_id': self.last.id})
+        self.assertEqual([msg['content'] for msg in response.json()['messages']], ["news"])
+
+    def test_long_poll_returns_once_the_wait_is_over(self):
+        started = time.monotonic()
+        response = self.client.get(self.url, {'after_id': self.last.id, 'wait': 1})
+        self.assertEqual(response.status_code, 304)
+        self.assertGreaterEqual(time.monotonic() - started, 1)
+
+    def test_waiting_poll_wakes_on_a_new_message(self):
+        async def scenario():
+            waiting = asyncio.ensure_future(wait_for_change(self.group.id, self.last.id, 10))
+            await asyncio.sleep(0.05)
+            started = time.monotonic()
+            # Saved on another thread, as send_message and the write-behind buffer do
+            await asyncio.to_thread(bump_version, self.group.id, self.last.id + 1)
+            return await waiting, time.monotonic() - started
+
+        woke, waited = async_to_sync(scenario)()
+        self.assertTrue(woke)
+        self.assertLess(waited, 0.5)
+
+    @override_settings(CHAT_VERSION_TTL=0.2)
+    def test_expired_version_is_read_from_the_database(self):
+        self.assertEqual(self.client.get(self.url, {'after_id': self.last.id}).status_code, 304)
+        # Saved by another process, with a cache of its own: this one's version is stale until it expires
+        newer = GroupMessage.objects.create(group=self.group, user=self.alice, content="elsewhere")
+        self.assertEqual(self.client.get(self.url, {'after_id': self.last.id}).status_code, 304)
+        time.sleep(0.3)
+        response = self.client.get(self.url, {'after_id': self.last.id})
+        self.assertEqual([msg['id'] for msg in response.json()['messages']], [newer.id])
+
+    def test_leaving_the_group_ends_polling(self):
+        self.client.get(self.url)
+        self.client.post(reverse('pc:leave_group', args=[self.group.id]))
+        self.assertEqual(self.client.get(self.url, {'after_id': self.last.id}).status_code, 403)
+
+
+class RecentMessagesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.group = StudyGroup.objects.create(name='Biology', created_by=self.alice)
+        forget_group(self.group.id)
+        GroupMembership.objects.create(group=self.group, user=self.alice)
+        for number in range(3):
+            GroupMessage.objects.create(group=self.group, user=self.alice, content=f"old {number}")
+        self.client.force_login(self.alice)
+        self.url = reverse('pc:fetch_messages', args=[self.group.id])
+
+    def _contents(self):
+        return [msg['content'] for msg in self.client.get(self.url).json()['messages']]
+
+    def test_initial_loads_come_from_memory(self):
+        self._contents()  # builds the ring and caches the membership
+        with self.assertNumQueries(2):  # session and user only
+            self.assertEqual(self._contents(), ["old 0", "old 1", "old 2"])
+
+    def test_sending_updates_the_ring(self):
+        self._contents()
+        self.client.post(reverse('pc:send_message', args=[self.group.id]), {'content': "new"},
+                         content_type='application/json')
+        with self.assertNumQueries(2):
+            self.assertEqual(self._contents(), ["old 0", "old 1", "old 2", "new"])
+
+    @override_settings(CHAT_WRITE_DELAY=60)
+    def test_socket_messages_update_the_ring(self):
+        self._contents()
+
+        async def scenario():
+            socket = ChatSocket(self.alice, chat_path(self.group))
+            await socket.connect()
+            await socket.receive()
+            await socket.send({'message': "live"})
+            await socket.receive()
+            await socket.close()
+
+        async_to_sync(scenario)()
+        with self.assertNumQueries(2):
+            self.assertEqual(self._contents()[-1], "live")
+
+    def test_ring_behind_the_version_is_rebuilt(self):
+        self._contents()
+        # Saved by another process: the shared version moves, this process's ring doesn't
+        elsewhere = GroupMessage.objects.create(group=self.group, user=self.alice, content="elsewhere")
+        bump_version(self.group.id, elsewhere.id)
+        self.assertEqual(self._contents()[-1], "elsewhere")
+
+    def test_expired_version_costs_one_query_not_a_rebuild(self):
+        self._contents()
+        cache.delete(version_key(self.group.id))  # expired or culled
+        with self.assertNumQueries(2 + 1):  # session, user and MAX(id)
+            self.assertEqual(self._contents(), ["old 0", "old 1", "old 2"])
+
+    def test_ring_survives_a_message_after_the_version_expired(self):
+        self._contents()
+        cache.delete(version_key(self.group.id))  # a room quiet for longer than CHAT_VERSION_TTL
+        self.client.post(reverse('pc:send_message', args=[self.group.id]), {'content': "new"},
+                         content_type='application/json')
+        with self.assertNumQueries(2):
+            self.assertEqual(self._contents(), ["old 0", "old 1", "old 2", "new"])
+
+    @override_settings(CHAT_RECENT_MESSAGES=3)
+    def test_overflowing_ring_keeps_the_newest_messages(self):
+        self._contents()
+        self.client.post(reverse('pc:send_message', args=[self.group.id]), {'content': "new"},
+                         content_type='application/json')
+        messages, has_more = message_page(self.group.id, limit=3)
+        self.assertEqual([msg['content'] for msg in messages], ["old 1", "old 2", "new"])
+        self.assertTrue(has_more)
+
+    def test_chat_room_embeds_the_first_page(self):
+        response = self.client.get(reverse('pc:chat_room', args=[self.group.id]))
+        self.assertContains(response, 'id="initial-page"')
+        self.assertEqual([msg['content'] for msg in response.context['initial_page']['messages']],
+                         ["old 0", "old 1", "old 2"])
@@ -1,9 +1,13 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponseForbidden, HttpResponseBadRequest
+from django.http import JsonResponse, HttpResponseForbidden, HttpResponseBadRequest, HttpResponseNotModified, Http404
 from django.utils import timezone
-from dateutil import parser
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from .consumers import room_channel
+from .history import MAX_PAGE_SIZE, PAGE_SIZE, message_page, messages_saved
+from .polling import current_version, is_member, long_poll_seconds, wait_for_change
 from .models import StudyGroup, GroupMembership, GroupMessage
 from .forms import StudyGroupForm
 from django.db.models import Count
@@ -114,11 +118,14 @@ def chat_room(request, group_id):
         return redirect('pc:peer_connect')
 
     is_creator = (group.created_by == request.user)
+    # Embedded in the page, so the chat shows up without waiting for a fetch
+    initial_messages, has_more = message_page(group.id)
 
     context = {
         'group': group,
         'user': request.user,
         'is_creator': is_creator,
+        'initial_page': {'messages': initial_messages, 'has_more': has_more},
     }
     return render(request, 'chat_room.html', context)
 
@@ -140,12 +147,16 @@ def send_message(request, group_id):
         if not content:
             return JsonResponse({'error': 'Message content cannot be empty.'}, status=400)
 
-        GroupMessage.objects.create(
+        message = GroupMessage.objects.create(
             group=group,
             user=request.user,
             content=content,
             timestamp=timezone.now()
         )
+        messages_saved(group.id, [message.to_dict()])
+        # Pages on the WebSocket don't poll, so they only see it if it's broadcast too
+        async_to_sync(get_channel_layer().group_send)(
+            room_channel(group.id), {'type': 'chat.message', 'message': message.to_dict()})
         return JsonResponse({'status': 'ok'}, status=201)
 
     except json.JSONDecodeError:
@@ -154,61 +165,43 @@ def send_message(request, group_id):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def _message_id(request, name):
+    value = request.GET.get(name)
+    return int(value) if value else None
+
+
 @login_required
-def fetch_messages(request, group_id):
-    group = get_object_or_404(StudyGroup, id=group_id)
+async def fetch_messages(request, group_id):
+    # Async, so a long poll waits without holding a worker thread
+    user = await request.auser()
 
-    if not GroupMembership.objects.filter(group=group, user=request.user).exists():
+    if not await is_member(group_id, user.id):
+        if not await StudyGroup.objects.filter(id=group_id).aexists():
+            raise Http404("No StudyGroup matches the given query.")
         # Returns 403, which the JavaScript handles by redirecting.
         return JsonResponse({'error': 'Permission denied. Not a group member.'}, status=403)
 
     try:
-        last_timestamp_str = request.GET.get('last_timestamp')
-        messages_query = GroupMessage.objects.filter(group=group)
-
-        if last_timestamp_str:
-            try:
-                # 1. Use dateutil.parser.isoparse for reliable parsing of the ISO string from JavaScript.
-                last_timestamp = parser.isoparse(last_timestamp_str)
-
-                # 2. Ensure the timestamp is timezone-aware, which is mandatory for comparisons in Django.
-                if timezone.is_naive(last_timestamp):
-                    # Make it aware using the default Django timezone setting (or UTC if that's your standard).
-                    last_timestamp = timezone.make_aware(last_timestamp, timezone.get_default_timezone())
+        after_id = _message_id(request, 'after_id')
+        before_id = _message_id(request, 'before_id')
+        limit = min(max(int(request.GET.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        wait = min(max(int(request.GET.get('wait', 0)), 0), long_poll_seconds())
+    except ValueError:
+        return JsonResponse({'error': 'after_id, before_id, limit and wait must be numbers.'}, status=400)
+    if after_id is not None and before_id is not None:
+        return JsonResponse({'error': 'Use either after_id or before_id, not both.'}, status=400)
+
+    if after_id is not None and await current_version(group_id) <= after_id:
+        # Nothing new: 304 straight away, or once `wait` seconds pass without a message
+        if not wait or not await wait_for_change(group_id, after_id, wait):
+            return HttpResponseNotModified()
 
-                # Filter for messages *newer* than the last one received
-                messages_query = messages_query.filter(timestamp__gt=last_timestamp).order_by(
-                    'timestamp').select_related('user')
-
-                # If polling is working, this query usually returns only the new messages.
-
-            except (ValueError, TypeError) as e:
-                # If timestamp parsing fails, log it and treat it as a fresh load to prevent crash.
-                print(f"Timestamp parsing failed: {e}. Defaulting to initial load.")
-                # Fall through to the initial load logic below.
-                messages_query = GroupMessage.objects.filter(group=group).order_by('-timestamp').select_related('user')[
-                    :50]
-                messages_query = messages_query[::-1]  # Reverse to display oldest first
-
-        else:
-            # Initial load logic (when 'last_timestamp' is not present)
-            messages_query = messages_query.order_by('-timestamp').select_related('user')[:50]
-            messages_query = messages_query[::-1]  # Reverse for chronological display
-
-        final_messages = messages_query
-
-        new_messages = [
-            {
-                'id': msg.id,
-                'user_id': msg.user.id,
-                'username': msg.user.username,
-                'content': msg.content,
-                'timestamp': msg.timestamp.isoformat(),
-            }
-            for msg in final_messages
-        ]
-
-        return JsonResponse({'messages': new_messages})
+    try:
+        # after_id: new messages since the last one seen (polling); before_id:
+        # the page before the oldest one shown (scrollback); neither: the latest page
+        page, has_more = await sync_to_async(message_page)(
+            group_id, after_id=after_id, before_id=before_id, limit=limit)
+        return JsonResponse({'messages': page, 'has_more': has_more})
 
     except Exception as e:
         # Catch-all for any other critical crash
@@ -0,0 +1,169 @@
+# peer_connect/writebehind.py
+#
+# Write-behind saving of chat messages. ChatConsumer broadcasts a message as
+# soon as it arrives and hands it to this process's buffer, which inserts
+# everything pending with one bulk_create once CHAT_WRITE_DELAY seconds have
+# passed or CHAT_WRITE_BATCH_SIZE messages are waiting, whichever is first.
+# A busy room then costs one transaction (and one hop to the database
+# thread) per batch instead of per message. Pending messages are flushed
+# when a socket disconnects, on ASGI lifespan shutdown and at exit. A
+# message that can't be saved at all was already shown, so its sender's
+# socket gets an error frame for it. Messages that are saved get their ids
+# sent to their room, so pages can move their polling cursor past them.
+
+import asyncio
+import atexit
+import logging
+import weakref
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import DatabaseError
+
+from .history import messages_saved
+
+logger = logging.getLogger(__name__)
+
+
+def batch_size() -> int:
+    return getattr(settings, 'CHAT_WRITE_BATCH_SIZE', 100)
+
+
+def flush_delay() -> float:
+    return getattr(settings, 'CHAT_WRITE_DELAY', 0.005)
+
+
+def save_messages(messages) -> list:
+    """
+    Inserts a batch of unsaved GroupMessages; returns the ones it had to drop.
+
+    If the batch fails (say one group was deleted meanwhile), the messages
+    are retried one at a time and only the ones that still fail are dropped.
+    Saved messages go into their group's recent-message ring and bump its
+    polling version.
+    """
+    from .models import GroupMessage
+
+    try:
+        if len(messages) == 1:
+            messages[0].save(force_insert=True)  # a plain INSERT, without bulk_create's transaction
+        else:
+            GroupMessage.objects.bulk_create(messages)
+    except DatabaseError as e:
+        logger.warning("Chat batch insert failed (%s); saving %d messages one by one.", e, len(messages))
+        saved, dropped = [], []
+        for message in messages:
+            message.pk = None
+            try:
+                message.save(force_insert=True)
+                saved.append(message)
+            except DatabaseError as e:
+                logger.error("Dropped chat message from user %s to group %s: %s",
+                             message.user_id, message.group_id, e)
+                dropped.append(message)
+    else:
+        saved, dropped = messages, []
+
+    by_group = {}
+    for message in saved:
+        if message.pk is not None:  # backends that can't return ids from bulk inserts leave it unset
+            by_group.setdefault(message.group_id, []).append(message.to_dict())
+    for group_id, group_messages in by_group.items():
+        messages_saved(group_id, group_messages)
+    return dropped
+
+
+async def announce_ids(messages, dropped):
+    """Tells each room the ids its live messages were saved under, by message key."""
+    from .consumers import room_channel
+
+    dropped = {id(message) for message in dropped}
+    by_group = {}
+    for message in messages:
+        if message.pk is not None and id(message) not in dropped:
+            by_group.setdefault(message.group_id, []).append({'key': str(message.key), 'id': message.pk})
+    channel_layer = get_channel_layer()
+    for group_id, ids in by_group.items():
+        await channel_layer.group_send(room_channel(group_id), {'type': 'chat.saved', 'messages': ids})
+
+
+async def report_dropped(batch, dropped):
+    """Sends each dropped message's sender socket (its reply channel, if any) an error frame for it."""
+    dropped = {id(message) for message in dropped}
+    channel_layer = get_channel_layer()
+    for message, reply_channel in batch:
+        if reply_channel is not None and id(message) in dropped:
+            await channel_layer.send(reply_channel, {'type': 'chat.dropped', 'message': message.to_dict()})
+
+
+class MessageBuffer:
+    """Messages waiting to be saved, for the consumers running on one event loop."""
+
+    def __init__(self):
+        self.pending = []
+        self._timer = None
+        self._flushes = set()
+
+    def add(self, message, reply_channel=None):
+        """Queues a message; `reply_channel` is told if it can't be saved."""
+        self.pending.append((message, reply_channel))
+        if len(self.pending) >= batch_size():
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(flush_delay(), self._start_flush)
+
+    def _start_flush(self):
+        task = asyncio.ensure_future(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            messages = [message for message, _ in batch]
+            dropped = await database_sync_to_async(save_messages)(messages)
+            if dropped:
+                await report_dropped(batch, dropped)
+            await announce_ids(messages, dropped)
+
+    async def drain(self):
+        """Saves everything pending and waits for flushes already under way."""
+        await self.flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes)
+
+
+_buffers = weakref.WeakKeyDictionary()  # event loop -> MessageBuffer
+
+
+def message_buffer() -> MessageBuffer:
+    """The buffer of the running event loop (normally one per server process)."""
+    loop = asyncio.get_running_loop()
+    if loop not in _buffers:
+        _buffers[loop] = MessageBuffer()
+    return _buffers[loop]
+
+
+@atexit.register
+def _save_leftovers():
+    # Last resort for servers that stop without a lifespan shutdown
+    for buffer in list(_buffers.values()):
+        batch, buffer.pending = buffer.pending, []
+        if batch:
+            save_messages([message for message, _ in batch])  # too late to tell anyone; logged
+
+
+async def lifespan(scope, receive, send):
+    """ASGI lifespan app: flushes pending messages when the server shuts down."""
+    while True:
+        event = await receive()
+        if event['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif event['type'] == 'lifespan.shutdown':
+            await message_buffer().drain()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -1,3 +1,6 @@
 from django.contrib import admin
 
+from .models import StudyJob
+
 # Register your models here.
+admin.site.register(StudyJob)
@@ -0,0 +1,93 @@
+import threading
+
+from celery import shared_task
+from django.db import transaction
+
+from .models import StudyJob
+
+
+# NOTE: This file assumes Celery is configured and running in your Django environment.
+# Without a reachable broker, enqueue_study_job() falls back to a local thread.
+
+@shared_task
+def process_study_job(job_id):
+    """
+    Celery task that extracts the text of a job's PDF and runs the AI step.
+    Progress and the final result are written to the StudyJob row, which the
+    front end polls.
+    """
+    try:
+        job = StudyJob.objects.get(pk=job_id)
+    except StudyJob.DoesNotExist:
+        # Job was deleted before the worker picked it up, just exit gracefully.
+        return
+
+    # A redelivered task must not process the same job twice
+    if job.status != 'PENDING':
+        return
+
+    try:
+        job.set_progress(10)
+        if job.kind == 'SUMMARY':
+            _run_summary(job)
+        else:
+            _run_flashcards(job)
+    except Exception as e:
+        print(f"Study job {job_id} failed: {e}")
+        job.fail(f"An AI generation error occurred: {e}")
+    finally:
+        # The upload is only needed while processing
+        if job.file:
+            job.file.delete(save=False)
+            job.save(update_fields=['file'])
+
+
+def _run_summary(job):
+    from ai_app.serializers import StudyToolResponseSerializer
+    from ai_app.services import GeminiAIService
+    from ai_app.utils import extract_text_from_pdf
+
+    with job.file.open('rb') as pdf_file:
+        text_content = extract_text_from_pdf(pdf_file)
+
+    if not text_content:
+        job.fail("Could not extract text from the PDF file. Check if it's a valid text-based PDF.")
+        return
+    job.set_progress(30)
+
+    processed_data = GeminiAIService().process_document(text_content, job.title)
+    if 'error' in processed_data:
+        job.fail(processed_data['error'])
+        return
+    job.succeed(StudyToolResponseSerializer(processed_data).data)
+
+
+def _run_flashcards(job):
+    from ai_app.clients import get_client
+    from .services import generate_flashcards
+    from .views import extract_text_from_pdf
+
+    with job.file.open('rb') as pdf_file:
+        extracted_text = extract_text_from_pdf(pdf_file)
+
+    if not extracted_text or len(extracted_text.strip()) < 50:
+        job.fail('Could not extract enough readable text from the PDF.')
+        return
+    job.set_progress(30)
+
+    cards = generate_flashcards(get_client(), extracted_text)
+    job.succeed({'status': 'success', 'cards': cards})
+
+
+def enqueue_study_job(job):
+    """Hands the job to a Celery worker once the creating transaction commits."""
+
+    def dispatch():
+        try:
+            process_study_job.delay(str(job.pk))
+        except Exception as e:
+            # No broker (e.g. local development): run it in-process, off the request thread
+            print(f"Celery unavailable ({e}); running study job {job.pk} in a local thread.")
+            threading.Thread(target=process_study_job, args=(str(job.pk),), daemon=True).start()
+
+    transaction.on_commit(dispatch)
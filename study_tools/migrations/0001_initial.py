@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:19
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudyJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('SUMMARY', 'Summary & Flashcards'), ('FLASHCARDS', 'Flashcards')], max_length=10)),
+                ('title', models.CharField(max_length=255)),
+                ('file', models.FileField(blank=True, null=True, upload_to='study_jobs/')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('SUCCESS', 'Success'), ('FAILURE', 'Failure')], db_index=True, default='PENDING', max_length=10)),
+                ('progress', models.PositiveSmallIntegerField(default=0, help_text='Completion percentage (0-100).')),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='study_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Study Job',
+                'verbose_name_plural': 'Study Jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
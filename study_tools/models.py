@@ -1,3 +1,84 @@
+import uuid
+
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class StudyJob(models.Model):
+    """
+    A PDF study-tool request processed in the background.
+
+    The upload is stored with the job so a Celery worker can pick it up;
+    the front end polls the job for its status, progress and result.
+    """
+    KIND_CHOICES = [
+        ('SUMMARY', 'Summary & Flashcards'),
+        ('FLASHCARDS', 'Flashcards'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('SUCCESS', 'Success'),
+        ('FAILURE', 'Failure'),
+    ]
+
+    # UUIDs so job ids in status URLs can't be guessed
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='study_jobs',
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    title = models.CharField(max_length=255)
+    file = models.FileField(upload_to='study_jobs/', blank=True, null=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING', db_index=True)
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Completion percentage (0-100).")
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Study Job"
+        verbose_name_plural = "Study Jobs"
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for {self.title} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('SUCCESS', 'FAILURE')
+
+    def set_progress(self, progress, status='RUNNING'):
+        """Records progress without touching the other columns."""
+        self.progress = progress
+        self.status = status
+        self.save(update_fields=['progress', 'status', 'updated_at'])
+
+    def succeed(self, result):
+        self.result = result
+        self.progress = 100
+        self.status = 'SUCCESS'
+        self.save(update_fields=['result', 'progress', 'status', 'updated_at'])
+
+    def fail(self, error):
+        self.error = error
+        self.status = 'FAILURE'
+        self.save(update_fields=['error', 'status', 'updated_at'])
+
+    def to_dict(self):
+        """Payload for the status endpoint."""
+        return {
+            'job_id': str(self.id),
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'result': self.result if self.status == 'SUCCESS' else None,
+            'error': self.error or None,
+        }
@@ -0,0 +1,72 @@
+import json
+
+from google.genai import types
+
+from ai_app.chunking import dedupe_cards, map_chunks, split_document
+from ai_app.coalescing import flight_key, single_flight
+from ai_app.resilience import gemini_resilience
+
+# Limit the text length of each request to avoid excessive token usage
+MAX_TEXT_LENGTH = 15000
+
+FLASHCARD_MODEL = 'gemini-2.5-flash'
+
+FLASHCARD_PROMPT = """
+    Analyze the following study material. Based on the key concepts and facts, generate a set of 10 to 15 concise flashcards. 
+    The output must be a JSON array that strictly adheres to the provided schema.
+
+    STUDY MATERIAL:
+    ---
+    {chunk}
+    """
+
+# This tells Gemini to return a specific JSON structure.
+FLASHCARD_SCHEMA = types.Schema(
+    type=types.Type.ARRAY,
+    description="A list of flashcards generated from the text.",
+    items=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "term": types.Schema(type=types.Type.STRING, description="The key concept or term."),
+            "definition": types.Schema(type=types.Type.STRING,
+                                       description="The detailed definition or explanation."),
+        },
+        required=["term", "definition"],
+    ),
+)
+
+
+def generate_flashcards(client, extracted_text):
+    """
+    Generates a deduplicated flashcard deck for the whole text.
+
+    Long material is split on page/section boundaries instead of being
+    truncated; the chunks are sent to Gemini concurrently.
+    """
+    chunks = split_document(extracted_text, max_chars=MAX_TEXT_LENGTH)
+
+    def generate_cards(chunk):
+        prompt = FLASHCARD_PROMPT.format(chunk=chunk)
+        response = gemini_resilience.call('flashcards', lambda: client.models.generate_content(
+            model=FLASHCARD_MODEL,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=FLASHCARD_SCHEMA,
+            ),
+        ), idempotent=True)
+
+        # The response.text is a JSON string conforming to FLASHCARD_SCHEMA
+        cards_data = json.loads(response.text)
+
+        # Validation: Ensure it's a list (array)
+        if not isinstance(cards_data, list):
+            raise ValueError("Gemini returned an invalid JSON structure (not a list).")
+        return cards_data
+
+    def generate_deck():
+        # Merge the per-chunk decks and drop repeated terms
+        return dedupe_cards([card for cards in map_chunks(generate_cards, chunks) for card in cards], 'term')
+
+    # The same material uploaded twice at once is only sent to Gemini once
+    return single_flight.do(flight_key('flashcards', FLASHCARD_MODEL, FLASHCARD_PROMPT, extracted_text), generate_deck)
@@ -1,3 +1,103 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from unittest.mock import MagicMock, patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ai_app.benchmarking import make_pdf
+from .celery import process_study_job
+from .models import StudyJob
+from .services import generate_flashcards
+
+
+def fake_client(seen_prompts):
+    """A Gemini client stand-in that returns two cards per call, one shared by every call."""
+
+    def generate_content(model, contents, config):
+        seen_prompts.append(contents)
+        response = MagicMock()
+        response.text = json.dumps([{"term": "Shared term", "definition": "d"},
+                                    {"term": f"Term {len(seen_prompts)}", "definition": "d"}])
+        return response
+
+    client = MagicMock()
+    client.models.generate_content.side_effect = generate_content
+    return client
+
+
+class GenerateFlashcardsTest(TestCase):
+    def test_long_document_is_chunked_not_truncated(self):
+        # ~8 pages of ~2,700 chars each: well past the old 15,000 char cut-off
+        text = "\f".join(f"Chapter {i} covers topic {i}. " + "Lorem ipsum dolor sit amet. " * 95 for i in range(8))
+        seen_prompts = []
+
+        cards = generate_flashcards(fake_client(seen_prompts), text)
+
+        self.assertGreater(len(seen_prompts), 1)
+        self.assertTrue(any("Chapter 7" in prompt for prompt in seen_prompts))
+        self.assertEqual([card['term'] for card in cards].count("Shared term"), 1)
+
+
+class StudyJobPipelineTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.user = User.objects.create_user(username='student', password='password123')
+        self.client.force_login(self.user)
+        self.upload = SimpleUploadedFile(
+            "notes.pdf", make_pdf(["Photosynthesis converts light energy into chemical energy. " * 5]),
+            content_type="application/pdf")
+
+    @patch('study_tools.celery.process_study_job.delay')
+    @patch('study_tools.views.get_client')
+    def test_upload_returns_202_and_queues_a_job(self, mock_get_client, mock_delay):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('st:create_flashcards'), {'pdf_file': self.upload})
+
+        self.assertEqual(response.status_code, 202)
+        job = StudyJob.objects.get(id=response.json()['job_id'])
+        self.assertEqual((job.kind, job.status, job.user), ('FLASHCARDS', 'PENDING', self.user))
+        mock_delay.assert_called_once_with(str(job.id))
+
+    @patch('ai_app.clients.client_registry.get')
+    def test_worker_stores_result_for_polling(self, mock_get):
+        mock_get.return_value = fake_client([])
+        job = StudyJob.objects.create(user=self.user, kind='FLASHCARDS', title='notes.pdf', file=self.upload)
+
+        process_study_job(str(job.id))
+
+        response = self.client.get(reverse('st:job_status', args=[job.id]))
+        data = response.json()
+        self.assertEqual((data['status'], data['progress']), ('SUCCESS', 100))
+        self.assertEqual(data['result']['cards'][0]['term'], "Shared term")
+        # The stored upload is cleaned up once processed
+        job.refresh_from_db()
+        self.assertFalse(job.file)
+
+    def test_worker_records_failures(self):
+        job = StudyJob.objects.create(
+            user=self.user, kind='FLASHCARDS', title='empty.pdf',
+            file=SimpleUploadedFile("empty.pdf", make_pdf([""]), content_type="application/pdf"))
+
+        process_study_job(str(job.id))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILURE')
+        self.assertEqual(job.error, 'Could not extract enough readable text from the PDF.')
+
+    def test_jobs_are_private_to_their_owner(self):
+        job = StudyJob.objects.create(user=self.user, kind='FLASHCARDS', title='notes.pdf')
+        other = User.objects.create_user(username='other', password='password123')
+        self.client.force_login(other)
+
+        response = self.client.get(reverse('st:job_status', args=[job.id]))
+
+        self.assertEqual(response.status_code, 404)
@@ -14,5 +14,8 @@ urlpatterns = [
     # URL for the flashcard creation endpoint
     path('study-tools/create-flashcards/', views.create_flashcards, name='create_flashcards'),
 
+    # Status/result polling for background study-tool jobs
+    path('study-tools/jobs/<uuid:job_id>/', views.job_status, name='job_status'),
+
     # ... other URLs
 ]
\ No newline at end of file
@@ -1,6 +1,66 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save, pre_save
+
+
+def index_saved_resource(sender, instance, raw=False, **kwargs):
+    """Keeps the search index in step with resource titles and descriptions."""
+    if raw:
+        return
+    from .search import index_resource
+    index_resource(instance)
+
+
+def unindex_deleted_resource(sender, instance, **kwargs):
+    from .search import remove_resource
+    remove_resource(instance.pk)
+
+
+def index_extracted_text(sender, instance, raw=False, **kwargs):
+    """Adds a PDF's text to the index once extraction has stored it."""
+    if raw or instance.status != 'READY':
+        return
+    from .search import index_resource
+    index_resource(instance.resource, body=instance.text)
+
+
+# Models whose uploads live in the content-addressed blob storage
+STORED_FILE_FIELDS = {'Resource': 'file', 'UserProfile': 'profile_pic'}
+
+
+def remember_stored_file(sender, instance, raw=False, **kwargs):
+    """Notes the file a row pointed at before this save, to release it if it gets replaced."""
+    if raw or instance.pk is None:
+        return
+    field = STORED_FILE_FIELDS[sender.__name__]
+    instance._previous_file = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+def release_replaced_file(sender, instance, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_file', None)
+    instance._previous_file = None
+    current = getattr(instance, STORED_FILE_FIELDS[sender.__name__])
+    if previous and previous != current.name:
+        current.storage.delete(previous)
+
+
+def release_deleted_file(sender, instance, **kwargs):
+    """Drops the deleted row's reference to its file; unreferenced blobs are collected later."""
+    stored = getattr(instance, STORED_FILE_FIELDS[sender.__name__])
+    if stored:
+        stored.storage.delete(stored.name)
 
 
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from .models import Resource, ResourceText, UserProfile
+        post_save.connect(index_saved_resource, sender=Resource)
+        post_delete.connect(unindex_deleted_resource, sender=Resource)
+        post_save.connect(index_extracted_text, sender=ResourceText)
+
+        for model in (Resource, UserProfile):
+            pre_save.connect(remember_stored_file, sender=model)
+            post_save.connect(release_replaced_file, sender=model)
+            post_delete.connect(release_deleted_file, sender=model)
@@ -0,0 +1,120 @@
+import threading
+
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+
+from .models import Resource, ResourcePreview, ResourceText
+
+
+# NOTE: This file assumes Celery is configured and running in your Django environment.
+# Without a reachable broker, enqueue_resource_extraction() falls back to a local thread.
+
+@shared_task
+def extract_resource_text(resource_id):
+    """
+    Celery task that extracts and stores the text of a PDF Resource, so the
+    document is parsed once and AI processing and search read the stored text.
+    """
+    from ai_app.chunking import PAGE_BREAK
+    from ai_app.extraction import PdfSource, extract_text, page_count
+
+    try:
+        resource = Resource.objects.get(pk=resource_id)
+    except Resource.DoesNotExist:
+        # Resource was deleted before the worker picked it up, just exit gracefully.
+        return
+    if resource.resource_type != 'PDF' or not resource.file:
+        return
+
+    entry, _ = ResourceText.objects.get_or_create(resource=resource)
+    if entry.status == 'READY':
+        return
+
+    try:
+        with resource.file.open('rb') as pdf_file, PdfSource(pdf_file) as pdf:
+            content_hash = pdf.sha256()
+
+            # The same file uploaded again: reuse the text instead of parsing it
+            twin = (ResourceText.objects.filter(content_hash=content_hash, status='READY')
+                    .exclude(pk=entry.pk).first())
+            if twin:
+                entry.compressed_text = twin.compressed_text
+                entry.char_count, entry.page_count = twin.char_count, twin.page_count
+                entry.content_hash, entry.status, entry.error = content_hash, 'READY', ''
+                entry.save()
+                return
+
+            limit = getattr(settings, 'RESOURCE_TEXT_MAX_CHARS', 2000000)
+            text = extract_text(pdf, max_chars=limit)
+            # Every page ends with a page break, unless the budget cut the text short
+            pages = text.count(PAGE_BREAK) if len(text) < limit else page_count(pdf)
+        entry.store(text, pages, content_hash)
+    except Exception as e:
+        print(f"Text extraction for resource {resource_id} failed: {e}")
+        entry.fail(str(e))
+
+
+@shared_task
+def render_resource_previews(resource_id):
+    """
+    Celery task that renders the thumbnail and preview strip of a PDF Resource,
+    so the library page shows small images instead of loading the documents.
+    """
+    from ai_app.extraction import PdfSource
+    from .previews import render_previews
+
+    try:
+        resource = Resource.objects.get(pk=resource_id)
+    except Resource.DoesNotExist:
+        return
+    if resource.resource_type != 'PDF' or not resource.file:
+        return
+
+    preview, _ = ResourcePreview.objects.get_or_create(resource=resource)
+    try:
+        with resource.file.open('rb') as pdf_file, PdfSource(pdf_file) as pdf:
+            content_hash = pdf.sha256()
+            names = render_previews(pdf, content_hash)
+        preview.content_hash = content_hash
+        preview.thumbnail, preview.strip = names['thumbnail'], names['strip']
+        preview.status, preview.error = 'READY', ''
+        preview.save()
+    except Exception as e:
+        print(f"Preview rendering for resource {resource_id} failed: {e}")
+        preview.status, preview.error = 'FAILED', str(e)
+        preview.save(update_fields=['status', 'error', 'updated_at'])
+
+
+@shared_task
+def collect_unreferenced_blobs(reconcile=False):
+    """
+    Celery task that deletes stored files no Resource or profile references
+    any more. Schedule it periodically (e.g. hourly with celery beat).
+    """
+    from .storage import collect_garbage
+
+    result = collect_garbage(reconcile=reconcile)
+    print(f"Blob GC: deleted {result['deleted']} blob(s), freed {result['freed_bytes']} bytes.")
+    return result
+
+def _enqueue(task, resource, label):
+    """Hands the resource to a Celery worker once the creating transaction commits."""
+
+    def dispatch():
+        try:
+            task.delay(resource.pk)
+        except Exception as e:
+            # No broker (e.g. local development): run it in-process, off the request thread
+            print(f"Celery unavailable ({e}); {label} resource {resource.pk} in a local thread.")
+            threading.Thread(target=task, args=(resource.pk,), daemon=True).start()
+
+    transaction.on_commit(dispatch)
+
+
+def enqueue_resource_extraction(resource):
+    _enqueue(extract_resource_text, resource, 'extracting')
+
+
+def enqueue_resource_previews(resource):
+    _enqueue(render_resource_previews, resource, 'rendering previews for')
@@ -0,0 +1,89 @@
+# users/management/commands/benchmark_search.py
+
+import itertools
+import json
+import random
+import sqlite3
+import statistics
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.search import CREATE_FTS_SQL, FTS_TABLE, build_match, run_search
+
+
+
+def zipf_vocabulary(size: int, rng: random.Random):
+    """Made-up words with Zipf-like frequencies, like real prose: a few very common, most rare."""
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(size)]
+    return words, list(itertools.accumulate(1 / rank for rank in range(1, size + 1)))
+
+
+class Command(BaseCommand):
+    help = "Benchmarks FTS5 resource search latency on a synthetic in-memory index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=100000)
+        parser.add_argument('--words', type=int, default=200, help="Words of body text per document.")
+        parser.add_argument('--vocabulary', type=int, default=30000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def _build(self, db, documents, words, sample):
+        db.execute(CREATE_FTS_SQL)
+        rows = ((n + 1, sample(5), sample(20), sample(words)) for n in range(documents))
+        db.executemany(f"INSERT INTO {FTS_TABLE} (rowid, title, description, body) VALUES (?, ?, ?, ?)", rows)
+        db.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        db.commit()
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        vocabulary, weights = zipf_vocabulary(options['vocabulary'], rng)
+
+        def sample(count):
+            return " ".join(rng.choices(vocabulary, cum_weights=weights, k=count))
+
+        db = sqlite3.connect(":memory:")
+        started = time.perf_counter()
+        self._build(db, options['documents'], options['words'], sample)
+        build_seconds = time.perf_counter() - started
+
+        cursor = db.cursor()
+        timings = {'first_page': [], 'next_page': []}
+        for _ in range(options['queries']):
+            # One to three words, the last one half-typed
+            query = sample(rng.randint(1, 3))
+            match = build_match(query[:len(query) - rng.randint(0, 2)])
+            started = time.perf_counter()
+            rows = run_search(cursor, match, options['limit'])
+            timings['first_page'].append(time.perf_counter() - started)
+            if len(rows) == options['limit']:
+                started = time.perf_counter()
+                run_search(cursor, match, options['limit'], after=(rows[-1][1], rows[-1][0]))
+                timings['next_page'].append(time.perf_counter() - started)
+
+        def summary(samples):
+            samples = sorted(samples)
+            if not samples:
+                return None
+            return {'queries': len(samples),
+                    'p50_ms': round(statistics.median(samples) * 1000, 2),
+                    'p95_ms': round(samples[int(0.95 * (len(samples) - 1))] * 1000, 2),
+                    'max_ms': round(samples[-1] * 1000, 2)}
+
+        report = {'documents': options['documents'], 'words_per_document': options['words'],
+                  'build_seconds': round(build_seconds, 2),
+                  **{name: summary(samples) for name, samples in timings.items()}}
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"{report['documents']} documents indexed in {report['build_seconds']}s")
+        for name in timings:
+            row = report[name]
+            if row:
+                self.stdout.write(f"  {name:<11} p50 {row['p50_ms']:>7.2f} ms  p95 {row['p95_ms']:>7.2f} ms  "
+                                  f"max {row['max_ms']:>7.2f} ms  ({row['queries']} queries)")
@@ -0,0 +1,20 @@
+# users/management/commands/collect_blobs.py
+
+from django.core.management.base import BaseCommand
+
+from users.storage import collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Deletes stored upload blobs that no Resource or profile picture references any more."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-seconds', type=float, default=None,
+                            help="Keep blobs released more recently than this (default: BLOB_GC_GRACE_SECONDS).")
+        parser.add_argument('--reconcile', action='store_true',
+                            help="Recompute reference counts from the database first.")
+
+    def handle(self, *args, **options):
+        result = collect_garbage(options['grace_seconds'], reconcile=options['reconcile'])
+        self.stdout.write(f"Deleted {result['deleted']} blob(s), freed {result['freed_bytes']} bytes; "
+                          f"corrected {result['reconciled']} reference count(s).")
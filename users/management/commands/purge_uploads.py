@@ -0,0 +1,17 @@
+# users/management/commands/purge_uploads.py
+
+from django.core.management.base import BaseCommand
+
+from users.uploads import purge_expired_sessions
+
+
+class Command(BaseCommand):
+    help = "Deletes chunked uploads that were abandoned, together with their partial files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=None,
+                            help="Age after which an open upload is abandoned (default: CHUNKED_UPLOAD_EXPIRY_HOURS).")
+
+    def handle(self, *args, **options):
+        purged = purge_expired_sessions(options['hours'])
+        self.stdout.write(f"Purged {purged} abandoned upload(s).")
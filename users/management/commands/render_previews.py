@@ -0,0 +1,24 @@
+# users/management/commands/render_previews.py
+
+from django.core.management.base import BaseCommand
+
+from users.celery import render_resource_previews
+from users.models import Resource
+
+
+class Command(BaseCommand):
+    help = "Renders missing preview images for PDF resources uploaded before previews existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Re-check every PDF, not only those without previews.")
+
+    def handle(self, *args, **options):
+        resources = Resource.objects.filter(resource_type='PDF').exclude(file='').exclude(file=None)
+        if not options['all']:
+            resources = resources.exclude(preview__status='READY')
+
+        rendered = 0
+        for resource_id in resources.values_list('id', flat=True).iterator():
+            render_resource_previews(resource_id)
+            rendered += 1
+        self.stdout.write(f"Checked previews of {rendered} PDF resource(s).")
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:02
+
+import zlib
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Creates the FTS5 index (SQLite only) and fills it with the existing resources."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from users.search import CREATE_FTS_SQL, FTS_TABLE
+
+    Resource = apps.get_model('users', 'Resource')
+    ResourceText = apps.get_model('users', 'ResourceText')
+    bodies = {
+        entry.resource_id: zlib.decompress(entry.compressed_text).decode('utf-8')
+        for entry in ResourceText.objects.filter(status='READY').exclude(compressed_text=b'')
+    }
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CREATE_FTS_SQL)
+        for resource in Resource.objects.iterator():
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, description, body) VALUES (?, ?, ?, ?)",
+                [resource.pk, resource.title, resource.description or "", bodies.get(resource.pk, "")],
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from users.search import FTS_TABLE
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_resourcetext'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
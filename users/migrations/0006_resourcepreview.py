@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_resource_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourcePreview',
+            fields=[
+                ('resource', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='preview', serialize=False, to='users.resource')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('READY', 'Ready'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('thumbnail', models.CharField(blank=True, max_length=255)),
+                ('strip', models.CharField(blank=True, max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:59
+
+import users.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='resource',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=users.storage.blob_storage, upload_to='resources/pdfs/'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='profile_pic',
+            field=models.ImageField(blank=True, null=True, storage=users.storage.blob_storage, upload_to='profile_pic'),
+        ),
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refcount', 'updated_at'], name='users_store_refcoun_d8b08c_idx')],
+            },
+        ),
+    ]
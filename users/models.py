@@ -1,11 +1,17 @@
+import uuid
+import zlib
+
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
 from django.db import models
 
+from .storage import blob_storage
+
 
 class UserProfile(models.Model):
     # Set the related_name to 'userprofile'
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='userprofile')
-    profile_pic = models.ImageField(upload_to='profile_pic', null=True, blank=True)
+    profile_pic = models.ImageField(upload_to='profile_pic', storage=blob_storage, null=True, blank=True)
     about_me = models.TextField(null=True, blank=True)
 
     def __str__(self):
@@ -63,8 +69,8 @@ class Resource(models.Model):
     description = models.TextField(blank=True, null=True)
     resource_type = models.CharField(max_length=10, choices=RESOURCE_CHOICES)
 
-    # This field is crucial for file uploads
-    file = models.FileField(upload_to='resources/pdfs/', blank=True, null=True)
+    # This field is crucial for file uploads (stored once per distinct content, see storage.py)
+    file = models.FileField(upload_to='resources/pdfs/', storage=blob_storage, blank=True, null=True)
 
     # This field is for video links or flashcard deck links
     url = models.URLField(max_length=500, blank=True, null=True)
@@ -72,4 +78,136 @@ class Resource(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+
+class ResourceTextManager(models.Manager):
+    def stored_text(self, content_hash: str):
+        """Text already extracted from a file with this SHA-256, or None."""
+        if not content_hash:
+            return None
+        entry = self.filter(content_hash=content_hash, status='READY').only('compressed_text').first()
+        return entry.text if entry else None
+
+
+class ResourceText(models.Model):
+    """
+    Text extracted from a PDF Resource, stored zlib-compressed, with basic stats.
+
+    Kept out of the Resource table so listing resources never loads text.
+    Filled in by the extract_resource_text background task.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('READY', 'Ready'),
+        ('FAILED', 'Failed'),
+    ]
+
+    resource = models.OneToOneField(Resource, on_delete=models.CASCADE, primary_key=True, related_name='extracted')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of the file
+    page_count = models.PositiveIntegerField(default=0)
+    char_count = models.PositiveIntegerField(default=0)
+    compressed_text = models.BinaryField(blank=True, default=b'')
+    error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ResourceTextManager()
+
+    @property
+    def text(self) -> str:
+        if not self.compressed_text:
+            return ""
+        return zlib.decompress(self.compressed_text).decode('utf-8')
+
+    def store(self, text: str, page_count: int, content_hash: str):
+        self.compressed_text = zlib.compress(text.encode('utf-8'), 6)
+        self.char_count = len(text)
+        self.page_count = page_count
+        self.content_hash = content_hash
+        self.status = 'READY'
+        self.error = ''
+        self.save()
+
+    def fail(self, error: str):
+        self.status = 'FAILED'
+        self.error = error
+        self.save(update_fields=['status', 'error', 'updated_at'])
+
+    def __str__(self):
+        return f"Text of {self.resource_id} ({self.status})"
+
+
+class ResourcePreview(models.Model):
+    """
+    Preview images of a PDF Resource (a first-page thumbnail and a strip of the
+    first pages), rendered by the render_resource_previews background task.
+
+    The images are content-addressed files shared by identical uploads; see
+    previews.py.
+    """
+    STATUS_CHOICES = ResourceText.STATUS_CHOICES
+
+    resource = models.OneToOneField(Resource, on_delete=models.CASCADE, primary_key=True, related_name='preview')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    content_hash = models.CharField(max_length=64, blank=True)
+    thumbnail = models.CharField(max_length=255, blank=True)  # storage names
+    strip = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def thumbnail_url(self):
+        return default_storage.url(self.thumbnail) if self.thumbnail else None
+
+    @property
+    def strip_url(self):
+        return default_storage.url(self.strip) if self.strip else None
+
+    def __str__(self):
+        return f"Preview of {self.resource_id} ({self.status})"
+
+
+class UploadSession(models.Model):
+    """
+    A chunked, resumable upload in progress (see uploads.py).
+
+    Chunks are appended to a partial file on disk; `received_bytes` is the
+    offset of the last chunk that arrived intact, which is where the client
+    resumes after a dropped connection.
+    """
+    STATUS_CHOICES = [
+        ('OPEN', 'Open'),
+        ('COMPLETE', 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='upload_sessions')
+    title = models.CharField(max_length=200)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='OPEN')
+    resource = models.ForeignKey(Resource, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.received_bytes}/{self.size} bytes)"
+
+
+class StoredBlob(models.Model):
+    """One stored file content, shared by every upload of it, with its reference count."""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255, unique=True)  # storage name under blobs/
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # last reference change
+
+    class Meta:
+        indexes = [models.Index(fields=['refcount', 'updated_at'])]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
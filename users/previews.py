@@ -0,0 +1,77 @@
+# users/previews.py
+#
+# Small preview images for PDF resources, rendered with PyMuPDF by a
+# background worker, so the library page never has to load whole documents.
+# Previews are content-addressed (named by the PDF's SHA-256 and the
+# variant's settings): identical uploads share them, and they never go stale.
+
+import hashlib
+
+import fitz  # PyMuPDF
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+PREVIEW_DIR = 'resources/previews'
+
+# name -> rendering settings. `width` is per page in pixels; the strip shows
+# the first `pages` pages side by side in one image
+PREVIEW_VARIANTS = {
+    'thumbnail': {'width': 240, 'pages': 1, 'quality': 75},
+    'strip': {'width': 96, 'pages': 6, 'quality': 60},
+}
+
+
+def variant_key(variant: str) -> str:
+    """Short hash of a variant's settings; changing them renders new files instead of reusing old ones."""
+    options = getattr(settings, 'RESOURCE_PREVIEW_VARIANTS', PREVIEW_VARIANTS)[variant]
+    return hashlib.sha256(repr(sorted(options.items())).encode()).hexdigest()[:8]
+
+
+def preview_name(content_hash: str, variant: str) -> str:
+    """Storage name of a variant, e.g. resources/previews/ab/ab12…/thumbnail-1f2e3d4c.jpg."""
+    return f"{PREVIEW_DIR}/{content_hash[:2]}/{content_hash}/{variant}-{variant_key(variant)}.jpg"
+
+
+def _render(doc, width: int, pages: int, quality: int) -> bytes:
+    """JPEG of the first `pages` pages of `doc`, laid side by side."""
+    pages = max(1, min(pages, doc.page_count))
+    scale = width / doc[0].rect.width
+    height = round(doc[0].rect.height * scale)
+
+    if pages == 1:
+        pixmap = doc[0].get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+    else:
+        # Place the pages on one canvas page and rasterize it once
+        canvas = fitz.open()
+        sheet = canvas.new_page(width=width * pages, height=height)
+        for number in range(pages):
+            sheet.show_pdf_page(fitz.Rect(number * width, 0, (number + 1) * width, height), doc, number)
+        pixmap = sheet.get_pixmap(alpha=False)
+        canvas.close()
+    return pixmap.tobytes('jpg', jpg_quality=quality)
+
+
+def render_previews(pdf, content_hash: str) -> dict:
+    """
+    Makes sure every preview variant of a PDF exists in storage.
+
+    `pdf` is an ai_app.extraction.PdfSource. Variants already stored under
+    this content hash are reused without opening the document. Returns
+    {variant: storage name}.
+    """
+    variants = getattr(settings, 'RESOURCE_PREVIEW_VARIANTS', PREVIEW_VARIANTS)
+    names = {variant: preview_name(content_hash, variant) for variant in variants}
+    missing = [variant for variant, name in names.items() if not default_storage.exists(name)]
+    if not missing:
+        return names
+
+    doc = pdf.open_pymupdf()
+    try:
+        if not doc.page_count:
+            raise ValueError("The PDF has no pages.")
+        for variant in missing:
+            default_storage.save(names[variant], ContentFile(_render(doc, **variants[variant])))
+    finally:
+        doc.close()
+    return names
@@ -0,0 +1,190 @@
+# users/search.py
+#
+# Full-text search over the resource library, backed by an SQLite FTS5 index
+# of resource titles, descriptions and extracted PDF text. The index is kept
+# in sync by the signal handlers connected in apps.py.
+
+import base64
+import json
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.utils.html import escape
+
+FTS_TABLE = 'users_resource_fts'
+
+CREATE_FTS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    "USING fts5(title, description, body, tokenize='porter unicode61 remove_diacritics 2')"
+)
+
+MIN_PREFIX_CHARS = 3
+
+# Title matches weigh most, then the description, then the document text
+RANK_SQL = f"bm25({FTS_TABLE}, 10.0, 4.0, 1.0)"
+
+# Snippet markers; replaced with <mark> after the text is HTML-escaped
+_OPEN, _CLOSE = "\x02", "\x03"
+
+SEARCH_SQL = (
+    f"SELECT rowid, {RANK_SQL} AS score FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ? "
+    "ORDER BY score, rowid LIMIT ?"
+)
+
+# Keyset page: everything ranked after the last row of the previous page. The
+# CTE is materialized so bm25() runs once per match, not again for the filter
+SEARCH_AFTER_SQL = (
+    f"WITH ranked AS MATERIALIZED (SELECT rowid, {RANK_SQL} AS score FROM {FTS_TABLE} "
+    f"WHERE {FTS_TABLE} MATCH ?) SELECT rowid, score FROM ranked "
+    "WHERE score > ? OR (score = ? AND rowid > ?) ORDER BY score, rowid LIMIT ?"
+)
+
+SNIPPET_SQL = (
+    f"SELECT rowid, highlight({FTS_TABLE}, 0, '{_OPEN}', '{_CLOSE}'), "
+    f"snippet({FTS_TABLE}, -1, '{_OPEN}', '{_CLOSE}', '…', 24) "
+    f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ? AND rowid IN ({{ids}})"
+)
+
+
+def fts_enabled() -> bool:
+    return connection.vendor == 'sqlite' and getattr(settings, 'RESOURCE_SEARCH_FTS', True)
+
+
+def build_match(query: str) -> str:
+    """
+    Turns free text into a safe FTS5 query: every word must match, and the
+    last one matches as a prefix so results update while typing (once it
+    has MIN_PREFIX_CHARS; shorter prefixes match most of the index).
+    """
+    words = re.findall(r"[^\W_]+", query or "")
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    if len(words[-1]) >= MIN_PREFIX_CHARS:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def encode_cursor(score: float, rowid: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([score, rowid]).encode()).decode()
+
+
+def decode_cursor(token: str):
+    try:
+        score, rowid = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return float(score), int(rowid)
+    except (ValueError, TypeError):
+        return None
+
+
+def _marked_html(text: str) -> str:
+    return escape(text or "").replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>")
+
+
+def run_search(cursor, match: str, limit: int, after=None) -> list:
+    """
+    Runs a ranked search on a DB-API cursor (Django's or plain sqlite3).
+
+    Returns (rowid, score, title_html, snippet_html) tuples for one page.
+    Snippets are only built for the rows on that page.
+    """
+    if after:
+        cursor.execute(SEARCH_AFTER_SQL, [match, after[0], after[0], after[1], limit])
+    else:
+        cursor.execute(SEARCH_SQL, [match, limit])
+    ranked = cursor.fetchall()
+    if not ranked:
+        return []
+
+    ids = [row[0] for row in ranked]
+    cursor.execute(SNIPPET_SQL.format(ids=",".join("?" * len(ids))), [match, *ids])
+    snippets = {rowid: (title, snippet) for rowid, title, snippet in cursor.fetchall()}
+    return [(rowid, score, _marked_html(snippets[rowid][0]), _marked_html(snippets[rowid][1]))
+            for rowid, score in ranked if rowid in snippets]
+
+
+def search_resources(query: str, limit: int = 20, cursor_token: str = None) -> dict:
+    """BM25-ranked resources matching `query`, with highlighted snippets and a next-page cursor."""
+    from .models import Resource
+
+    match = build_match(query)
+    if not match:
+        return {'results': [], 'next_cursor': None}
+    after = decode_cursor(cursor_token) if cursor_token else None
+
+    if fts_enabled():
+        with connection.cursor() as cursor:
+            rows = run_search(cursor, match, limit, after)
+    else:
+        # Other databases: unranked substring match, paged by id
+        queryset = Resource.objects.filter(title__icontains=query) | Resource.objects.filter(
+            description__icontains=query)
+        if after:
+            queryset = queryset.filter(id__gt=after[1])
+        rows = [(pk, 0.0, escape(title), escape(description or ""))
+                for pk, title, description in queryset.order_by('id').values_list('id', 'title', 'description')[:limit]]
+
+    resources = Resource.objects.in_bulk([row[0] for row in rows])
+    results = []
+    for rowid, score, title_html, snippet_html in rows:
+        resource = resources.get(rowid)
+        if resource is None:
+            continue
+        results.append({
+            'id': resource.id,
+            'title': resource.title,
+            'title_html': title_html,
+            'snippet_html': snippet_html,
+            'resource_type': resource.resource_type,
+            'url': resource.file.url if resource.file else resource.url,
+            'score': round(score, 4),
+        })
+
+    next_cursor = encode_cursor(rows[-1][1], rows[-1][0]) if len(rows) == limit else None
+    return {'results': results, 'next_cursor': next_cursor}
+
+
+# --- Index maintenance ---
+
+def _stored_body(resource) -> str:
+    from .models import ResourceText
+
+    entry = ResourceText.objects.filter(resource_id=resource.pk, status='READY').first()
+    return entry.text if entry else ""
+
+
+def index_resource(resource, body: str = None):
+    """Adds or refreshes one resource in the index."""
+    if not fts_enabled():
+        return
+    if body is None:
+        body = _stored_body(resource)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = ?", [resource.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, description, body) VALUES (?, ?, ?, ?)",
+            [resource.pk, resource.title, resource.description or "", body],
+        )
+
+
+def remove_resource(resource_id: int):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = ?", [resource_id])
+
+
+def rebuild_index() -> int:
+    """Re-indexes every resource; returns how many were indexed."""
+    from .models import Resource
+
+    if not fts_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    count = 0
+    for resource in Resource.objects.iterator():
+        index_resource(resource)
+        count += 1
+    return count
@@ -0,0 +1,171 @@
+# users/storage.py
+#
+# Content-addressed media storage for uploaded files (Resource.file and
+# UserProfile.profile_pic). A file is stored once per distinct content, as
+# blobs/<h0h1>/<h2h3>/<sha256><ext>. Identical uploads share that blob, and
+# a StoredBlob row counts the references to it. Deleting a file only
+# releases a reference; collect_garbage() (the collect_blobs task/command)
+# removes blobs nobody references any more. A blob's name never changes its
+# content, so its URL can be cached as immutable.
+
+import hashlib
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+BLOB_DIR = 'blobs'
+
+
+def blob_name(digest: str, extension: str) -> str:
+    return f"{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def is_blob(name: str) -> bool:
+    return bool(name) and name.replace('\\', '/').startswith(BLOB_DIR + '/')
+
+
+def _digest(content) -> tuple:
+    """
+    SHA-256 and size of a Django File: its `sha256` attribute when the
+    caller already hashed it (finished chunked uploads), otherwise read in
+    chunks (or from its temp file path).
+    """
+    if getattr(content, 'sha256', None):
+        return content.sha256, content.size
+    if hasattr(content, 'temporary_file_path'):
+        path = content.temporary_file_path()
+        with open(path, 'rb') as handle:
+            return hashlib.file_digest(handle, 'sha256').hexdigest(), os.path.getsize(path)
+    hasher, size = hashlib.sha256(), 0
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        hasher.update(chunk)
+        size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files by content and keeps one copy per content."""
+
+    def _save(self, name, content):
+        from .models import StoredBlob
+
+        digest, size = _digest(content)
+        extension = os.path.splitext(name)[1].lower()[:10]
+        with transaction.atomic():
+            blob, _ = StoredBlob.objects.get_or_create(
+                sha256=digest, defaults={'name': blob_name(digest, extension), 'size': size})
+            StoredBlob.objects.filter(pk=digest).update(refcount=F('refcount') + 1, updated_at=timezone.now())
+
+        if not self.exists(blob.name):
+            self._write(blob.name, content)
+        return blob.name
+
+    def _write(self, name, content):
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if hasattr(content, 'temporary_file_path'):
+            # Another upload of the same content may land at the same time;
+            # the bytes are identical, so overwriting is harmless
+            file_move_safe(content.temporary_file_path(), full_path, allow_overwrite=True)
+        else:
+            # Written beside the blob and renamed, so a blob is never seen half-written
+            partial = f"{full_path}.{uuid.uuid4().hex}.part"
+            if hasattr(content, 'seek'):
+                content.seek(0)
+            with open(partial, 'wb') as handle:
+                for chunk in content.chunks():
+                    handle.write(chunk)
+            os.replace(partial, full_path)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+    def delete(self, name):
+        """Releases one reference; the blob itself goes in the next collect_garbage()."""
+        if not is_blob(name):
+            return super().delete(name)
+        from .models import StoredBlob
+
+        StoredBlob.objects.filter(name=name, refcount__gt=0).update(
+            refcount=F('refcount') - 1, updated_at=timezone.now())
+
+
+_storage = ContentAddressedStorage()
+
+
+def blob_storage():
+    """The storage of uploaded files (a callable, so migrations don't depend on its settings)."""
+    return _storage
+
+
+def referenced_blobs() -> dict:
+    """Blob name -> number of model rows that point at it."""
+    from .models import Resource, UserProfile
+
+    counts = {}
+    for model, field in ((Resource, 'file'), (UserProfile, 'profile_pic')):
+        for name in model.objects.filter(**{f'{field}__startswith': BLOB_DIR + '/'}).values_list(field, flat=True):
+            counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def collect_garbage(grace_seconds: float = None, reconcile: bool = False) -> dict:
+    """
+    Deletes blobs that have had no references for `grace_seconds`.
+
+    The grace period covers a file stored just before the row pointing at it
+    is committed. With `reconcile`, reference counts are first recomputed
+    from the rows that use the storage, which repairs counts left behind
+    by failed saves or deletes that bypassed the model.
+    """
+    from .models import StoredBlob
+
+    if grace_seconds is None:
+        grace_seconds = getattr(settings, 'BLOB_GC_GRACE_SECONDS', 3600)
+    storage = blob_storage()
+    fixed = 0
+    if reconcile:
+        actual = referenced_blobs()
+        for blob in StoredBlob.objects.all():
+            if blob.refcount != actual.get(blob.name, 0):
+                StoredBlob.objects.filter(pk=blob.pk).update(refcount=actual.get(blob.name, 0))
+                fixed += 1
+
+    cutoff = timezone.now() - timedelta(seconds=grace_seconds)
+    deleted, freed = 0, 0
+    for blob in StoredBlob.objects.filter(refcount=0, updated_at__lt=cutoff):
+        # Moved aside first: an upload of the same content racing with us sees
+        # the blob missing and writes it again, instead of trusting a file
+        # that is about to disappear
+        path = storage.path(blob.name)
+        doomed = f"{path}.{uuid.uuid4().hex}.gc"
+        try:
+            os.rename(path, doomed)
+        except FileNotFoundError:
+            doomed = None
+        if StoredBlob.objects.filter(pk=blob.pk, refcount=0).delete()[0]:
+            if doomed:
+                os.remove(doomed)
+            deleted += 1
+            freed += blob.size
+        elif doomed:
+            # Referenced again meanwhile; put it back (same content if it was rewritten)
+            os.replace(doomed, path)
+    return {'deleted': deleted, 'freed_bytes': freed, 'reconciled': fixed}
+
+
+def serve_blob(request, path):
+    """Development server view for blobs: their content never changes, so they are cacheable for good."""
+    from django.views.static import serve
+
+    response = serve(request, path, document_root=os.path.join(settings.MEDIA_ROOT, BLOB_DIR))
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
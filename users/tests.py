@@ -1,3 +1,388 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import zlib
+from unittest.mock import patch
 
-# Create your tests here.
+import fitz
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from ai_app.benchmarking import make_pdf
+from ai_app.utils import aextract_text_from_pdf, extract_text_from_pdf
+from .celery import extract_resource_text, render_resource_previews
+from .models import Resource, ResourcePreview, ResourceText, StoredBlob, UploadSession, UserProfile
+from .search import build_match, search_resources
+from . import uploads
+from .storage import blob_storage, collect_garbage, serve_blob
+
+
+class ResourceTextTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.override = override_settings(MEDIA_ROOT=self.media.name)
+        self.override.enable()
+        self.pdf = make_pdf(["Photosynthesis converts light into chemical energy. " * 5, "Second page"])
+
+    def tearDown(self):
+        self.override.disable()
+        self.media.cleanup()
+
+    @patch('users.views.enqueue_resource_extraction')
+    def test_upload_queues_extraction(self, mock_enqueue):
+        upload = SimpleUploadedFile("bio.pdf", self.pdf, content_type="application/pdf")
+        self.client.post(reverse('upload_document'), {'title': 'Biology', 'pdf_file': upload})
+
+        resource = Resource.objects.get(title='Biology')
+        self.assertEqual(resource.extracted.status, 'PENDING')
+        mock_enqueue.assert_called_once_with(resource)
+
+    def test_text_and_stats_are_stored_compressed(self):
+        resource = Resource.objects.create(title="Bio", resource_type='PDF',
+                                           file=SimpleUploadedFile("bio.pdf", self.pdf))
+        extract_resource_text(resource.pk)
+
+        entry = ResourceText.objects.get(resource=resource)
+        self.assertEqual(entry.status, 'READY')
+        self.assertEqual(entry.page_count, 2)
+        self.assertEqual(entry.char_count, len(entry.text))
+        self.assertEqual(entry.content_hash, hashlib.sha256(self.pdf).hexdigest())
+        self.assertIn("Photosynthesis", entry.text)
+        self.assertLess(len(entry.compressed_text), entry.char_count)
+        self.assertEqual(zlib.decompress(entry.compressed_text).decode(), entry.text)
+
+    def test_same_file_is_parsed_once(self):
+        first = Resource.objects.create(title="A", resource_type='PDF', file=SimpleUploadedFile("a.pdf", self.pdf))
+        second = Resource.objects.create(title="B", resource_type='PDF', file=SimpleUploadedFile("b.pdf", self.pdf))
+        extract_resource_text(first.pk)
+
+        with patch('ai_app.extraction.extract_text', side_effect=AssertionError("parsed again")):
+            extract_resource_text(second.pk)
+            # Study tools reuse the stored text for an identical upload too
+            text = extract_text_from_pdf(SimpleUploadedFile("again.pdf", self.pdf))
+
+        self.assertEqual(ResourceText.objects.get(resource=second).text, first.extracted.text)
+        self.assertIn("Photosynthesis", text)
+
+    def test_async_extraction_queries_on_the_request_thread(self):
+        resource = Resource.objects.create(title="A", resource_type='PDF', file=SimpleUploadedFile("a.pdf", self.pdf))
+        extract_resource_text(resource.pk)
+        lookup_threads = []
+        stored_text = ResourceText.objects.stored_text
+
+        def lookup(digest):
+            lookup_threads.append(threading.current_thread())
+            return stored_text(digest)
+
+        with patch.object(ResourceText.objects, 'stored_text', side_effect=lookup):
+            text = async_to_sync(aextract_text_from_pdf)(SimpleUploadedFile("again.pdf", self.pdf))
+
+        # Not on an executor thread, whose connection Django would never close
+        self.assertEqual(lookup_threads, [threading.current_thread()])
+        self.assertIn("Photosynthesis", text)
+
+    def test_broken_pdf_is_marked_failed(self):
+        resource = Resource.objects.create(title="Bad", resource_type='PDF',
+                                           file=SimpleUploadedFile("bad.pdf", b"not a pdf"))
+        extract_resource_text(resource.pk)
+
+        self.assertEqual(ResourceText.objects.get(resource=resource).status, 'FAILED')
+
+
+class ResourceSearchTest(TestCase):
+    def setUp(self):
+        self.bio = Resource.objects.create(title="Photosynthesis notes", description="Biology chapter 3",
+                                           resource_type='PDF')
+        self.chem = Resource.objects.create(title="Chemistry flashcards", description="Covers photosynthesis briefly",
+                                            resource_type='FLASHCARD')
+        self.video = Resource.objects.create(title="Video: Linear algebra", resource_type='VIDEO',
+                                             url="https://example.com/la")
+
+    def test_build_match_quotes_words_and_prefixes_the_last(self):
+        self.assertEqual(build_match('cell "division'), '"cell" "division"*')
+        self.assertEqual(build_match('  -- '), '')
+
+    def test_title_matches_rank_first_and_are_highlighted(self):
+        results = search_resources("photosynthesis")['results']
+
+        self.assertEqual([r['id'] for r in results], [self.bio.id, self.chem.id])
+        self.assertIn("<mark>Photosynthesis</mark>", results[0]['title_html'])
+        self.assertIn("<mark>photosynthesis</mark>", results[1]['snippet_html'])
+
+    def test_extracted_text_is_indexed_and_escaped(self):
+        entry = ResourceText.objects.create(resource=self.video)
+        entry.store("Eigenvalues <script>x</script> of a matrix", 1, "abc")
+
+        results = search_resources("eigenvalue")['results']
+        self.assertEqual([r['id'] for r in results], [self.video.id])
+        self.assertIn("<mark>Eigenvalues</mark>", results[0]['snippet_html'])
+        self.assertNotIn("<script>", results[0]['snippet_html'])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.video.title = "Video: Photosynthesis explained"
+        self.video.save()
+        self.assertIn(self.video.id, [r['id'] for r in search_resources("photosynthesis")['results']])
+
+        self.bio.delete()
+        self.assertNotIn(self.bio.id, [r['id'] for r in search_resources("photosynthesis")['results']])
+
+    def test_cursor_pages_through_every_result_once(self):
+        for n in range(7):
+            Resource.objects.create(title=f"Genetics part {n}", resource_type='PDF')
+
+        seen, cursor = [], None
+        while True:
+            page = search_resources("genetics", limit=3, cursor_token=cursor)
+            seen += [r['id'] for r in page['results']]
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+
+    def test_search_endpoint(self):
+        response = self.client.get(reverse('resource_search'), {'q': 'linear alg'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['id'] for r in response.json()['results']], [self.video.id])
+        self.assertEqual(self.client.get(reverse('resource_search'), {'q': 'x', 'limit': 'many'}).status_code, 400)
+
+
+class ResourcePreviewTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.override = override_settings(MEDIA_ROOT=self.media.name)
+        self.override.enable()
+        self.pdf = make_pdf([f"Page {n} of the lecture notes" for n in range(1, 9)])
+
+    def tearDown(self):
+        self.override.disable()
+        self.media.cleanup()
+
+    def _resource(self, name="notes.pdf"):
+        return Resource.objects.create(title="Notes", resource_type='PDF', file=SimpleUploadedFile(name, self.pdf))
+
+    def test_previews_are_small_content_addressed_jpegs(self):
+        resource = self._resource()
+        render_resource_previews(resource.pk)
+
+        preview = ResourcePreview.objects.get(resource=resource)
+        content_hash = hashlib.sha256(self.pdf).hexdigest()
+        self.assertEqual(preview.status, 'READY')
+        self.assertEqual(preview.content_hash, content_hash)
+        for name in (preview.thumbnail, preview.strip):
+            self.assertIn(content_hash, name)
+            with default_storage.open(name) as image:
+                data = image.read()
+            self.assertTrue(data.startswith(b"\xff\xd8"))  # JPEG
+            self.assertLess(len(data), len(self.pdf))
+
+        strip = fitz.Pixmap(default_storage.path(preview.strip))
+        self.assertEqual(strip.width, 96 * 6)
+
+    def test_identical_upload_reuses_stored_previews(self):
+        render_resource_previews(self._resource("a.pdf").pk)
+        second = self._resource("b.pdf")
+
+        with patch('users.previews._render', side_effect=AssertionError("rendered again")):
+            render_resource_previews(second.pk)
+
+        self.assertEqual(ResourcePreview.objects.get(resource=second).status, 'READY')
+
+    @patch('users.views.enqueue_resource_previews')
+    @patch('users.views.enqueue_resource_extraction')
+    def test_upload_queues_previews_and_library_shows_them(self, mock_extract, mock_previews):
+        upload = SimpleUploadedFile("notes.pdf", self.pdf, content_type="application/pdf")
+        self.client.post(reverse('upload_document'), {'title': 'Lecture', 'pdf_file': upload})
+        resource = Resource.objects.get(title='Lecture')
+        mock_previews.assert_called_once_with(resource)
+
+        render_resource_previews(resource.pk)
+        response = self.client.get(reverse('resource_library'))
+        self.assertContains(response, resource.preview.thumbnail_url)
+        self.assertContains(response, resource.preview.strip_url)
+
+
+@override_settings(CHUNKED_UPLOAD_CHUNK_SIZE=1024)
+class ChunkedUploadTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.override = override_settings(MEDIA_ROOT=self.media.name)
+        self.override.enable()
+        self.pdf = make_pdf([f"Chapter {n} " + "lorem ipsum " * 40 for n in range(6)])
+
+    def tearDown(self):
+        self.override.disable()
+        self.media.cleanup()
+
+    def _start(self, **overrides):
+        body = {'title': 'Big notes', 'filename': 'notes.pdf', 'size': len(self.pdf), **overrides}
+        return self.client.post(reverse('start_upload'), json.dumps(body), content_type='application/json')
+
+    def _put(self, upload_id, offset, chunk, checksum=None):
+        return self.client.put(
+            f"{reverse('upload_chunk', args=[upload_id])}?offset={offset}", chunk,
+            content_type='application/octet-stream',
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(chunk).hexdigest())
+
+    def _send_all(self, upload_id, offset=0):
+        while offset < len(self.pdf):
+            response = self._put(upload_id, offset, self.pdf[offset:offset + 1024])
+            self.assertEqual(response.status_code, 200)
+            offset = response.json()['offset']
+
+    @patch('users.celery.enqueue_resource_previews')
+    @patch('users.celery.enqueue_resource_extraction')
+    def test_chunks_are_assembled_into_a_resource(self, mock_extract, mock_previews):
+        upload_id = self._start().json()['upload_id']
+        self._send_all(upload_id)
+
+        # Stored under the hash built from the chunks, without reading the file again
+        with patch('hashlib.file_digest', side_effect=AssertionError("file hashed twice")):
+            response = self.client.post(reverse('complete_upload', args=[upload_id]),
+                                        json.dumps({'sha256': hashlib.sha256(self.pdf).hexdigest()}),
+                                        content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        resource = Resource.objects.get(id=response.json()['resource_id'])
+        with resource.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.pdf)
+        self.assertEqual(resource.extracted.content_hash, hashlib.sha256(self.pdf).hexdigest())
+        mock_extract.assert_called_once_with(resource)
+        mock_previews.assert_called_once_with(resource)
+        self.assertFalse(os.path.exists(uploads.partial_path(UploadSession.objects.get(id=upload_id))))
+
+    @patch('users.celery.enqueue_resource_previews')
+    @patch('users.celery.enqueue_resource_extraction')
+    def test_second_complete_is_a_conflict(self, mock_extract, mock_previews):
+        upload_id = self._start().json()['upload_id']
+        self._send_all(upload_id)
+        # Both loaded while the upload was still open, like two overlapping requests
+        first, retry = UploadSession.objects.get(id=upload_id), UploadSession.objects.get(id=upload_id)
+
+        resource, _ = uploads.complete_session(first)
+        with self.assertRaises(uploads.UploadError) as raised:
+            uploads.complete_session(retry)
+        self.assertEqual((raised.exception.status, raised.exception.extra), (409, {'resource_id': resource.id}))
+        self.assertEqual(Resource.objects.count(), 1)
+
+    def test_bad_chunk_is_rejected_and_resent(self):
+        upload_id = self._start().json()['upload_id']
+        self._put(upload_id, 0, self.pdf[:1024])
+
+        corrupted = self._put(upload_id, 1024, b"x" * 1024, checksum=hashlib.sha256(self.pdf[1024:2048]).hexdigest())
+        self.assertEqual((corrupted.status_code, corrupted.json()['offset']), (422, 1024))
+        skipped = self._put(upload_id, 4096, self.pdf[4096:5120])
+        self.assertEqual((skipped.status_code, skipped.json()['offset']), (409, 1024))
+
+        self._send_all(upload_id, offset=1024)
+        response = self.client.post(reverse('complete_upload', args=[upload_id]))
+        self.assertEqual(response.json()['sha256'], hashlib.sha256(self.pdf).hexdigest())
+
+    def test_resume_in_another_worker_rebuilds_the_hash(self):
+        upload_id = self._start().json()['upload_id']
+        self._put(upload_id, 0, self.pdf[:1024])
+        uploads._hashers.clear()  # as if the next chunk reached a different process
+
+        self.assertEqual(self.client.get(reverse('upload_chunk', args=[upload_id])).json()['offset'], 1024)
+        self._send_all(upload_id, offset=1024)
+        response = self.client.post(reverse('complete_upload', args=[upload_id]))
+        self.assertEqual(response.json()['sha256'], hashlib.sha256(self.pdf).hexdigest())
+
+    def test_chunk_is_streamed_in_small_blocks(self):
+        session = uploads.open_session(None, "Notes", "notes.pdf", len(self.pdf))
+        stream = io.BytesIO(self.pdf[:1024])
+        reads = []
+        original_read = stream.read
+        stream.read = lambda size: reads.append(size) or original_read(size)
+
+        with self.settings(CHUNKED_UPLOAD_CHUNK_SIZE=1024), patch.object(uploads, 'READ_BLOCK', 256):
+            uploads.write_chunk(session, 0, stream, 1024, hashlib.sha256(self.pdf[:1024]).hexdigest())
+        self.assertEqual(reads, [256, 256, 256, 256])
+
+    def test_limits_and_ownership(self):
+        self.assertEqual(self._start(filename='notes.exe').status_code, 400)
+        with self.settings(CHUNKED_UPLOAD_MAX_BYTES=100):
+            self.assertEqual(self._start().status_code, 413)
+
+        upload_id = self._start().json()['upload_id']
+        self.assertEqual(self._put(upload_id, 0, self.pdf[:2048]).status_code, 400)  # larger than a chunk
+        self.assertEqual(self.client.post(reverse('complete_upload', args=[upload_id])).status_code, 409)
+
+        User.objects.create_user('other', password='pw')
+        self.client.login(username='other', password='pw')
+        self.assertEqual(self.client.get(reverse('upload_chunk', args=[upload_id])).status_code, 404)
+
+
+class BlobStorageTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.override = override_settings(MEDIA_ROOT=self.media.name)
+        self.override.enable()
+        self.pdf = make_pdf(["Shared handout"])
+        self.digest = hashlib.sha256(self.pdf).hexdigest()
+
+    def tearDown(self):
+        self.override.disable()
+        self.media.cleanup()
+
+    def _resource(self, name, data=None):
+        return Resource.objects.create(title=name, resource_type='PDF',
+                                       file=SimpleUploadedFile(name, data or self.pdf))
+
+    def test_identical_uploads_share_one_content_addressed_blob(self):
+        first, second = self._resource("a.pdf"), self._resource("b.pdf")
+
+        expected = f"blobs/{self.digest[:2]}/{self.digest[2:4]}/{self.digest}.pdf"
+        self.assertEqual((first.file.name, second.file.name), (expected, expected))
+        self.assertEqual(StoredBlob.objects.get(pk=self.digest).refcount, 2)
+        self.assertEqual(os.listdir(os.path.dirname(blob_storage().path(expected))), [f"{self.digest}.pdf"])
+        with second.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.pdf)
+
+        response = serve_blob(RequestFactory().get(first.file.url), expected.removeprefix('blobs/'))
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_blob_is_collected_after_its_last_reference_goes(self):
+        first, second = self._resource("a.pdf"), self._resource("b.pdf")
+        path = blob_storage().path(first.file.name)
+
+        first.delete()
+        self.assertEqual(collect_garbage(grace_seconds=0)['deleted'], 0)
+        self.assertTrue(os.path.exists(path))
+
+        second.delete()
+        self.assertEqual(collect_garbage()['deleted'], 0)  # still within the grace period
+        self.assertEqual(collect_garbage(grace_seconds=0), {'deleted': 1, 'freed_bytes': len(self.pdf), 'reconciled': 0})
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(StoredBlob.objects.exists())
+
+    def test_replaced_profile_picture_is_released(self):
+        profile = UserProfile.objects.create(user=User.objects.create_user('ana', password='pw'))
+        profile.profile_pic = SimpleUploadedFile("me.gif", b"GIF89a-one")
+        profile.save()
+        old_name = profile.profile_pic.name
+
+        profile.profile_pic = SimpleUploadedFile("me.gif", b"GIF89a-two")
+        profile.save()
+
+        self.assertEqual(StoredBlob.objects.get(name=old_name).refcount, 0)
+        self.assertEqual(StoredBlob.objects.get(name=profile.profile_pic.name).refcount, 1)
+
+    def test_reconcile_repairs_counts(self):
+        resource = self._resource("a.pdf")
+        StoredBlob.objects.filter(pk=self.digest).update(refcount=5)
+        orphan = self._resource("orphan.pdf", make_pdf(["Orphan"]))
+        Resource.objects.filter(pk=orphan.pk).update(file='')  # bypasses the model, so no release
+
+        result = collect_garbage(grace_seconds=0, reconcile=True)
+
+        self.assertEqual((result['reconciled'], result['deleted']), (2, 1))
+        self.assertEqual(StoredBlob.objects.get(name=resource.file.name).refcount, 1)
@@ -0,0 +1,255 @@
+# users/uploads.py
+#
+# Chunked, resumable uploads. The client opens a session, then sends the
+# file in fixed-size chunks, each with its SHA-256. A chunk is streamed
+# straight to a partial file on disk, so a request never holds more than
+# one read block in memory. Only a chunk that arrives intact advances the
+# session's offset, and after a dropped connection the client resumes from
+# there. The file's own SHA-256 is updated chunk by chunk as they arrive.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+READ_BLOCK = 64 * 1024
+
+
+class UploadError(Exception):
+    """A rejected upload request; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def chunk_size() -> int:
+    return getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 1024 * 1024)
+
+
+def max_upload_bytes() -> int:
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_BYTES', 200 * 1024 * 1024)
+
+
+def partial_dir() -> str:
+    return getattr(settings, 'CHUNKED_UPLOAD_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'uploads', 'partial')
+
+
+def partial_path(session) -> str:
+    return os.path.join(partial_dir(), f"{session.id}.part")
+
+
+# Running file hashes, so each chunk is hashed once. A session whose hasher
+# isn't here (another worker took the earlier chunks, or a restart) gets it
+# rebuilt once from the bytes already on disk.
+_hashers = OrderedDict()  # session id -> (offset, hasher)
+_hashers_lock = threading.Lock()
+_MAX_HASHERS = 256
+
+# One chunk at a time per session in this process
+_session_locks = {}
+
+
+def _session_lock(session_id):
+    with _hashers_lock:
+        return _session_locks.setdefault(session_id, threading.Lock())
+
+
+def _running_hash(session):
+    with _hashers_lock:
+        cached = _hashers.get(session.id)
+    if cached and cached[0] == session.received_bytes:
+        return cached[1].copy()
+
+    hasher = hashlib.sha256()
+    remaining = session.received_bytes
+    if remaining:
+        with open(partial_path(session), 'rb') as handle:
+            while remaining:
+                block = handle.read(min(READ_BLOCK, remaining))
+                if not block:
+                    raise UploadError("Partial upload is missing data; restart the upload.", status=410)
+                hasher.update(block)
+                remaining -= len(block)
+    return hasher
+
+
+def _remember_hash(session, offset: int, hasher):
+    with _hashers_lock:
+        _hashers[session.id] = (offset, hasher)
+        _hashers.move_to_end(session.id)
+        while len(_hashers) > _MAX_HASHERS:
+            _hashers.popitem(last=False)
+
+
+def _forget(session):
+    with _hashers_lock:
+        _hashers.pop(session.id, None)
+        _session_locks.pop(session.id, None)
+
+
+def open_session(user, title: str, filename: str, size: int):
+    """Starts an upload of `size` bytes and creates its empty partial file."""
+    from .models import UploadSession
+
+    if not title or not filename:
+        raise UploadError("title and filename are required.")
+    if not filename.lower().endswith('.pdf'):
+        raise UploadError("Only PDF files can be uploaded.")
+    if not isinstance(size, int) or size <= 0:
+        raise UploadError("size must be a positive number of bytes.")
+    if size > max_upload_bytes():
+        raise UploadError(f"File is larger than the {max_upload_bytes() // (1024 * 1024)}MB limit.", status=413)
+
+    session = UploadSession.objects.create(
+        user=user if user and user.is_authenticated else None,
+        title=title[:200], filename=os.path.basename(filename)[:255], size=size, chunk_size=chunk_size(),
+    )
+    os.makedirs(partial_dir(), exist_ok=True)
+    open(partial_path(session), 'wb').close()
+    return session
+
+
+def write_chunk(session, offset: int, stream, length: int, checksum: str) -> int:
+    """
+    Appends one chunk, read from `stream` in small blocks, at `offset`.
+
+    `offset` must be the session's current offset (anything else answers
+    409 with the offset to resume from), the chunk must be `chunk_size`
+    bytes (less for the last one) and its SHA-256 must equal `checksum`.
+    A bad chunk is cut off again and the offset stays where it was. Returns
+    the new offset.
+    """
+    from .models import UploadSession
+
+    if session.status != 'OPEN':
+        raise UploadError("Upload is already complete.", status=409, offset=session.received_bytes)
+    if not checksum:
+        raise UploadError("X-Chunk-SHA256 header is required.")
+
+    with _session_lock(session.id):
+        session.refresh_from_db(fields=['received_bytes'])
+        if offset != session.received_bytes:
+            raise UploadError("Chunk is not at the current offset.", status=409, offset=session.received_bytes)
+        expected = min(session.chunk_size, session.size - offset)
+        if length != expected:
+            raise UploadError(f"Chunk at offset {offset} must be {expected} bytes.", status=400)
+
+        file_hash = _running_hash(session)
+        chunk_hash = hashlib.sha256()
+        received = 0
+        with open(partial_path(session), 'r+b') as handle:
+            handle.seek(offset)
+            while received < length:
+                block = stream.read(min(READ_BLOCK, length - received))
+                if not block:
+                    break
+                handle.write(block)
+                chunk_hash.update(block)
+                file_hash.update(block)
+                received += len(block)
+
+            if received != length or chunk_hash.hexdigest() != checksum.lower():
+                handle.truncate(offset)
+                raise UploadError("Chunk was incomplete or its checksum did not match; resend it.",
+                                  status=422, offset=offset)
+
+        advanced = UploadSession.objects.filter(pk=session.pk, received_bytes=offset).update(
+            received_bytes=offset + length)
+        if not advanced:
+            # Another worker stored this chunk first
+            session.refresh_from_db(fields=['received_bytes'])
+            raise UploadError("Chunk is not at the current offset.", status=409, offset=session.received_bytes)
+        session.received_bytes = offset + length
+        _remember_hash(session, session.received_bytes, file_hash)
+        return session.received_bytes
+
+
+class _PartialFile(File):
+    # Lets the storage move the finished file into place instead of copying
+    # it, and name it by the hash computed chunk by chunk instead of reading
+    # it all again
+    def __init__(self, file, sha256):
+        super().__init__(file)
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def complete_session(session, checksum: str = None):
+    """
+    Turns a fully received upload into a PDF Resource and queues its text
+    extraction and previews. Returns (resource, sha256 of the file).
+    """
+    from .celery import enqueue_resource_extraction, enqueue_resource_previews
+    from .models import Resource, ResourcePreview, ResourceText, UploadSession
+
+    if session.status != 'OPEN':
+        raise UploadError("Upload is already complete.", status=409, resource_id=session.resource_id)
+    if session.received_bytes != session.size:
+        raise UploadError("Upload is not finished.", status=409, offset=session.received_bytes)
+
+    with _session_lock(session.id), transaction.atomic():
+        # Claimed in the database, so a retried or concurrent complete (in
+        # this worker or another) gets a 409 instead of a moved partial file.
+        # Any failure below rolls the claim back.
+        if not UploadSession.objects.filter(pk=session.pk, status='OPEN').update(status='COMPLETE'):
+            session.refresh_from_db(fields=['status', 'resource'])
+            raise UploadError("Upload is already complete.", status=409, resource_id=session.resource_id)
+
+        digest = _running_hash(session).hexdigest()
+        if checksum and checksum.lower() != digest:
+            raise UploadError("File checksum did not match.", status=422, sha256=digest)
+
+        resource = Resource(
+            title=session.title,
+            description=f"Uploaded via Study Tools on {session.filename}",
+            resource_type='PDF',
+        )
+        with open(partial_path(session), 'rb') as handle:
+            resource.file.save(session.filename, _PartialFile(handle, digest), save=False)
+        resource.save()
+        if os.path.exists(partial_path(session)):  # storage copied it instead of moving it
+            os.remove(partial_path(session))
+
+        ResourceText.objects.create(resource=resource, content_hash=digest)
+        enqueue_resource_extraction(resource)
+        ResourcePreview.objects.create(resource=resource)
+        enqueue_resource_previews(resource)
+
+        session.status, session.resource = 'COMPLETE', resource
+        session.save(update_fields=['status', 'resource', 'updated_at'])
+    _forget(session)
+    return resource, digest
+
+
+def discard_session(session):
+    """Cancels an upload and deletes its partial file."""
+    _forget(session)
+    try:
+        os.remove(partial_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def purge_expired_sessions(max_age_hours: float = None) -> int:
+    """Discards open uploads untouched for `max_age_hours`; returns how many."""
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from .models import UploadSession
+
+    max_age_hours = max_age_hours or getattr(settings, 'CHUNKED_UPLOAD_EXPIRY_HOURS', 24)
+    cutoff = timezone.now() - timedelta(hours=max_age_hours)
+    expired = list(UploadSession.objects.filter(status='OPEN', updated_at__lt=cutoff))
+    for session in expired:
+        discard_session(session)
+    return len(expired)
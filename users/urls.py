@@ -14,10 +14,16 @@ urlpatterns = [
     path('logout/', views.logout, name='logout'),
     path('user_profile/', views.profile, name='user_profile'),
     path('library/', views.resource_library, name='resource_library'),
+    path('library/search/', views.resource_search, name='resource_search'),
 
     # 2. URL for PDF/Document Upload (The one giving you the 404)
     path('upload-document', views.upload_document, name='upload_document'),
 
+    # Chunked, resumable uploads of large documents
+    path('uploads/', views.start_upload, name='start_upload'),
+    path('uploads/<uuid:upload_id>/', views.upload_chunk, name='upload_chunk'),
+    path('uploads/<uuid:upload_id>/complete/', views.complete_upload, name='complete_upload'),
+
     # 3. URL for Flashcard Submission
     path('save-flashcard', views.save_flashcard, name='save_flashcard'),
 
@@ -12,7 +12,10 @@ from .models import Task, MoodEntry
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.http import HttpResponse
-from .models import Resource
+from .models import Resource, ResourcePreview, ResourceText, UploadSession
+from .celery import enqueue_resource_extraction, enqueue_resource_previews
+from .search import search_resources
+from . import uploads
 
 
 # --- General Views ---
@@ -355,7 +358,7 @@ def resource_library(request):
     resources = Resource.objects.all().order_by('-created_at')
 
     # Filter them for display in the tabs
-    pdfs = resources.filter(resource_type='PDF')
+    pdfs = resources.filter(resource_type='PDF').select_related('preview')
     flashcards = resources.filter(resource_type='FLASHCARD')
     videos = resources.filter(resource_type='VIDEO')
 
@@ -367,6 +370,19 @@ def resource_library(request):
     return render(request, 'resource_library.html', context)
 
 
+# --- 1b. Full-text Search over the Library (JSON) ---
+@require_http_methods(["GET"])
+def resource_search(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 50)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number.'}, status=400)
+
+    page = search_resources(query, limit=limit, cursor_token=request.GET.get('cursor'))
+    return JsonResponse({'query': query, **page})
+
+
 # --- 2. View to Handle Document/PDF Upload ---
 def upload_document(request):
     if request.method == 'POST':
@@ -375,19 +391,112 @@ def upload_document(request):
 
         if uploaded_file and title:
             # SAVE the file and its details to the database model
-            Resource.objects.create(
+            resource = Resource.objects.create(
                 title=title,
                 description=f"Uploaded via Study Tools on {uploaded_file.name}",
                 resource_type='PDF',
                 file=uploaded_file  # Django handles saving the file to MEDIA_ROOT
             )
 
+            # Parse the PDF once, in the background; AI and search read the stored text
+            ResourceText.objects.create(resource=resource)
+            enqueue_resource_extraction(resource)
+            # Thumbnails too, so the library page shows images instead of loading the PDF
+            ResourcePreview.objects.create(resource=resource)
+            enqueue_resource_previews(resource)
+
             # Optional: Add a success message here
 
         return redirect('resource_library')
     return HttpResponse(status=405)  # Method Not Allowed
 
 
+# --- 2b. Chunked, Resumable Uploads (JSON) ---
+def _upload_session(request, upload_id):
+    """The caller's upload session, or None."""
+    user_id = request.user.id if request.user.is_authenticated else None
+    return UploadSession.objects.filter(id=upload_id, user_id=user_id).first()
+
+
+def _session_state(session):
+    return {
+        'upload_id': str(session.id),
+        'status': session.status,
+        'size': session.size,
+        'chunk_size': session.chunk_size,
+        'offset': session.received_bytes,
+        'resource_id': session.resource_id,
+    }
+
+
+def _upload_error(error):
+    return JsonResponse({'error': str(error), **error.extra}, status=error.status)
+
+
+@require_http_methods(["POST"])
+def start_upload(request):
+    """Opens an upload session: {"title", "filename", "size"} -> upload id and chunk size."""
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+
+    try:
+        session = uploads.open_session(request.user, data.get('title'), data.get('filename'), data.get('size'))
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    return JsonResponse(_session_state(session), status=201)
+
+
+@require_http_methods(["GET", "PUT", "DELETE"])
+def upload_chunk(request, upload_id):
+    """
+    GET: where to resume. PUT ?offset=N: the chunk at N as the raw request
+    body, with its SHA-256 in X-Chunk-SHA256. DELETE: cancel the upload.
+    """
+    session = _upload_session(request, upload_id)
+    if session is None:
+        return JsonResponse({'error': 'Upload not found'}, status=404)
+
+    if request.method == 'GET':
+        return JsonResponse(_session_state(session))
+    if request.method == 'DELETE':
+        uploads.discard_session(session)
+        return JsonResponse({'success': True})
+
+    try:
+        offset = int(request.GET.get('offset', ''))
+        length = int(request.headers.get('Content-Length') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'offset must be a number'}, status=400)
+    try:
+        # The body is read in small blocks from the stream, never loaded whole
+        uploads.write_chunk(session, offset, request, length, request.headers.get('X-Chunk-SHA256'))
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    return JsonResponse(_session_state(session))
+
+
+@require_http_methods(["POST"])
+def complete_upload(request, upload_id):
+    """Creates the Resource once every chunk is in; an optional {"sha256"} is checked first."""
+    session = _upload_session(request, upload_id)
+    if session is None:
+        return JsonResponse({'error': 'Upload not found'}, status=404)
+    data = {}
+    if request.content_type == 'application/json' and request.body:
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+
+    try:
+        resource, digest = uploads.complete_session(session, data.get('sha256'))
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    return JsonResponse({'resource_id': resource.id, 'sha256': digest, 'url': resource.file.url}, status=201)
+
+
 # --- 3. View to Handle Flashcard Saving (Example) ---
 def save_flashcard(request):
     if request.method == 'POST':